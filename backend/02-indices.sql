@@ -9,6 +9,7 @@ CREATE INDEX IF NOT EXISTS idx_payments_sale_id ON payments(sale_id);
 CREATE INDEX IF NOT EXISTS idx_payments_payment_type_id ON payments(payment_type_id);
 CREATE INDEX IF NOT EXISTS idx_delivery_sales_sale_id ON delivery_sales(sale_id);
 CREATE INDEX IF NOT EXISTS idx_sales_created_at ON sales(created_at);
+CREATE INDEX IF NOT EXISTS idx_sales_sale_status_desc ON sales(sale_status_desc);
 CREATE INDEX IF NOT EXISTS idx_stores_name ON stores(name);
 CREATE INDEX IF NOT EXISTS idx_channels_name ON channels(name);
 CREATE INDEX IF NOT EXISTS idx_products_name ON products(name);
\ No newline at end of file
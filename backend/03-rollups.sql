@@ -0,0 +1,49 @@
+\c challenge_db;
+
+-- Agregados por loja, canal, status e hora. Mantidos por refresh_rollups.py.
+CREATE TABLE IF NOT EXISTS sales_daily_rollup (
+    store_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    sale_status_desc VARCHAR(100) NOT NULL,
+    hour_start TIMESTAMP NOT NULL,
+    sale_date DATE NOT NULL,
+    hour_of_day SMALLINT NOT NULL,
+    day_of_week SMALLINT NOT NULL,
+    sale_count BIGINT NOT NULL,
+    total_amount_sum DECIMAL,
+    total_amount_count BIGINT NOT NULL,
+    total_discount_sum DECIMAL,
+    total_discount_count BIGINT NOT NULL,
+    delivery_fee_sum DECIMAL,
+    delivery_fee_count BIGINT NOT NULL,
+    PRIMARY KEY (store_id, channel_id, sale_status_desc, hour_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_sales_daily_rollup_hour_start ON sales_daily_rollup(hour_start);
+
+-- Marca d'água (último sales.id agregado) de cada rollup e a marca pendente:
+-- o maior id visto no último refresh e o xmax do snapshot daquele momento,
+-- agregada quando todas as transações em curso naquele momento terminarem.
+-- As colunas *_change_* fazem o mesmo com o log sales_changes
+-- (06-sales-changes.sql), cujas horas alteradas são agregadas de novo.
+CREATE TABLE IF NOT EXISTS rollup_refresh_state (
+    rollup_name VARCHAR(100) PRIMARY KEY,
+    last_sale_id BIGINT NOT NULL DEFAULT 0,
+    pending_sale_id BIGINT,
+    pending_xmax BIGINT,
+    last_change_id BIGINT NOT NULL DEFAULT 0,
+    pending_change_id BIGINT,
+    pending_change_xmax BIGINT,
+    refreshed_at TIMESTAMP
+);
+
+ALTER TABLE rollup_refresh_state ADD COLUMN IF NOT EXISTS pending_sale_id BIGINT;
+ALTER TABLE rollup_refresh_state ADD COLUMN IF NOT EXISTS pending_xmax BIGINT;
+ALTER TABLE rollup_refresh_state ADD COLUMN IF NOT EXISTS last_change_id BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE rollup_refresh_state ADD COLUMN IF NOT EXISTS pending_change_id BIGINT;
+ALTER TABLE rollup_refresh_state ADD COLUMN IF NOT EXISTS pending_change_xmax BIGINT;
+
+-- A linha já existe no primeiro refresh, então o SELECT ... FOR UPDATE
+-- serializa refreshes simultâneos (cron e change tracker).
+INSERT INTO rollup_refresh_state (rollup_name) VALUES ('sales_daily_rollup')
+ON CONFLICT (rollup_name) DO NOTHING;
@@ -0,0 +1,20 @@
+\c challenge_db;
+
+-- Dimensões de tempo derivadas de created_at, gravadas como colunas geradas
+-- para que filtros e agrupamentos por data, hora e dia da semana usem índice
+-- em vez de calcular a expressão linha a linha. Lidas pelo QueryBuilder
+-- quando SALES_TIME_COLUMNS=true. Adicionar as colunas reescreve a tabela.
+ALTER TABLE sales
+    ADD COLUMN IF NOT EXISTS sale_date DATE
+        GENERATED ALWAYS AS (created_at::date) STORED,
+    ADD COLUMN IF NOT EXISTS hour_of_day SMALLINT
+        GENERATED ALWAYS AS (EXTRACT(HOUR FROM created_at)::smallint) STORED,
+    ADD COLUMN IF NOT EXISTS day_of_week SMALLINT
+        GENERATED ALWAYS AS (EXTRACT(ISODOW FROM created_at)::smallint) STORED;
+
+-- sale_date guarda o valor total para permitir index-only scan nas séries diárias.
+CREATE INDEX IF NOT EXISTS idx_sales_sale_date ON sales(sale_date) INCLUDE (total_amount);
+CREATE INDEX IF NOT EXISTS idx_sales_hour_of_day ON sales(hour_of_day);
+CREATE INDEX IF NOT EXISTS idx_sales_day_of_week ON sales(day_of_week);
+
+ANALYZE sales;
@@ -0,0 +1,22 @@
+\c challenge_db;
+
+-- Índices da busca incremental (/api/options/{dimensão}/search), usados
+-- quando SEARCH_BACKEND=database e sempre para clientes. A busca lê primeiro
+-- os nomes que começam com o termo: `lower(nome) LIKE 'termo%'` é uma
+-- varredura de faixa no btree `text_pattern_ops`, já na ordem da resposta,
+-- e para no LIMIT. Só se a página não completar, e para termos de 3 ou mais
+-- caracteres, `ILIKE '%termo%'` busca os que contêm o termo pelos índices de
+-- trigrama (pg_trgm) em vez de ler a tabela toda.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_products_name_prefix ON products (lower(name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_stores_name_prefix ON stores (lower(name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_name_prefix ON customers (lower(customer_name) text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_stores_name_trgm ON stores USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_name_trgm ON customers USING gin (customer_name gin_trgm_ops);
+
+ANALYZE products;
+ANALYZE stores;
+ANALYZE customers;
@@ -0,0 +1,34 @@
+\c challenge_db;
+
+-- Log das vendas alteradas ou removidas depois de inseridas. Vendas novas
+-- são acompanhadas pelo próprio sales.id; este log cobre o que o id não
+-- mostra (ex. mudança de status ou de valor). Cada linha guarda a loja e o
+-- created_at da venda antes da mudança e, se mudaram, uma segunda linha
+-- guarda os novos. É lido pelo refresh do rollup, pelo change tracker e
+-- pela cópia colunar, cada um com a própria marca d'água; linhas abaixo da
+-- menor marca entre eles podem ser apagadas.
+CREATE TABLE IF NOT EXISTS sales_changes (
+    id BIGSERIAL PRIMARY KEY,
+    sale_id BIGINT NOT NULL,
+    store_id INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    changed_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION log_sales_change() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO sales_changes (sale_id, store_id, created_at)
+    VALUES (OLD.id, OLD.store_id, OLD.created_at);
+    IF TG_OP = 'UPDATE'
+        AND (NEW.store_id, NEW.created_at) IS DISTINCT FROM (OLD.store_id, OLD.created_at) THEN
+        INSERT INTO sales_changes (sale_id, store_id, created_at)
+        VALUES (NEW.id, NEW.store_id, NEW.created_at);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sales_log_changes ON sales;
+CREATE TRIGGER sales_log_changes
+    AFTER UPDATE OR DELETE ON sales
+    FOR EACH ROW EXECUTE FUNCTION log_sales_change();
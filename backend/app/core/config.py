@@ -5,5 +5,50 @@ load_dotenv()
 
 class Settings:
     DATABASE_URL: str = os.getenv("DATABASE_URL")
+    DB_MODE: str = os.getenv("DB_MODE", "sync")
+    ASYNC_DATABASE_URL: str = os.getenv(
+        "ASYNC_DATABASE_URL",
+        (DATABASE_URL or "").replace("postgresql://", "postgresql+asyncpg://", 1),
+    )
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DISCONNECT_POLL_SECONDS: float = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "500"))
+    QUERY_SHAPE_CACHE_SIZE: int = int(os.getenv("QUERY_SHAPE_CACHE_SIZE", "500"))
+    STREAM_BATCH_SIZE: int = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+    BATCH_MAX_QUERIES: int = int(os.getenv("BATCH_MAX_QUERIES", "50"))
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
 
-settings = Settings()
\ No newline at end of file
+    ROLLUPS_ENABLED: bool = os.getenv("ROLLUPS_ENABLED", "false").lower() == "true"
+    SALES_TIME_COLUMNS: bool = os.getenv("SALES_TIME_COLUMNS", "false").lower() == "true"
+
+    APPROX_SAMPLE_PERCENT: float = float(os.getenv("APPROX_SAMPLE_PERCENT", "5"))
+    APPROX_SAMPLE_METHOD: str = os.getenv("APPROX_SAMPLE_METHOD", "system")
+    APPROX_MIN_RANGE_DAYS: float = float(os.getenv("APPROX_MIN_RANGE_DAYS", "30"))
+    APPROX_SAMPLE_SEED: int = int(os.getenv("APPROX_SAMPLE_SEED", "0"))
+
+    QUERY_BACKEND: str = os.getenv("QUERY_BACKEND", "postgres")
+    COLUMNAR_DATA_DIR: str = os.getenv("COLUMNAR_DATA_DIR", "columnar")
+
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory")
+    CACHE_MAX_BYTES: int = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    CACHE_TTL_SECONDS: int = int(os.getenv("CACHE_TTL_SECONDS", "30"))
+    CACHE_HISTORICAL_TTL_SECONDS: int = int(os.getenv("CACHE_HISTORICAL_TTL_SECONDS", str(24 * 60 * 60)))
+
+    CHANGE_TRACKING_ENABLED: bool = os.getenv("CHANGE_TRACKING_ENABLED", "true").lower() == "true"
+    CHANGE_POLL_SECONDS: float = float(os.getenv("CHANGE_POLL_SECONDS", "5"))
+    CACHE_TRACKED_TTL_SECONDS: int = int(os.getenv("CACHE_TRACKED_TTL_SECONDS", "300"))
+
+    SLOW_QUERY_THRESHOLD_MS: float = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "500"))
+    SLOW_QUERY_LOG_SIZE: int = int(os.getenv("SLOW_QUERY_LOG_SIZE", "200"))
+    SLOW_QUERY_CAPTURE_PLAN: bool = os.getenv("SLOW_QUERY_CAPTURE_PLAN", "true").lower() == "true"
+
+    OPTIONS_REFRESH_SECONDS: float = float(os.getenv("OPTIONS_REFRESH_SECONDS", "60"))
+    SEARCH_BACKEND: str = os.getenv("SEARCH_BACKEND", "memory")
+
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+    INDEX_ADVISOR_ENABLED: bool = os.getenv("INDEX_ADVISOR_ENABLED", "true").lower() == "true"
+
+settings = Settings()
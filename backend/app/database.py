@@ -1,13 +1,167 @@
-from sqlalchemy import create_engine
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine, event
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
 from app.core.config import settings
+from app.services.metrics import record_stage, record_checkout
 
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW
 )
 
+if settings.DB_MODE not in ("sync", "async"):
+    raise ValueError(f"Unknown DB_MODE: {settings.DB_MODE}")
+
+async_engine = None
+if settings.DB_MODE == "async":
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    # O asyncpg prepara cada consulta no servidor e guarda os prepared
+    # statements por texto do SQL; como o QueryBuilder gera o mesmo SQL para
+    # o mesmo formato, o parse é feito uma vez por formato e o Postgres pode
+    # passar a usar um plano genérico em vez de planejar a cada execução.
+    async_engine = create_async_engine(
+        settings.ASYNC_DATABASE_URL,
+        pool_pre_ping=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        connect_args={"prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE},
+    )
+
+
+class ClientDisconnected(Exception):
+    """O cliente fechou a conexão antes do fim da consulta."""
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["cursor_started"] = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["cursor_seconds"] = time.perf_counter() - conn.info.pop("cursor_started")
+
+# Tempo gasto no driver (envio da consulta, execução e recebimento das
+# linhas), para separar a execução no banco da compilação do SQL.
+if settings.METRICS_ENABLED:
+    for _sync_engine in (engine, async_engine.sync_engine if async_engine else None):
+        if _sync_engine is not None:
+            event.listen(_sync_engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(_sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _record_execution(info, started, executed, fetched):
+    """Divide o tempo de uma consulta em compilação, banco e leitura das linhas."""
+    database = info.pop("cursor_seconds", 0.0)
+    record_stage("compile", max(executed - started - database, 0.0))
+    record_stage("database", database)
+    record_stage("fetch", fetched - executed)
+
+def pool_stats():
+    """Estado do pool de conexões (o do engine assíncrono, com DB_MODE=async)."""
+    pool = async_engine.pool if async_engine is not None else engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "checked_in": pool.checkedin(),
+    }
+
+
 def get_db_connection():
     """Função para obter uma conexão do pool."""
-    return engine.connect()
\ No newline at end of file
+    started = time.perf_counter()
+    connection = engine.connect()
+    record_checkout(time.perf_counter() - started)
+    return connection
+
+@asynccontextmanager
+async def _async_connection():
+    """Como `get_db_connection`, no engine assíncrono."""
+    connection = async_engine.connect()
+    started = time.perf_counter()
+    await connection.start()
+    record_checkout(time.perf_counter() - started)
+    try:
+        yield connection
+    finally:
+        await connection.close()
+
+def _fetch_rows_sync(statement):
+    with get_db_connection() as connection:
+        started = time.perf_counter()
+        result = connection.execute(statement)
+        executed = time.perf_counter()
+        rows = result.fetchall()
+        _record_execution(connection.info, started, executed, time.perf_counter())
+        return list(result.keys()), rows
+
+async def fetch_rows(statement):
+    """
+    Executa a consulta no modo configurado (DB_MODE) e retorna
+    uma tupla (nomes das colunas, linhas).
+    """
+    if async_engine is None:
+        return await run_in_threadpool(_fetch_rows_sync, statement)
+
+    async with _async_connection() as connection:
+        started = time.perf_counter()
+        result = await connection.execute(statement)
+        executed = time.perf_counter()
+        rows = result.fetchall()
+        _record_execution(connection.info, started, executed, time.perf_counter())
+        return list(result.keys()), rows
+
+async def fetch_rows_cancellable(request, statement):
+    """
+    Como `fetch_rows`, mas no modo async cancela a consulta no servidor
+    se o cliente desconectar antes do resultado ficar pronto.
+    """
+    if async_engine is None:
+        return await fetch_rows(statement)
+
+    task = asyncio.ensure_future(fetch_rows(statement))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+def _stream_rows_sync(statement, batch_size):
+    with get_db_connection() as connection:
+        result = connection.execution_options(
+            stream_results=True, max_row_buffer=batch_size
+        ).execute(statement)
+        column_names = list(result.keys())
+        for rows in result.partitions(batch_size):
+            yield column_names, rows
+
+async def stream_rows(statement, batch_size):
+    """
+    Executa a consulta com cursor no servidor e produz lotes
+    (nomes das colunas, linhas) de até `batch_size` linhas, sem
+    carregar o resultado inteiro em memória.
+    """
+    if async_engine is None:
+        batches = _stream_rows_sync(statement, batch_size)
+        try:
+            async for batch in iterate_in_threadpool(batches):
+                yield batch
+        finally:
+            await run_in_threadpool(batches.close)
+        return
+
+    async with _async_connection() as connection:
+        result = await connection.stream(statement)
+        column_names = list(result.keys())
+        async for rows in result.partitions(batch_size):
+            yield column_names, rows
@@ -1,15 +1,85 @@
-from fastapi import FastAPI, HTTPException, Depends
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from app.schemas import AnalyticsQuery
-from app.services.query_builder import QueryBuilder
-from app.database import get_db_connection, engine
+from fastapi.responses import StreamingResponse, Response, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from app.schemas import AnalyticsQuery, BatchQuery, QueryBackend
+from app.services.query_builder import QueryBuilder, InvalidQuery, statement_cache
+from app.services.cache import query_cache, build_cache_key, ttl_for
+from app.services.pagination import encode_cursor, InvalidCursor
+from app.services.serializers import ndjson_lines, rows_to_arrow, accepts_arrow, ARROW_MEDIA_TYPE
+from app.services.explain import Explain, compiled_sql, parse_plan, summarize_plan
+from app.services.slow_queries import slow_query_log, capture_slow_query, is_slow
+from app.services.index_advisor import workload_stats, recommend, evaluate_all
+from app.services.columnar import columnar_backend, diff_results, ColumnarUnavailable
+from app.services.change_tracker import change_tracker, cache_scope
+from app.services.batch import SharedQuery, plan_batch
+from app.services.options_catalog import options_catalog, OBJECT_LISTS
+from app.services.search import (
+    SEARCHABLE,
+    MAX_SEARCH_LIMIT,
+    MIN_CONTAINS_LENGTH,
+    prefix_query,
+    prefix_count_query,
+    contains_query,
+    search_params,
+)
+from app.services.metrics import (
+    query_metrics,
+    stage,
+    query_shape,
+    handler_started,
+    handler_returned,
+    TimingMiddleware,
+    PROMETHEUS_MEDIA_TYPE,
+)
+from app.database import engine, fetch_rows, fetch_rows_cancellable, stream_rows, pool_stats, ClientDisconnected
+from app.core.config import settings
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+async def _track_changes():
+    """Varre as vendas novas a cada CHANGE_POLL_SECONDS enquanto a API estiver no ar."""
+    while True:
+        try:
+            await run_in_threadpool(change_tracker.process)
+        except Exception:
+            # A varredura segue no próximo ciclo; o traceback vai para o log.
+            logger.exception("Change tracking failed")
+        await asyncio.sleep(settings.CHANGE_POLL_SECONDS)
+
+
+async def _refresh_options():
+    """Carrega o catálogo de opções e o atualiza a cada OPTIONS_REFRESH_SECONDS."""
+    while True:
+        try:
+            await run_in_threadpool(options_catalog.refresh)
+        except Exception:
+            logger.exception("Options catalog refresh failed")
+        await asyncio.sleep(settings.OPTIONS_REFRESH_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [asyncio.create_task(_refresh_options())]
+    if settings.CHANGE_TRACKING_ENABLED:
+        tasks.append(asyncio.create_task(_track_changes()))
+    yield
+    for task in tasks:
+        task.cancel()
+
 
 app = FastAPI(
     title="DataFood Analytics API",
     description="API para analytics customizável para restaurantes.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -18,95 +88,468 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Sem isso o navegador esconde do frontend os headers não padrão.
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(TimingMiddleware)
+
 @app.get("/", tags=["Health Check"])
 def read_root():
     """Endpoint raiz para verificar se a API está no ar."""
     return {"status": "ok", "message": "Welcome to Nola Analytics API!"}
 
 
+def _next_cursor(query_request, builder, column_names, rows):
+    """Monta o cursor da próxima página a partir da última linha retornada."""
+    if not builder.sort_keys or len(rows) < query_request.page_size:
+        return None
+    last_row = dict(zip(column_names, rows[-1]))
+    return encode_cursor(query_request, [last_row[key] for key in builder.sort_keys])
+
+def _arrow_response(payload, next_cursor):
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return Response(content=payload, media_type=ARROW_MEDIA_TYPE, headers=headers)
+
+async def _explain_response(sql_query):
+    """Executa a consulta com EXPLAIN (ANALYZE, BUFFERS) e devolve SQL e plano."""
+    _, rows = await fetch_rows(Explain(sql_query, analyze=True))
+    plan = parse_plan(rows[0][0])
+    return {
+        "sql": compiled_sql(sql_query, engine.dialect),
+        "summary": summarize_plan(plan),
+        "plan": plan,
+    }
+
+async def _compare_response(query_request):
+    """
+    Executa a consulta no Postgres e na cópia colunar (DuckDB) e
+    devolve as diferenças entre os resultados e o tempo de cada um.
+    """
+    started = time.perf_counter()
+    expected = await fetch_rows(QueryBuilder(query_request).build())
+    postgres_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    actual = await run_in_threadpool(
+        columnar_backend.execute, QueryBuilder(query_request, QueryBackend.DUCKDB.value).build()
+    )
+    duckdb_ms = (time.perf_counter() - started) * 1000
+
+    key_columns = [dim_enum.value for dim_enum in query_request.dimensions]
+    return {
+        **diff_results(key_columns, expected, actual),
+        "duration_ms": {"postgres": round(postgres_ms, 3), "duckdb": round(duckdb_ms, 3)},
+        "columnar": columnar_backend.status(),
+    }
+
+
+def _cache_key(query_request, backend, use_arrow):
+    cache_key = build_cache_key(query_request)
+    if backend != QueryBackend.POSTGRES.value:
+        cache_key = f"{backend}:{cache_key}"
+    if use_arrow:
+        cache_key = f"arrow:{cache_key}"
+    return cache_key
+
+def _cache_result(query_request, backend, use_arrow, response):
+    if settings.CACHE_ENABLED:
+        # A cópia colunar anda no ritmo da sincronização, não da captura de mudanças.
+        tracked = backend == QueryBackend.POSTGRES.value and change_tracker.is_current()
+        query_cache.set(
+            _cache_key(query_request, backend, use_arrow),
+            response, ttl_for(query_request, tracked), cache_scope(query_request),
+        )
+
+async def _fetch(request, query_request, sql_query, backend, background_tasks):
+    """
+    Executa a consulta no backend escolhido. No Postgres, mede o tempo e
+    agenda o registro da consulta se ela passar do limite de lentidão.
+    """
+    if backend != QueryBackend.POSTGRES.value:
+        with stage("database"):
+            return await run_in_threadpool(columnar_backend.execute, sql_query)
+
+    started = time.perf_counter()
+    column_names, rows = await fetch_rows_cancellable(request, sql_query)
+    duration_ms = (time.perf_counter() - started) * 1000
+    if is_slow(duration_ms):
+        background_tasks.add_task(capture_slow_query, query_request, sql_query, duration_ms, len(rows))
+    return column_names, rows
+
+async def _execute_query(query_request, request, background_tasks, backend, use_arrow):
+    """
+    Responde uma requisição pelo cache ou pelo banco. Devolve o dict JSON
+    ou, em Arrow, a tupla (payload, próximo cursor).
+    """
+    if settings.CACHE_ENABLED:
+        with stage("cache"):
+            cached = query_cache.get(_cache_key(query_request, backend, use_arrow))
+        if cached is not None:
+            return cached
+
+    if backend == QueryBackend.POSTGRES.value and settings.INDEX_ADVISOR_ENABLED:
+        workload_stats.record(query_request)
+
+    with stage("build"):
+        builder = QueryBuilder(query_request, backend)
+        sql_query = builder.build()
+
+    column_names, rows = await _fetch(request, query_request, sql_query, backend, background_tasks)
+
+    with stage("materialize"):
+        next_cursor = None
+        if query_request.page_size:
+            next_cursor = _next_cursor(query_request, builder, column_names, rows)
+
+        if use_arrow:
+            metadata = {"approximation": builder.approximation} if builder.approximation else None
+            response = (rows_to_arrow(column_names, rows, metadata), next_cursor)
+        else:
+            results = [dict(zip(column_names, row)) for row in rows]
+            response = {"data": results}
+            if query_request.page_size:
+                response["next_cursor"] = next_cursor
+            if builder.approximation:
+                response["approximation"] = builder.approximation
+
+    _cache_result(query_request, backend, use_arrow, response)
+    return response
+
+def _query_error(e):
+    """Converte uma falha de consulta no HTTPException devolvido ao cliente."""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, (InvalidCursor, InvalidQuery)):
+        return HTTPException(status_code=400, detail=str(e))
+    if isinstance(e, ClientDisconnected):
+        return HTTPException(status_code=499, detail="Client disconnected")
+    if isinstance(e, ColumnarUnavailable):
+        return HTTPException(status_code=503, detail=str(e))
+    if isinstance(e, SQLAlchemyError):
+        return HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+
 @app.post("/api/query", tags=["Analytics"])
-def run_analytics_query(query_request: AnalyticsQuery):
+async def run_analytics_query(
+    query_request: AnalyticsQuery,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    explain: bool = False,
+    backend: Optional[QueryBackend] = None,
+    compare: bool = False,
+):
     """
     Recebe uma requisição de análise, constrói e executa a query SQL
     e retorna os resultados agregados.
+    Com `Accept: application/vnd.apache.arrow.stream` o resultado é
+    enviado em Arrow IPC; caso contrário, em JSON.
+    Com `?explain=true` retorna o SQL gerado e o plano de execução
+    (`EXPLAIN (ANALYZE, BUFFERS)`) em vez dos dados.
+    `?backend=postgres|duckdb` escolhe onde a consulta roda (padrão:
+    QUERY_BACKEND) e `?compare=true` roda nos dois e compara os resultados.
+    Com `approximate: true`, somas, médias e contagens saem de uma amostra
+    (TABLESAMPLE) escalada para o total, cada métrica ganha a coluna
+    `<alias>_error` (margem de 95%) e a resposta traz `approximation` (no
+    Arrow, na chave `approximation` dos metadados do schema, em JSON).
+    O header `Server-Timing` traz o tempo de cada etapa.
     """
+    handler_started(query_shape(query_request))
+    use_arrow = accepts_arrow(request.headers.get("accept"))
+    backend = backend.value if backend else settings.QUERY_BACKEND
     try:
-        builder = QueryBuilder(query_request)
-        
-        sql_query = builder.build()
+        if explain:
+            return await _explain_response(QueryBuilder(query_request).build())
+        if compare:
+            return await _compare_response(query_request)
 
-        with get_db_connection() as connection:
-            result_proxy = connection.execute(sql_query)
-            
-            column_names = result_proxy.keys()
-            
-            results = [dict(zip(column_names, row)) for row in result_proxy.fetchall()]
+        response = await _execute_query(query_request, request, background_tasks, backend, use_arrow)
+        handler_returned()
+        return _arrow_response(*response) if use_arrow else response
+    except Exception as e:
+        raise _query_error(e)
+
+@app.post("/api/query/batch", tags=["Analytics"])
+async def run_batch_query(
+    batch: BatchQuery,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    backend: Optional[QueryBackend] = None,
+):
+    """
+    Executa várias requisições de /api/query em uma chamada, com no máximo
+    BATCH_MAX_CONCURRENCY consultas simultâneas no banco. Requisições com o
+    mesmo período e filtros são respondidas por uma única consulta com
+    GROUPING SETS. Cada item de `results` traz `data` ou o `error` daquela
+    requisição, na mesma ordem de `queries`.
+    """
+    handler_started("batch")
+    if len(batch.queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400, detail=f"A batch accepts at most {settings.BATCH_MAX_QUERIES} queries"
+        )
+
+    backend = backend.value if backend else settings.QUERY_BACKEND
+    semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+    results = [None] * len(batch.queries)
+
+    def failed(e):
+        error = _query_error(e)
+        return {"error": {"status_code": error.status_code, "detail": error.detail}}
+
+    async def run_single(position):
+        try:
+            async with semaphore:
+                results[position] = await _execute_query(
+                    batch.queries[position], request, background_tasks, backend, False
+                )
+        except Exception as e:
+            results[position] = failed(e)
 
-        return {"data": results}
+    async def run_shared(positions):
+        shared = SharedQuery([batch.queries[position] for position in positions])
+        if backend == QueryBackend.POSTGRES.value and settings.INDEX_ADVISOR_ENABLED:
+            for query_request in shared.queries:
+                workload_stats.record(query_request)
+        try:
+            async with semaphore:
+                column_names, rows = await _fetch(
+                    request, shared.request, shared.build(backend), backend, background_tasks
+                )
+        except Exception:
+            # Se a consulta combinada falhar, cada requisição roda sozinha
+            # e recebe o próprio erro.
+            await asyncio.gather(*[run_single(position) for position in positions])
+            return
+        for position, response in zip(positions, shared.split(column_names, rows)):
+            _cache_result(batch.queries[position], backend, False, response)
+            results[position] = response
 
+    pending = []
+    for position, query_request in enumerate(batch.queries):
+        cached = None
+        if settings.CACHE_ENABLED:
+            cached = query_cache.get(_cache_key(query_request, backend, False))
+        if cached is not None:
+            results[position] = cached
+        else:
+            pending.append(position)
+
+    shared, single = plan_batch([batch.queries[position] for position in pending], backend)
+    tasks = [run_shared([pending[i] for i in group]) for group in shared]
+    tasks += [run_single(pending[i]) for i in single]
+    await asyncio.gather(*tasks)
+
+    handler_returned()
+    return {"results": results}
+
+@app.post("/api/query/stream", tags=["Analytics"])
+async def stream_analytics_query(query_request: AnalyticsQuery):
+    """
+    Executa a mesma consulta de /api/query, mas envia o resultado em
+    NDJSON (um objeto por linha) à medida que as linhas chegam do banco.
+    """
+    try:
+        sql_query = QueryBuilder(query_request).build()
+    except (InvalidCursor, InvalidQuery) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    batches = stream_rows(sql_query, settings.STREAM_BATCH_SIZE)
+    return StreamingResponse(ndjson_lines(batches), media_type="application/x-ndjson")
+
+@app.get("/api/cache/stats", tags=["Admin"])
+def get_cache_stats():
+    """
+    Retorna os contadores do cache de resultados de /api/query e do cache
+    de consultas montadas por formato (`statements`).
+    """
+    return {**query_cache.stats(), "statements": statement_cache.stats()}
+
+@app.get("/metrics", tags=["Admin"])
+def get_metrics():
+    """
+    Métricas no formato texto do Prometheus: histogramas por etapa do
+    pipeline de consulta e por formato (conjunto de dimensões), espera
+    no checkout do pool e estado do pool de conexões.
+    """
+    return Response(content=query_metrics.render(pool_stats()), media_type=PROMETHEUS_MEDIA_TYPE)
+
+@app.get("/api/changes", tags=["Admin"])
+def get_change_tracking_stats():
+    """
+    Estado da captura de mudanças: high-water mark, lojas e datas com
+    vendas novas na última varredura e entradas de cache invalidadas.
+    """
+    return change_tracker.stats()
+
+@app.get("/api/columnar/status", tags=["Admin"])
+def get_columnar_status():
+    """Backend padrão e estado da última sincronização da cópia colunar."""
+    return {"default_backend": settings.QUERY_BACKEND, **columnar_backend.status()}
+
+@app.get("/api/slow-queries", tags=["Admin"])
+def get_slow_queries(limit: int = 50, min_duration_ms: float = 0.0):
+    """
+    Lista as consultas de /api/query mais lentas que SLOW_QUERY_THRESHOLD_MS,
+    das mais recentes para as mais antigas, com SQL, duração e plano.
+    """
+    return {
+        **slow_query_log.stats(),
+        "data": slow_query_log.entries(limit, min_duration_ms),
+    }
+
+@app.delete("/api/slow-queries", tags=["Admin"])
+def clear_slow_queries():
+    """Esvazia o log de consultas lentas."""
+    slow_query_log.clear()
+    return {"status": "ok"}
+
+@app.get("/api/index-advisor/usage", tags=["Admin"])
+def get_field_usage():
+    """Quantas vezes cada campo apareceu como filtro, dimensão, métrica ou período."""
+    return workload_stats.usage()
+
+def _evaluate_recommendations(recommendations):
+    with engine.connect() as connection:
+        return evaluate_all(connection, recommendations)
+
+@app.get("/api/index-advisor/recommendations", tags=["Admin"])
+async def get_index_recommendations(evaluate: bool = False, min_queries: int = 1):
+    """
+    Sugere índices compostos, de cobertura (INCLUDE) ou parciais a partir
+    do tráfego registrado. Com `evaluate=true`, estima o ganho de cada um
+    com índices hipotéticos (extensão hypopg), sem criá-los.
+    """
+    recommendations = recommend(workload_stats, min_queries)
+    if evaluate:
+        try:
+            recommendations = await run_in_threadpool(_evaluate_recommendations, recommendations)
+        except SQLAlchemyError as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return {"data": recommendations}
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+async def _options_response(request: Request, name=None):
+    """
+    Responde com uma lista do catálogo em memória (ou todas, com `name=None`)
+    e seu ETag; se o cliente já tem essa versão (If-None-Match), devolve 304.
+    """
+    try:
+        if not options_catalog.loaded:
+            await run_in_threadpool(options_catalog.refresh)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+    data, etag = options_catalog.get(name)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"data": data}, headers=headers)
+
+@app.get("/api/options", tags=["Options"])
+async def get_all_options(request: Request):
+    """
+    Retorna todas as listas de opções em uma resposta, para a carga inicial
+    da página: channels, stores, products, payment_types e sale_status.
+    """
+    return await _options_response(request)
 
 @app.get("/api/options/channels", tags=["Options"])
-def get_channel_options():
+async def get_channel_options(request: Request):
     """
     Retorna uma lista única de todos os nomes de canais.
     Ex: ["iFood", "Rappi", "Presencial"]
     """
-    query = text("SELECT DISTINCT name FROM channels ORDER BY name")
-    try:
-        with engine.connect() as connection:
-            result = connection.execute(query)
-            channels = [row[0] for row in result]
-            return {"data": channels}
-    except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return await _options_response(request, "channels")
 
 @app.get("/api/options/stores", tags=["Options"])
-def get_store_options():
+async def get_store_options(request: Request):
     """
     Retorna uma lista de todos os nomes de lojas ativas.
     Ex: [{"id": 1, "name": "Loja A"}, {"id": 2, "name": "Loja B"}]
     """
-    query = text("SELECT id, name FROM stores WHERE is_active = true ORDER BY name")
-    try:
-        with engine.connect() as connection:
-            result = connection.execute(query)
-            stores = [{"id": row[0], "name": row[1]} for row in result]
-            return {"data": stores}
-    except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return await _options_response(request, "stores")
 
 @app.get("/api/options/sale_status", tags=["Options"])
-def get_sale_status_options():
+async def get_sale_status_options(request: Request):
     """
     Retorna uma lista única de todos os status de venda.
     Ex: ["COMPLETED", "CANCELED"]
     """
-    query = text("SELECT DISTINCT sale_status_desc FROM sales ORDER BY sale_status_desc")
-    try:
-        with engine.connect() as connection:
-            result = connection.execute(query)
-            statuses = [row[0] for row in result]
-            return {"data": statuses}
-    except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return await _options_response(request, "sale_status")
 
 @app.get("/api/options/products", tags=["Options"])
-def get_product_options():
+async def get_product_options(request: Request):
     """
     Retorna uma lista de todos os produtos.
     Ex: [{"id": 1, "name": "Produto A"}, {"id": 2, "name": "Produto B"}]
     """
-    query = text("SELECT id, name FROM products ORDER BY name")
+    return await _options_response(request, "products")
+
+@app.get("/api/options/payment_types", tags=["Options"])
+async def get_payment_type_options(request: Request):
+    """
+    Retorna uma lista única das formas de pagamento.
+    Ex: ["Cartão de Crédito", "PIX"]
+    """
+    return await _options_response(request, "payment_types")
+
+async def _search_database(dimension, q, limit, offset):
+    """
+    Busca primeiro os nomes que começam com `q` (faixa do índice btree) e só
+    completa a página com os que apenas contêm `q` (trigrama) se faltar.
+    """
+    params = search_params(q)
+    _, rows = await fetch_rows(
+        prefix_query(dimension).bindparams(prefix=params["prefix"], limit=limit + 1, offset=offset)
+    )
+    rows = list(rows)
+    if len(rows) <= limit and len(q) >= MIN_CONTAINS_LENGTH:
+        if rows or offset == 0:
+            prefix_total = offset + len(rows)
+        else:
+            _, counted = await fetch_rows(prefix_count_query(dimension).bindparams(prefix=params["prefix"]))
+            prefix_total = counted[0][0]
+        _, more = await fetch_rows(contains_query(dimension).bindparams(
+            **params, limit=limit + 1 - len(rows), offset=max(offset - prefix_total, 0)
+        ))
+        rows += more
+    data = [{"id": row[0], "name": row[1]} for row in rows[:limit]]
+    return data, len(rows) > limit
+
+@app.get("/api/options/{dimension}/search", tags=["Options"])
+async def search_options(dimension: str, q: str = "", limit: int = 20, offset: int = 0):
+    """
+    Busca incremental (typeahead) por nome em listas grandes: products,
+    stores ou customers. Nomes que começam com `q` vêm antes dos que só o
+    contêm (estes só quando `q` tem 3 caracteres ou mais). Lojas e produtos
+    saem do índice em memória do catálogo (ou do banco, com
+    SEARCH_BACKEND=database); clientes sempre do banco, pelos índices de
+    05-search-indexes.sql.
+    Ex: {"data": [{"id": 7, "name": "Pizza Calabresa"}], "has_more": true}
+    """
+    if dimension not in SEARCHABLE:
+        raise HTTPException(status_code=404, detail=f"Search is not available for {dimension}")
+    if limit < 1 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be positive and offset non-negative")
+    limit = min(limit, MAX_SEARCH_LIMIT)
+    q = q.strip()
+
     try:
-        with engine.connect() as connection:
-            result = connection.execute(query)
-            products = [{"id": row[0], "name": row[1]} for row in result]
-            return {"data": products}
+        if dimension in OBJECT_LISTS and settings.SEARCH_BACKEND == "memory":
+            if not options_catalog.loaded:
+                await run_in_threadpool(options_catalog.refresh)
+            data, has_more = options_catalog.search(dimension, q, limit, offset)
+        else:
+            data, has_more = await _search_database(dimension, q, limit, offset)
     except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    return {"data": data, "has_more": has_more}
@@ -26,6 +26,15 @@ class FilterOperator(str, Enum):
     LESS_THAN = "less_than"
     IN = "in"
 
+class QueryBackend(str, Enum):
+    POSTGRES = "postgres"
+    DUCKDB = "duckdb"
+
+class SubtotalMode(str, Enum):
+    ROLLUP = "rollup"
+    CUBE = "cube"
+    GROUPING_SETS = "grouping_sets"
+
 class SortDirection(str, Enum):
     ASC = "asc"
     DESC = "desc"
@@ -44,6 +53,10 @@ class OrderBy(BaseModel):
     field: str
     direction: SortDirection
 
+class Subtotals(BaseModel):
+    mode: SubtotalMode
+    grouping_sets: Optional[List[List[DimensionField]]] = None
+
 class TimeRangeFilter(BaseModel):
     start_date: datetime
     end_date: datetime
@@ -55,3 +68,10 @@ class AnalyticsQuery(BaseModel):
     time_range: Optional[TimeRangeFilter] = None
     order_by: Optional[OrderBy] = None
     limit: Optional[int] = None
+    page_size: Optional[int] = None
+    cursor: Optional[str] = None
+    subtotals: Optional[Subtotals] = None
+    approximate: bool = False
+
+class BatchQuery(BaseModel):
+    queries: List[AnalyticsQuery]
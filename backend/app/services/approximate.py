@@ -0,0 +1,123 @@
+import math
+
+from sqlalchemy import Float, func, literal, literal_column, null
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.expression import ColumnClause, FromClause
+
+from app.core.config import settings
+from app.schemas import MetricFunction
+
+# Quantil da normal para as margens de erro de 95%.
+Z_95 = 1.96
+CONFIDENCE = 0.95
+
+# `system` (o padrão) sorteia páginas inteiras e só lê as sorteadas; é o
+# que torna a amostra mais barata que a consulta exata em períodos longos.
+# Vendas da mesma página (mesmo horário, mesma loja) entram juntas, então
+# as margens abaixo, que supõem vendas sorteadas uma a uma, ficam menores
+# do que o erro real. `bernoulli` sorteia cada linha de forma independente,
+# como as margens supõem, mas lê todas as páginas da tabela.
+SAMPLING_METHODS = ("system", "bernoulli")
+
+
+def error_column(alias: str) -> str:
+    """Nome da coluna com a margem de erro de uma métrica."""
+    return f"{alias}_error"
+
+
+def sample_fraction() -> float:
+    return settings.APPROX_SAMPLE_PERCENT / 100
+
+
+def sampled_table(table, name):
+    """
+    `table TABLESAMPLE método(percentual) REPEATABLE (semente)`. Com a mesma
+    semente e o mesmo percentual, o Postgres sorteia as mesmas linhas em toda
+    consulta, então resultados em cache, páginas e subqueries são coerentes.
+    """
+    method = settings.APPROX_SAMPLE_METHOD
+    if method not in SAMPLING_METHODS:
+        raise ValueError(f"Unknown APPROX_SAMPLE_METHOD: {method}")
+    return table.tablesample(
+        getattr(func, method)(literal_column(repr(float(settings.APPROX_SAMPLE_PERCENT)))),
+        name=name,
+        seed=literal_column(str(int(settings.APPROX_SAMPLE_SEED))),
+    )
+
+
+def replace_tables(statement, replacements):
+    """
+    Troca, em todo o statement, cada tabela de `replacements` (e suas
+    colunas) pela tabela correspondente, sem entrar nas substitutas.
+    """
+    def replace(element):
+        if isinstance(element, FromClause) and element in replacements:
+            return replacements[element]
+        if isinstance(element, ColumnClause) and isinstance(element.table, FromClause):
+            target = replacements.get(element.table)
+            if target is not None:
+                return target.c[element.key]
+        return None
+
+    return visitors.replacement_traverse(statement, {}, replace)
+
+
+def lower_bound(function, counts_sales: bool) -> bool:
+    """Se a métrica sai da amostra sem correção, só como limite inferior."""
+    return function == MetricFunction.COUNT and not counts_sales
+
+
+def sampled_metric(function, column, counts_sales: bool, distinct: bool):
+    """
+    Estimativa de uma métrica a partir da amostra e sua margem de erro de
+    95% (estimador de Horvitz-Thompson: cada venda entra na amostra de forma
+    independente com probabilidade p, como no TABLESAMPLE bernoulli; com
+    system as estimativas valem, mas as margens ficam otimistas):
+
+    - soma: Σx / p, com variância (1 - p) / p² · Σx²;
+    - contagem de vendas: n / p, com variância (1 - p) / p² · n;
+    - média: média da amostra, com erro padrão s / √n · √(1 - p).
+
+    Contagens distintas de outros campos (lojas, canais...) não escalam com
+    a amostra: saem da amostra sem correção e com margem desconhecida (NULL),
+    como um limite inferior (ver `lower_bound`).
+    """
+    p = sample_fraction()
+    if function == MetricFunction.SUM:
+        estimate = func.sum(column) / p
+        margin = Z_95 * func.sqrt((1 - p) * func.sum(column * column)) / p
+    elif function == MetricFunction.AVG:
+        estimate = func.avg(column)
+        margin = Z_95 * math.sqrt(1 - p) * func.stddev_samp(column) / func.sqrt(
+            func.nullif(func.count(column), 0), type_=Float
+        )
+    else:
+        count = func.count(func.distinct(column)) if distinct else func.count(column)
+        if lower_bound(function, counts_sales):
+            return count, null()
+        estimate = count / p
+        margin = Z_95 * func.sqrt((1 - p) * count) / p
+    return estimate, margin
+
+
+def exact_margin():
+    return literal(0)
+
+
+def approximate_distinct(column):
+    """Contagem distinta por HyperLogLog (DuckDB), com margem desconhecida."""
+    return func.approx_count_distinct(column), null()
+
+
+def sample_description(lower_bounds=()):
+    """
+    Bloco `approximation` de uma consulta amostrada. `lower_bounds` lista as
+    métricas que não são estimativas do total, só limites inferiores.
+    """
+    return {
+        "method": "sample",
+        "sampling": settings.APPROX_SAMPLE_METHOD,
+        "sample_percent": settings.APPROX_SAMPLE_PERCENT,
+        "confidence": CONFIDENCE,
+        "lower_bounds": list(lower_bounds),
+    }
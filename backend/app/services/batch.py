@@ -0,0 +1,165 @@
+import json
+
+from app.schemas import AnalyticsQuery
+from app.services.cache import build_cache_key
+from app.services.query_builder import (
+    QueryBuilder,
+    FIELD_MAP,
+    ONE_TO_MANY,
+    GROUPING_COLUMN,
+    grouping_mask,
+)
+
+# Dimensões cuja ordem em Python é a mesma do Postgres (números e datas).
+# Ordenar por texto depende da collation do banco, então essas consultas
+# não são combinadas.
+SORTABLE_DIMENSIONS = ("sale_date", "hour_of_day", "day_of_week")
+
+
+def metric_alias(metric):
+    """Nome da coluna da métrica no resultado, como no QueryBuilder."""
+    return metric.alias or f"{metric.function}_{metric.field}"
+
+
+def _shareable(query_request: AnalyticsQuery) -> bool:
+    """
+    Verifica se a consulta pode sair de uma varredura combinada: sem
+    paginação, subtotais próprios ou modo aproximado, sem campos
+    um-para-muitos em dimensões ou métricas (a subquery por venda mudaria
+    a contagem dos outros conjuntos) e com ordenação que pode ser refeita
+    sobre o resultado.
+    """
+    if query_request.page_size or query_request.cursor or query_request.subtotals:
+        return False
+    if query_request.approximate:
+        return False
+
+    dimensions = [dim_enum.value for dim_enum in query_request.dimensions]
+    if any(name in ONE_TO_MANY for name in dimensions):
+        return False
+    for metric in query_request.metrics:
+        if metric.field not in FIELD_MAP or metric.field in ONE_TO_MANY:
+            return False
+
+    if query_request.order_by:
+        field = query_request.order_by.field
+        if field in FIELD_MAP:
+            return field in dimensions and field in SORTABLE_DIMENSIONS
+        return field in {metric_alias(metric) for metric in query_request.metrics}
+    return True
+
+
+def share_key(query_request: AnalyticsQuery, backend: str):
+    """
+    Chave das consultas que leem as mesmas vendas: mesmo período, mesmos
+    filtros e mesma fonte (rollup ou `sales`). None se não for combinável.
+    """
+    if not _shareable(query_request):
+        return None
+    canonical = json.loads(build_cache_key(query_request))
+    use_rollup = QueryBuilder(query_request, backend).use_rollup
+    return json.dumps([canonical["filters"], canonical["time_range"], use_rollup])
+
+
+def plan_batch(queries, backend: str):
+    """
+    Separa as posições das consultas em grupos combináveis (duas ou mais
+    com a mesma chave) e consultas avulsas.
+    """
+    groups = {}
+    single = []
+    for position, query_request in enumerate(queries):
+        key = share_key(query_request, backend)
+        if key is None:
+            single.append(position)
+        else:
+            groups.setdefault(key, []).append(position)
+
+    shared = []
+    for positions in groups.values():
+        if len(positions) > 1:
+            shared.append(positions)
+        else:
+            single.extend(positions)
+    return shared, sorted(single)
+
+
+class SharedQuery:
+    """
+    Uma consulta com GROUPING SETS que responde várias requisições com o
+    mesmo período e filtros: agrupa pela união das dimensões, calcula cada
+    métrica distinta uma vez e separa as linhas de cada requisição pelo
+    indicador de agrupamento.
+    """
+    def __init__(self, queries):
+        self.queries = queries
+        self.dimensions = []
+        self.metrics = {}
+        for query_request in queries:
+            for dim_enum in query_request.dimensions:
+                if dim_enum.value not in self.dimensions:
+                    self.dimensions.append(dim_enum.value)
+            for metric in query_request.metrics:
+                self.metrics.setdefault((metric.field, metric.function.value), f"m{len(self.metrics)}")
+
+        self.grouping_sets = []
+        for query_request in queries:
+            grouping_set = tuple(dim_enum.value for dim_enum in query_request.dimensions)
+            if grouping_set not in self.grouping_sets:
+                self.grouping_sets.append(grouping_set)
+
+        first = queries[0]
+        self.request = AnalyticsQuery(
+            metrics=[
+                {"field": field, "function": function, "alias": alias}
+                for (field, function), alias in self.metrics.items()
+            ],
+            dimensions=self.dimensions,
+            filters=first.filters,
+            time_range=first.time_range,
+        )
+
+    def build(self, backend: str):
+        grouping_sets = self.grouping_sets if self.dimensions else None
+        return QueryBuilder(self.request, backend, grouping_sets=grouping_sets).build()
+
+    def split(self, column_names, rows):
+        """Resultado de cada requisição, na ordem de `queries`."""
+        index = {name: position for position, name in enumerate(column_names)}
+        by_mask = {}
+        for row in rows:
+            mask = row[index[GROUPING_COLUMN]] if self.dimensions else 0
+            by_mask.setdefault(mask, []).append(row)
+
+        results = []
+        for query_request in self.queries:
+            dimensions = [dim_enum.value for dim_enum in query_request.dimensions]
+            columns = dimensions + [metric_alias(metric) for metric in query_request.metrics]
+            positions = [index[name] for name in dimensions] + [
+                index[self.metrics[(metric.field, metric.function.value)]]
+                for metric in query_request.metrics
+            ]
+            mask = grouping_mask(self.dimensions, dimensions) if self.dimensions else 0
+            data = [
+                dict(zip(columns, (row[position] for position in positions)))
+                for row in by_mask.get(mask, [])
+            ]
+            results.append({"data": order_and_limit(query_request, data)})
+        return results
+
+
+def order_and_limit(query_request: AnalyticsQuery, data):
+    """
+    Aplica ORDER BY e LIMIT da requisição sobre as linhas já separadas,
+    com NULLs por último na ordem crescente e primeiro na decrescente,
+    como no Postgres.
+    """
+    if query_request.order_by:
+        field = query_request.order_by.field
+        data.sort(
+            key=lambda row: (row[field] is None, row[field]),
+            reverse=query_request.order_by.direction == "desc",
+        )
+    if query_request.limit and query_request.limit > 0:
+        data = data[:query_request.limit]
+    return data
@@ -0,0 +1,229 @@
+import json
+import pickle
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from app.core.config import settings
+from app.schemas import AnalyticsQuery
+from app.services.query_builder import FIELD_MAP, normalize_filter_value
+
+
+def _canonical_value(value):
+    """Serializa um valor de filtro de forma determinística."""
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def build_cache_key(query_request: AnalyticsQuery) -> str:
+    """
+    Gera a chave canônica de uma requisição. Filtros são ordenados e seus
+    valores normalizados como no QueryBuilder, então requisições que geram
+    a mesma query SQL compartilham a mesma entrada.
+    Métricas e dimensões mantêm a ordem, pois definem as colunas do resultado.
+    """
+    filters = set()
+    for f in query_request.filters or []:
+        if f.field not in FIELD_MAP:
+            continue
+        value = normalize_filter_value(f)
+        if value is None:
+            continue
+        if f.operator == "in" and isinstance(value, list):
+            value = sorted({_canonical_value(v) for v in value})
+        filters.add((f.field, f.operator.value, _canonical_value(value)))
+
+    time_range = None
+    if query_request.time_range:
+        time_range = [
+            _normalize_datetime(query_request.time_range.start_date).isoformat(),
+            _normalize_datetime(query_request.time_range.end_date).isoformat(),
+        ]
+
+    order_by = None
+    if query_request.order_by:
+        order_by = [query_request.order_by.field, query_request.order_by.direction.value]
+
+    canonical = {
+        "metrics": [
+            [m.field, m.function.value, m.alias or f"{m.function}_{m.field}"]
+            for m in query_request.metrics
+        ],
+        "dimensions": [d.value for d in query_request.dimensions],
+        "filters": sorted(filters),
+        "time_range": time_range,
+        "order_by": order_by,
+        "limit": query_request.limit if query_request.limit and query_request.limit > 0 else None,
+        "page_size": query_request.page_size,
+        "cursor": query_request.cursor,
+    }
+    if query_request.subtotals:
+        canonical["subtotals"] = query_request.subtotals.model_dump(mode="json")
+    if query_request.approximate:
+        canonical["approximate"] = True
+    return json.dumps(canonical, sort_keys=True)
+
+
+def _normalize_datetime(value: datetime) -> datetime:
+    """Converte datas com fuso para UTC, mantendo as ingênuas como estão."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc)
+    return value
+
+
+def ttl_for(query_request: AnalyticsQuery, tracked: bool = False) -> int:
+    """
+    Períodos encerrados no passado não mudam mais e podem ficar em cache
+    por muito mais tempo que consultas que cobrem o dia de hoje. Com
+    `tracked` (a captura de mudanças está em dia), vendas novas e alteradas
+    já invalidam os resultados afetados e o TTL dos períodos abertos só
+    limita o atraso da varredura.
+    """
+    open_ttl = settings.CACHE_TRACKED_TTL_SECONDS if tracked else settings.CACHE_TTL_SECONDS
+
+    time_range = query_request.time_range
+    if time_range is None:
+        return open_ttl
+
+    end = time_range.end_date
+    now = datetime.now(timezone.utc) if end.tzinfo else datetime.now()
+    if end < now:
+        return settings.CACHE_HISTORICAL_TTL_SECONDS
+    return open_ttl
+
+
+class CacheBackend(ABC):
+    """Interface dos backends de cache de resultados."""
+
+    @abstractmethod
+    def get(self, key: str):
+        """Retorna o valor em cache ou None se ausente/expirado."""
+
+    @abstractmethod
+    def set(self, key: str, value, ttl: int, scope=None):
+        """
+        Armazena um valor por `ttl` segundos. `scope` descreve os dados
+        lidos pelo resultado e é usado em `invalidate`.
+        """
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove uma entrada."""
+
+    @abstractmethod
+    def invalidate(self, affected) -> int:
+        """
+        Remove as entradas cujo escopo satisfaz `affected(scope)` (e as
+        sem escopo). Retorna quantas foram removidas.
+        """
+
+    @abstractmethod
+    def clear(self):
+        """Remove todas as entradas."""
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """Retorna contadores de uso do cache."""
+
+
+class InMemoryCache(CacheBackend):
+    """
+    Cache LRU em processo, limitado pelo tamanho aproximado (em bytes)
+    dos valores armazenados.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at, size, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl, scope=None):
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (value, time.monotonic() + ttl, size, scope)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate(self, affected):
+        with self._lock:
+            stale = [
+                key for key, (_, _, _, scope) in self._entries.items()
+                if scope is None or affected(scope)
+            ]
+            for key in stale:
+                self._remove(key)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key):
+        _, _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+
+CACHE_BACKENDS = {
+    "memory": lambda: InMemoryCache(max_bytes=settings.CACHE_MAX_BYTES),
+}
+
+
+def create_cache_backend() -> CacheBackend:
+    """Instancia o backend configurado em CACHE_BACKEND."""
+    try:
+        factory = CACHE_BACKENDS[settings.CACHE_BACKEND]
+    except KeyError:
+        raise ValueError(f"Unknown cache backend: {settings.CACHE_BACKEND}")
+    return factory()
+
+
+query_cache = create_cache_backend()
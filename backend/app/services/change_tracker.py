@@ -0,0 +1,193 @@
+import bisect
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, func, DateTime
+
+from app.core.config import settings
+from app.database import engine
+from app.schemas import AnalyticsQuery
+from app.services.cache import query_cache
+from app.services.query_builder import sales, sales_changes, normalize_filter_value
+from app.services.rollups import SNAPSHOT, refresh_rollups, settled_bounds
+
+ONE_HOUR = timedelta(hours=1)
+
+# Parte dos dados que um resultado em cache leu: período (None = sem limite)
+# e lojas filtradas (None = todas).
+CacheScope = namedtuple("CacheScope", ["start", "end", "store_ids"])
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """`sales.created_at` é gravado sem fuso; datas com fuso são comparadas em UTC."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def cache_scope(query_request: AnalyticsQuery) -> CacheScope:
+    """Período e lojas lidos por uma requisição, para decidir se uma mudança a afeta."""
+    start = end = None
+    if query_request.time_range:
+        start = _naive_utc(query_request.time_range.start_date)
+        end = _naive_utc(query_request.time_range.end_date)
+
+    store_ids = None
+    for f in query_request.filters or []:
+        if f.field != "store_name" or f.operator not in ("equals", "in"):
+            continue
+        value = normalize_filter_value(f)
+        if value is None:
+            continue
+        values = set(value) if isinstance(value, list) else {value}
+        store_ids = values if store_ids is None else store_ids & values
+
+    return CacheScope(start, end, frozenset(store_ids) if store_ids is not None else None)
+
+
+class ChangeSet:
+    """Horas com vendas novas, alteradas ou removidas, por loja, encontradas em uma varredura."""
+    def __init__(self, buckets):
+        hours = {}
+        for store_id, hour_start in buckets:
+            hours.setdefault(store_id, set()).add(hour_start)
+        self.hours = {store_id: sorted(store_hours) for store_id, store_hours in hours.items()}
+
+    def __bool__(self):
+        return bool(self.hours)
+
+    def affects(self, scope: CacheScope) -> bool:
+        """Verifica se alguma hora alterada cai no período e nas lojas do escopo."""
+        for store_id, hours in self.hours.items():
+            if scope.store_ids is not None and store_id not in scope.store_ids:
+                continue
+            # Primeira hora que ainda termina depois do início do período.
+            position = 0 if scope.start is None else bisect.bisect_right(hours, scope.start - ONE_HOUR)
+            if position < len(hours) and (scope.end is None or hours[position] <= scope.end):
+                return True
+        return False
+
+    def summary(self):
+        return {
+            "stores": sorted(self.hours),
+            "dates": sorted({hour.date().isoformat() for hours in self.hours.values() for hour in hours}),
+            "hours": sum(len(hours) for hours in self.hours.values()),
+        }
+
+
+def _buckets(connection, table, column, after_id, upper_id):
+    """Pares (loja, hora) das linhas de `table` com id em (after_id, upper_id]."""
+    hour_start = func.date_trunc('hour', column, type_=DateTime)
+    return connection.execute(
+        select(table.c.store_id, hour_start)
+        .where(table.c.id > after_id, table.c.id <= upper_id)
+        .group_by(table.c.store_id, hour_start)
+    ).all()
+
+
+class ChangeTracker:
+    """
+    Acompanha as vendas novas por high-water mark de `sales.id` e as
+    alteradas ou removidas pelo log `sales_changes`, cada um com sua marca.
+    As marcas só avançam até o id assentado (ver `settled_bounds`), para que
+    um id menor confirmado depois não fique para trás. A cada varredura
+    agrupa as linhas entre as marcas por loja e hora e devolve um ChangeSet
+    para invalidar só os resultados em cache afetados.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.high_water_mark = None
+        self.change_mark = None
+        self._pending = {}
+        self.last_poll = None
+        self.last_changes = None
+        self.invalidated = 0
+
+    def _settle(self, name, mark, max_id, snapshot):
+        """Limite assentado para `name` a partir da marca atual; guarda a marca pendente."""
+        upper, self._pending[name] = settled_bounds(
+            (mark or 0, *self._pending.get(name, (None, None))), max_id or 0, *snapshot
+        )
+        return upper
+
+    def poll(self, connection) -> ChangeSet:
+        with self._lock:
+            max_sale_id, max_change_id, *snapshot = connection.execute(SNAPSHOT).one()
+            upper_sale_id = self._settle("sales", self.high_water_mark, max_sale_id, snapshot)
+            upper_change_id = self._settle("sales_changes", self.change_mark, max_change_id, snapshot)
+
+            if self.high_water_mark is None:
+                # Antes do ponto de partida não há o que invalidar: os resultados
+                # em cache ainda usam o TTL curto (ver `is_current`). Ele é fixado
+                # no primeiro limite assentado, para não varrer a tabela toda.
+                if all(
+                    upper > 0 or self._pending[name][0] is None
+                    for name, upper in (("sales", upper_sale_id), ("sales_changes", upper_change_id))
+                ):
+                    self.high_water_mark = upper_sale_id
+                    self.change_mark = upper_change_id
+                    self.last_poll = datetime.now(timezone.utc)
+                return ChangeSet([])
+
+            rows = []
+            if upper_sale_id > self.high_water_mark:
+                rows += _buckets(connection, sales, sales.c.created_at, self.high_water_mark, upper_sale_id)
+                self.high_water_mark = upper_sale_id
+            if upper_change_id > self.change_mark:
+                rows += _buckets(
+                    connection, sales_changes, sales_changes.c.created_at, self.change_mark, upper_change_id
+                )
+                self.change_mark = upper_change_id
+
+            changes = ChangeSet(rows)
+            if changes:
+                self.last_changes = changes.summary()
+            self.last_poll = datetime.now(timezone.utc)
+            return changes
+
+    def is_current(self) -> bool:
+        """
+        Se as mudanças estão sendo capturadas: a captura está ativa, já tem
+        ponto de partida e a última varredura foi há poucos ciclos.
+        """
+        with self._lock:
+            if not settings.CHANGE_TRACKING_ENABLED or self.high_water_mark is None:
+                return False
+            age = datetime.now(timezone.utc) - self.last_poll
+            return age <= timedelta(seconds=3 * settings.CHANGE_POLL_SECONDS)
+
+    def process(self) -> ChangeSet:
+        """
+        Uma rodada de captura: busca as vendas novas e as alteradas, atualiza o rollup
+        (só os buckets de loja/hora tocados, via refresh incremental) e remove
+        do cache apenas os resultados cujo período e lojas incluem essas horas.
+        """
+        with engine.connect() as connection:
+            changes = self.poll(connection)
+        if not changes:
+            return changes
+
+        if settings.ROLLUPS_ENABLED:
+            with engine.begin() as connection:
+                refresh_rollups(connection)
+
+        removed = query_cache.invalidate(changes.affects)
+        with self._lock:
+            self.invalidated += removed
+        return changes
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": settings.CHANGE_TRACKING_ENABLED,
+                "poll_seconds": settings.CHANGE_POLL_SECONDS,
+                "high_water_mark": self.high_water_mark,
+                "change_mark": self.change_mark,
+                "last_poll": self.last_poll.isoformat() if self.last_poll else None,
+                "last_changes": self.last_changes,
+                "invalidated": self.invalidated,
+            }
+
+
+change_tracker = ChangeTracker()
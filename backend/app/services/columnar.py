@@ -0,0 +1,371 @@
+import json
+import math
+import os
+import shutil
+import threading
+from bisect import bisect_right
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from sqlalchemy import select, func, cast, SmallInteger, Integer, BigInteger, Numeric, String, Date, DateTime
+from sqlalchemy.dialects.postgresql.base import PGDialect
+
+from app.core.config import settings
+from app.schemas import QueryBackend
+from app.services.query_builder import (
+    sales,
+    stores,
+    channels,
+    product_sales,
+    products,
+    payments,
+    payment_types,
+    sales_changes,
+)
+from app.services.rollups import snapshot_query, settled_bounds
+
+if settings.QUERY_BACKEND not in [backend.value for backend in QueryBackend]:
+    raise ValueError(f"Unknown QUERY_BACKEND: {settings.QUERY_BACKEND}")
+
+# O DuckDB aceita o SQL do Postgres gerado pelo QueryBuilder; só os
+# parâmetros mudam para o estilo posicional ('?'), sem casts de driver.
+DUCKDB_DIALECT = PGDialect(paramstyle="qmark")
+
+# Colunas de `sales` derivadas de created_at. No Postgres podem ser colunas
+# geradas (04-time-dimensions.sql); na cópia colunar são sempre gravadas.
+TIME_COLUMNS = {
+    "sale_date": func.date(sales.c.created_at),
+    "hour_of_day": cast(func.extract('hour', sales.c.created_at), SmallInteger),
+    "day_of_week": cast(func.extract('isodow', sales.c.created_at), SmallInteger),
+}
+
+# Tabelas de fatos são copiadas por faixa de id, em arquivos de até
+# PART_IDS ids; as dimensões são pequenas e regravadas inteiras a cada
+# sincronização.
+FACT_TABLES = (sales, product_sales, payments)
+DIMENSION_TABLES = (stores, channels, products, payment_types)
+# Uma venda alterada faz regravar o arquivo inteiro que a contém.
+PART_IDS = 1_000_000
+
+STATE_FILE = "_state.json"
+# Arquivo vazio, com o schema, para a view existir antes da primeira linha.
+EMPTY_PART = "part-000000000000.parquet"
+
+
+class ColumnarUnavailable(Exception):
+    """A cópia colunar ainda não foi gerada ou o duckdb não está instalado."""
+
+
+def _arrow_type(column):
+    import pyarrow as pa
+
+    if isinstance(column.type, SmallInteger):
+        return pa.int16()
+    if isinstance(column.type, (Integer, BigInteger)):
+        return pa.int64()
+    if isinstance(column.type, Numeric):
+        return pa.decimal128(12, 2)
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column.type, Date):
+        return pa.date32()
+    if isinstance(column.type, String):
+        return pa.string()
+    raise TypeError(f"No Arrow type for column {column}")
+
+
+def export_columns(table):
+    """Colunas exportadas de cada tabela: as que o QueryBuilder declara."""
+    if table is sales:
+        return [
+            TIME_COLUMNS[column.name].label(column.name) if column.name in TIME_COLUMNS else column
+            for column in table.columns
+        ]
+    return list(table.columns)
+
+
+def _parquet_schema(table):
+    import pyarrow as pa
+
+    return pa.schema([(column.name, _arrow_type(column)) for column in table.columns])
+
+
+def _write_empty_parquet(table, path):
+    import pyarrow.parquet as pq
+
+    pq.write_table(_parquet_schema(table).empty_table(), path)
+
+
+def _write_parquet(connection, statement, table, path, batch_size):
+    """Grava o resultado em um arquivo Parquet, lote a lote; retorna as linhas escritas."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(table)
+    result = connection.execution_options(stream_results=True, max_row_buffer=batch_size).execute(statement)
+
+    written = 0
+    with pq.ParquetWriter(path + ".tmp", schema) as writer:
+        for rows in result.partitions(batch_size):
+            columns = list(zip(*rows))
+            writer.write_batch(pa.record_batch(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            written += len(rows)
+    os.replace(path + ".tmp", path)
+    return written
+
+
+def _load_state(data_dir):
+    path = os.path.join(data_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_state(data_dir, state):
+    path = os.path.join(data_dir, STATE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def _part_path(data_dir, table, first_id):
+    return os.path.join(data_dir, table.name, f"part-{first_id:012d}.parquet")
+
+
+def _parts(data_dir, table, last_id):
+    """Faixas de id [primeiro, último] de cada arquivo já copiado de uma tabela de fatos."""
+    starts = sorted(
+        int(name[len("part-"):-len(".parquet")])
+        for name in os.listdir(os.path.join(data_dir, table.name))
+        if name.startswith("part-") and name.endswith(".parquet") and name != EMPTY_PART
+    )
+    return [(start, end - 1) for start, end in zip(starts, starts[1:] + [last_id + 1])]
+
+
+def _export_range(connection, data_dir, table, first_id, last_id, batch_size):
+    statement = (
+        select(*export_columns(table))
+        .where(table.c.id >= first_id, table.c.id <= last_id)
+        .order_by(table.c.id)
+    )
+    return _write_parquet(
+        connection, statement, table, _part_path(data_dir, table, first_id), batch_size
+    )
+
+
+def _changed_parts(connection, data_dir, last_change_id, upper_change_id, last_sale_id):
+    """Arquivos de `sales` com vendas registradas no log entre as duas marcas."""
+    changed = connection.execute(
+        select(sales_changes.c.sale_id)
+        .where(
+            sales_changes.c.id > last_change_id,
+            sales_changes.c.id <= upper_change_id,
+            sales_changes.c.sale_id <= last_sale_id,
+        )
+        .distinct()
+    ).scalars().all()
+    parts = _parts(data_dir, sales, last_sale_id)
+    starts = [first_id for first_id, _ in parts]
+    return sorted({parts[bisect_right(starts, sale_id) - 1] for sale_id in changed})
+
+
+def sync_columnar(connection, data_dir, full=False, batch_size=100_000):
+    """
+    Atualiza a cópia colunar (um diretório de arquivos Parquet por tabela).
+    As tabelas de fatos recebem novos arquivos com as linhas de id acima
+    da última sincronização, até o id assentado (ver `settled_bounds`): um
+    id menor ainda não confirmado não fica para trás. As dimensões são
+    regravadas. Com `full=True` a cópia é refeita do zero. Use uma conexão
+    em REPEATABLE READ para que vendas, itens e pagamentos venham do mesmo
+    snapshot. Retorna as linhas copiadas por tabela (em "sales_changes",
+    as vendas exportadas de novo por causa de alterações).
+
+    Vendas alteradas ou removidas depois de copiadas chegam pelo log
+    `sales_changes`, e cada arquivo de `sales` que as contém é exportado de
+    novo. Itens e pagamentos são tratados como só de inserção; os de vendas
+    removidas não aparecem nas consultas, que partem sempre de `sales`.
+    """
+    state = _load_state(data_dir)
+    if full and os.path.isdir(data_dir):
+        shutil.rmtree(data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+    pending = state.get("pending", {})
+    copied = {}
+
+    for table in DIMENSION_TABLES:
+        os.makedirs(os.path.join(data_dir, table.name), exist_ok=True)
+        statement = select(*export_columns(table))
+        copied[table.name] = _write_parquet(
+            connection, statement, table,
+            os.path.join(data_dir, table.name, "part-0.parquet"), batch_size,
+        )
+
+    names = [table.name for table in FACT_TABLES] + [sales_changes.name]
+    *max_ids, xmin, xmax, others_running = connection.execute(snapshot_query(*names)).one()
+    bounds = {}
+    for name, max_id in zip(names, max_ids):
+        last_id = state.get(name, 0)
+        upper_id, pending_mark = settled_bounds(
+            (last_id, *pending.get(name, (None, None))), max_id or 0, xmin, xmax, others_running,
+        )
+        # Sem `full`, cada tabela continua de onde parou; refeita do zero, ela
+        # vai direto até o id assentado, lido no estado atual das linhas.
+        bounds[name] = (0 if full else last_id, max(upper_id, last_id))
+        pending[name] = pending_mark
+
+    last_change_id, upper_change_id = bounds[sales_changes.name]
+    copied[sales_changes.name] = 0
+    if not full and upper_change_id > last_change_id:
+        last_sale_id = bounds[sales.name][0]
+        for first_id, last_id in _changed_parts(
+            connection, data_dir, last_change_id, upper_change_id, last_sale_id
+        ):
+            copied[sales_changes.name] += _export_range(
+                connection, data_dir, sales, first_id, last_id, batch_size
+            )
+
+    for table in FACT_TABLES:
+        os.makedirs(os.path.join(data_dir, table.name), exist_ok=True)
+        last_id, upper_id = bounds[table.name]
+        copied[table.name] = 0
+        for first_id in range(last_id + 1, upper_id + 1, PART_IDS):
+            copied[table.name] += _export_range(
+                connection, data_dir, table, first_id, min(first_id + PART_IDS - 1, upper_id), batch_size,
+            )
+        if not os.listdir(os.path.join(data_dir, table.name)):
+            _write_empty_parquet(table, os.path.join(data_dir, table.name, EMPTY_PART))
+
+    state = {name: upper_id for name, (_, upper_id) in bounds.items()}
+    state["pending"] = pending
+    state["synced_at"] = datetime.now(timezone.utc).isoformat()
+    _save_state(data_dir, state)
+    return copied
+
+
+def _duckdb_params(expanded):
+    """
+    Valores dos parâmetros na ordem dos '?'. Datas com fuso viram UTC sem
+    fuso, como o Postgres compara `timestamp` com `timestamptz` em UTC.
+    """
+    params = []
+    for name in expanded.positiontup:
+        value = expanded.parameters[name]
+        if isinstance(value, datetime) and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        params.append(value)
+    return params
+
+
+class ColumnarBackend:
+    """
+    Executa as consultas do QueryBuilder no DuckDB, em processo, sobre a
+    cópia Parquet gerada por `sync_columnar`. Cada tabela vira uma view
+    sobre os arquivos do seu diretório, lidos de novo a cada consulta.
+    """
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            if self._connection is not None:
+                return self._connection
+            try:
+                import duckdb
+            except ImportError:
+                raise ColumnarUnavailable("duckdb is not installed")
+            if not os.path.exists(os.path.join(self.data_dir, STATE_FILE)):
+                raise ColumnarUnavailable(
+                    f"No columnar copy in {self.data_dir}; run sync_columnar.py first"
+                )
+
+            connection = duckdb.connect()
+            for table in DIMENSION_TABLES + FACT_TABLES:
+                files = os.path.join(os.path.abspath(self.data_dir), table.name, "*.parquet")
+                connection.execute(
+                    f"CREATE VIEW {table.name} AS SELECT * FROM read_parquet('{files}')"
+                )
+            self._connection = connection
+            return connection
+
+    def execute(self, statement):
+        """Executa o statement e retorna (nomes das colunas, linhas)."""
+        # Expande os IN depois de compilar: com render_postcompile, statements
+        # do cache de formato (valores via .params()) não expõem os parâmetros.
+        expanded = statement.compile(dialect=DUCKDB_DIALECT).construct_expanded_state()
+        # Um cursor por chamada: a conexão do DuckDB não é compartilhada entre threads.
+        cursor = self._connect().cursor()
+        try:
+            cursor.execute(expanded.statement, _duckdb_params(expanded))
+            column_names = [description[0] for description in cursor.description]
+            return column_names, cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def status(self):
+        return {"data_dir": self.data_dir, **_load_state(self.data_dir)}
+
+
+def _comparable(value):
+    """Normaliza valores dos dois backends (Decimal x float, datas) para comparação."""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float, Decimal)):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _same(left, right):
+    if isinstance(left, float) and isinstance(right, float):
+        return math.isclose(left, right, rel_tol=1e-9, abs_tol=1e-6)
+    return left == right
+
+
+def diff_results(key_columns, expected, actual, max_differences=20):
+    """
+    Compara dois resultados (nomes das colunas, linhas) linha a linha pela
+    chave (as dimensões da consulta), sem depender da ordem das linhas.
+    Números são comparados com tolerância, pois somas de ponto flutuante
+    podem diferir na última casa entre os motores.
+    """
+    expected_columns, expected_rows = expected
+    actual_columns, actual_rows = actual
+
+    def by_key(column_names, rows):
+        indexed = {}
+        for row in rows:
+            record = {name: _comparable(value) for name, value in zip(column_names, row)}
+            indexed[tuple(record.get(name) for name in key_columns)] = record
+        return indexed
+
+    left = by_key(expected_columns, expected_rows)
+    right = by_key(actual_columns, actual_rows)
+
+    mismatches = []
+    for key in left.keys() & right.keys():
+        for name, value in left[key].items():
+            if not _same(value, right[key].get(name)):
+                mismatches.append({
+                    "key": list(key), "column": name,
+                    "postgres": value, "duckdb": right[key].get(name),
+                })
+
+    missing = [list(key) for key in left.keys() - right.keys()]
+    extra = [list(key) for key in right.keys() - left.keys()]
+    return {
+        "matches": not mismatches and not missing and not extra,
+        "rows": {"postgres": len(expected_rows), "duckdb": len(actual_rows)},
+        "missing_in_duckdb": missing[:max_differences],
+        "missing_in_postgres": extra[:max_differences],
+        "mismatches": mismatches[:max_differences],
+    }
+
+
+columnar_backend = ColumnarBackend(settings.COLUMNAR_DATA_DIR)
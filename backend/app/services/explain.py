@@ -0,0 +1,78 @@
+import json
+
+from sqlalchemy.exc import CompileError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+
+class Explain(Executable, ClauseElement):
+    """
+    `EXPLAIN` de um statement do SQLAlchemy, executável em qualquer driver.
+    Com `analyze=True` a consulta é de fato executada (ANALYZE, BUFFERS);
+    sem ele, o Postgres só planeja e devolve as estimativas.
+    """
+    inherit_cache = False
+
+    def __init__(self, statement, analyze=False):
+        self.statement = statement
+        self.analyze = analyze
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if element.analyze else "FORMAT JSON"
+    return f"EXPLAIN ({options}) {compiler.process(element.statement, **kw)}"
+
+
+def compiled_sql(statement, dialect):
+    """
+    SQL do statement com os valores já no texto, pronto para copiar e rodar
+    no psql. Se algum valor não puder ser renderizado, volta aos placeholders.
+    """
+    try:
+        return str(statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    except CompileError:
+        return str(statement.compile(dialect=dialect))
+
+
+def parse_plan(document):
+    """O resultado do EXPLAIN vem como lista ou como texto JSON, conforme o driver."""
+    if isinstance(document, str):
+        document = json.loads(document)
+    return document[0]
+
+
+def plan_shape(node):
+    """Resumo da árvore do plano: tipos de nó e tabelas, ex. Sort(Hash Join(Seq Scan[sales], ...))."""
+    label = node["Node Type"]
+    if "Relation Name" in node:
+        label = f"{label}[{node['Relation Name']}]"
+    children = node.get("Plans", [])
+    if not children:
+        return label
+    return f"{label}({', '.join(plan_shape(child) for child in children)})"
+
+
+def rows_scanned(node):
+    """Linhas lidas pelos nós de varredura, incluindo as descartadas pelo filtro."""
+    total = 0
+    if "Scan" in node["Node Type"]:
+        loops = node.get("Actual Loops", 1)
+        total += (node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)) * loops
+    for child in node.get("Plans", []):
+        total += rows_scanned(child)
+    return total
+
+
+def summarize_plan(root):
+    """Métricas principais de um plano (tempos, linhas lidas, buffers e formato)."""
+    plan = root["Plan"]
+    return {
+        "planning_ms": root.get("Planning Time"),
+        "execution_ms": root.get("Execution Time"),
+        "total_cost": plan.get("Total Cost"),
+        "rows_scanned": rows_scanned(plan),
+        "shared_hit_blocks": plan.get("Shared Hit Blocks", 0),
+        "shared_read_blocks": plan.get("Shared Read Blocks", 0),
+        "plan_shape": plan_shape(plan),
+    }
@@ -0,0 +1,331 @@
+import threading
+from collections import Counter
+
+from sqlalchemy import func, select, text
+
+from app.core.config import settings
+from app.schemas import AnalyticsQuery
+from app.services.explain import Explain, parse_plan
+from app.services.query_builder import QueryBuilder, normalize_filter_value
+
+# Coluna de `sales` lida ou filtrada por cada campo do FIELD_MAP.
+# O filtro em `store_name` compara `stores.id`, que o Postgres propaga
+# para `sales.store_id` pelo join; as dimensões de data leem `created_at`.
+SALES_COLUMNS = {
+    "store_name": "store_id",
+    "channel_name": "channel_id",
+    "sale_status": "sale_status_desc",
+    "sale_date": "created_at",
+    "day_of_week": "created_at",
+    "hour_of_day": "created_at",
+    "total_amount": "total_amount",
+    "total_discount": "total_discount",
+    "delivery_fee": "delivery_fee",
+    "sale_id": "id",
+    "product_name": "id",
+    "payment_type": "id",
+}
+
+# Filtros que usam índice diretamente: campo -> coluna de `sales`.
+# Filtros sobre expressões (data, hora, dia da semana) ou sobre colunas
+# de outras tabelas (nome do canal) não entram na chave do índice.
+INDEXABLE_FILTERS = {
+    "store_name": "store_id",
+    "sale_status": "sale_status_desc",
+    "total_amount": "total_amount",
+    "total_discount": "total_discount",
+    "delivery_fee": "delivery_fee",
+    "sale_id": "id",
+}
+
+# Com SALES_TIME_COLUMNS as dimensões de tempo são colunas geradas de
+# `sales` (ver 04-time-dimensions.sql) e os filtros de hora e dia da
+# semana passam a usar índice.
+TIME_COLUMNS = {
+    "sale_date": "sale_date",
+    "day_of_week": "day_of_week",
+    "hour_of_day": "hour_of_day",
+}
+INDEXABLE_TIME_FILTERS = ("day_of_week", "hour_of_day")
+
+
+def sales_column(field):
+    if settings.SALES_TIME_COLUMNS and field in TIME_COLUMNS:
+        return TIME_COLUMNS[field]
+    return SALES_COLUMNS.get(field)
+
+
+def indexable_column(field):
+    if settings.SALES_TIME_COLUMNS and field in INDEXABLE_TIME_FILTERS:
+        return TIME_COLUMNS[field]
+    return INDEXABLE_FILTERS.get(field)
+
+
+# Índices da tabela ponte para filtros e dimensões um-para-muitos:
+# campo -> (tabela, coluna do filtro, coluna da venda).
+BRIDGE_INDEXES = {
+    "product_name": ("product_sales", "product_id", "sale_id"),
+    "payment_type": ("payments", "payment_type_id", "sale_id"),
+}
+
+# Fração mínima das consultas de um formato com o mesmo status fixo
+# para sugerir um índice parcial.
+PARTIAL_INDEX_SHARE = 0.8
+
+MAX_SAMPLES = 3
+
+
+def query_shape(query_request: AnalyticsQuery):
+    """
+    Reduz a requisição ao que importa para a escolha de índices:
+    colunas com igualdade, colunas com intervalo, status fixo, colunas
+    lidas de `sales` e campos um-para-muitos filtrados ou agrupados.
+    """
+    equality = set()
+    ranges = set()
+    status = None
+    bridges = set()
+    read = set()
+
+    if query_request.time_range:
+        ranges.add("created_at")
+
+    for f in query_request.filters or []:
+        if normalize_filter_value(f) is None:
+            continue
+        if f.field in BRIDGE_INDEXES:
+            bridges.add(f.field)
+        if f.field in SALES_COLUMNS:
+            read.add(sales_column(f.field))
+        column = indexable_column(f.field)
+        if column is None:
+            continue
+        if f.field == "sale_status" and f.operator == "equals":
+            status = str(f.value)
+        elif f.operator in ("equals", "in"):
+            equality.add(column)
+        elif f.operator in ("greater_than", "less_than"):
+            ranges.add(column)
+
+    for dim_enum in query_request.dimensions:
+        read.add(sales_column(dim_enum.value))
+        if dim_enum.value in BRIDGE_INDEXES:
+            bridges.add(dim_enum.value)
+
+    for metric in query_request.metrics:
+        if metric.field in SALES_COLUMNS:
+            read.add(sales_column(metric.field))
+
+    return (
+        tuple(sorted(equality)),
+        tuple(sorted(ranges)),
+        status,
+        tuple(sorted(read)),
+        tuple(sorted(bridges)),
+    )
+
+
+class WorkloadStats:
+    """
+    Contadores em memória de como os campos do FIELD_MAP aparecem no tráfego
+    de /api/query (filtros, dimensões, métricas e período) e dos formatos
+    de consulta, com algumas requisições de exemplo de cada formato.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.fields = Counter()
+        self.shapes = Counter()
+        self.samples = {}
+
+    def record(self, query_request: AnalyticsQuery):
+        shape = query_shape(query_request)
+        with self._lock:
+            self.requests += 1
+            if query_request.time_range:
+                self.fields[("time_range", "created_at")] += 1
+            for f in query_request.filters or []:
+                self.fields[("filter", f"{f.field}:{f.operator.value}")] += 1
+            for dim_enum in query_request.dimensions:
+                self.fields[("dimension", dim_enum.value)] += 1
+            for metric in query_request.metrics:
+                self.fields[("metric", f"{metric.function.value}:{metric.field}")] += 1
+
+            self.shapes[shape] += 1
+            samples = self.samples.setdefault(shape, [])
+            if len(samples) < MAX_SAMPLES:
+                samples.append(query_request.model_copy(update={"cursor": None}))
+
+    def snapshot(self):
+        with self._lock:
+            return self.requests, Counter(self.fields), Counter(self.shapes), dict(self.samples)
+
+    def usage(self):
+        """Uso de cada campo por papel, do mais para o menos frequente."""
+        requests, fields, _, _ = self.snapshot()
+        usage = {}
+        for (role, name), count in fields.most_common():
+            usage.setdefault(role, {})[name] = count
+        return {"requests": requests, "usage": usage}
+
+    def clear(self):
+        with self._lock:
+            self.requests = 0
+            self.fields.clear()
+            self.shapes.clear()
+            self.samples.clear()
+
+
+def _quote(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def index_ddl(table, columns, include=(), where=None):
+    """DDL de um índice B-tree, com INCLUDE e WHERE opcionais."""
+    ddl = f"CREATE INDEX ON {table} ({', '.join(columns)})"
+    if include:
+        ddl += f" INCLUDE ({', '.join(include)})"
+    if where:
+        ddl += f" WHERE {where}"
+    return ddl
+
+
+def _merge(recommendations, table, columns, include, where, count, samples):
+    key = (table, tuple(columns), where)
+    entry = recommendations.setdefault(key, {
+        "table": table,
+        "columns": list(columns),
+        "include": set(),
+        "where": where,
+        "queries": 0,
+        "samples": [],
+    })
+    entry["include"] |= set(include)
+    entry["queries"] += count
+    entry["samples"].extend(samples[:MAX_SAMPLES - len(entry["samples"])])
+
+
+def recommend(stats: WorkloadStats, min_queries=1):
+    """
+    Sugere índices a partir dos formatos de consulta registrados:
+    - chave com as colunas de igualdade (as mais filtradas primeiro)
+      seguidas da coluna de intervalo, que no B-tree precisa vir por último;
+    - INCLUDE com as demais colunas lidas de `sales`, para index-only scan;
+    - índice parcial quando o formato fixa o mesmo status em quase todas
+      as consultas (ex. `WHERE sale_status_desc = 'COMPLETED'`);
+    - índices na tabela ponte para produto e forma de pagamento.
+    """
+    _, _, shapes, samples = stats.snapshot()
+    equality_use = Counter()
+    for (equality, *_), count in shapes.items():
+        for column in equality:
+            equality_use[column] += count
+
+    status_share = Counter()
+    shape_totals = Counter()
+    for (equality, ranges, status, read, bridges), count in shapes.items():
+        shape_totals[(equality, ranges, read)] += count
+        if status is not None:
+            status_share[(equality, ranges, read, status)] += count
+
+    recommendations = {}
+    for shape, count in shapes.items():
+        equality, ranges, status, read, bridges = shape
+        shape_samples = samples.get(shape, [])
+
+        for field in bridges:
+            table, filter_column, sale_column = BRIDGE_INDEXES[field]
+            _merge(recommendations, table, [filter_column], [sale_column], None, count, shape_samples)
+
+        if not equality and not ranges and status is None:
+            continue
+
+        where = None
+        if status is not None:
+            total = shape_totals[(equality, ranges, read)]
+            if status_share[(equality, ranges, read, status)] / total >= PARTIAL_INDEX_SHARE:
+                where = f"sale_status_desc = {_quote(status)}"
+
+        columns = sorted(equality, key=lambda column: (-equality_use[column], column))
+        if status is not None and where is None:
+            columns.append("sale_status_desc")
+        if "created_at" in ranges:
+            columns.append("created_at")
+        elif ranges:
+            columns.append(ranges[0])
+        if not columns:
+            # Só o status fixo: índice parcial por data, para os dashboards por período.
+            columns = ["created_at"]
+
+        include = [column for column in read if column not in columns]
+        if where:
+            # O predicado do índice parcial já fixa o status.
+            include = [column for column in include if column != "sale_status_desc"]
+        _merge(recommendations, "sales", columns, include, where, count, shape_samples)
+
+    result = []
+    for entry in recommendations.values():
+        if entry["queries"] < min_queries:
+            continue
+        include = sorted(entry["include"] - set(entry["columns"]))
+        entry["include"] = include
+        entry["ddl"] = index_ddl(entry["table"], entry["columns"], include, entry["where"])
+        result.append(entry)
+
+    return sorted(result, key=lambda entry: -entry["queries"])
+
+
+def _plan_cost(connection, statement):
+    plan = parse_plan(connection.execute(Explain(statement)).scalar())
+    return plan["Plan"]["Total Cost"]
+
+
+def hypopg_available(connection):
+    return connection.execute(
+        text("SELECT 1 FROM pg_extension WHERE extname = 'hypopg'")
+    ).first() is not None
+
+
+def evaluate(connection, recommendation):
+    """
+    Estima o ganho de um índice sugerido com um índice hipotético (hypopg):
+    compara o custo estimado das consultas de exemplo sem e com o índice.
+    Nada é criado de fato; os índices hipotéticos valem só para a sessão.
+    Tudo roda em um savepoint: uma falha (DDL inválida, EXPLAIN) desfaz só
+    ele e não aborta a transação usada pelas outras sugestões. Os índices
+    hipotéticos ficam fora da transação, então o reset vem depois.
+    """
+    statements = [QueryBuilder(sample).build() for sample in recommendation["samples"]]
+    try:
+        with connection.begin_nested():
+            before = [_plan_cost(connection, statement) for statement in statements]
+            connection.execute(select(func.hypopg_create_index(recommendation["ddl"]))).all()
+            after = [_plan_cost(connection, statement) for statement in statements]
+    finally:
+        connection.execute(select(func.hypopg_reset())).all()
+
+    total_before = sum(before)
+    total_after = sum(after)
+    return {
+        "cost_before": total_before,
+        "cost_after": total_after,
+        "improvement": 1 - total_after / total_before if total_before else 0.0,
+    }
+
+
+def evaluate_all(connection, recommendations):
+    """Avalia cada sugestão, ou explica por que não foi possível."""
+    if not hypopg_available(connection):
+        for entry in recommendations:
+            entry["evaluation"] = {"error": "hypopg extension is not installed"}
+        return recommendations
+
+    for entry in recommendations:
+        try:
+            entry["evaluation"] = evaluate(connection, entry)
+        except Exception as e:
+            entry["evaluation"] = {"error": str(e)}
+    return recommendations
+
+
+workload_stats = WorkloadStats()
@@ -0,0 +1,206 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from starlette.datastructures import MutableHeaders
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limites dos buckets em segundos, de 0,5 ms a 10 s.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Timing:
+    """
+    Tempos por etapa de uma requisição: validação, cache, montagem da
+    consulta, checkout do pool, compilação do SQL, execução no banco,
+    leitura das linhas, materialização do resultado e serialização.
+    Etapas repetidas (ex. várias consultas em um batch) são somadas.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.shape = None
+        self.returned = None
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def header(self, total):
+        """Valor do header Server-Timing, com as durações em milissegundos."""
+        parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(parts)
+
+
+current_timing = ContextVar("current_timing", default=None)
+
+
+def record_stage(name, seconds):
+    """Soma a duração à etapa da requisição corrente (sem requisição, não faz nada)."""
+    timing = current_timing.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def query_shape(query_request) -> str:
+    """Formato da consulta para as métricas: o conjunto de dimensões."""
+    dimensions = sorted(dim_enum.value for dim_enum in query_request.dimensions)
+    return ",".join(dimensions) or "none"
+
+
+def handler_started(shape):
+    """
+    Chamada no início do endpoint: o tempo desde a chegada da requisição
+    (leitura do corpo e validação do Pydantic) vira a etapa `validation`.
+    """
+    timing = current_timing.get()
+    if timing is not None:
+        timing.add("validation", time.perf_counter() - timing.started)
+        timing.shape = shape
+
+
+def handler_returned():
+    """Marca o fim do endpoint; o que falta até a resposta é a serialização."""
+    timing = current_timing.get()
+    if timing is not None:
+        timing.returned = time.perf_counter()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Histograma cumulativo no formato do Prometheus, por combinação de labels."""
+    def __init__(self, name, description, label_names=(), buckets=BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, value):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            series["counts"][position] += 1
+            series["sum"] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(s["counts"]), s["sum"]) for labels, s in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = _labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{plain} {total}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+class QueryMetrics:
+    """Histogramas das consultas analíticas e do checkout do pool."""
+    def __init__(self):
+        self.stages = Histogram(
+            "analytics_stage_duration_seconds",
+            "Duration of each stage of the analytics query pipeline.",
+            ("stage",),
+        )
+        self.shapes = Histogram(
+            "analytics_query_duration_seconds",
+            "Total duration of analytics requests by query shape (dimension set).",
+            ("shape",),
+        )
+        self.pool_wait = Histogram(
+            "db_pool_wait_seconds",
+            "Time spent checking a connection out of the pool.",
+        )
+
+    def observe(self, timing: Timing, total):
+        """Só requisições de consulta (que definiram um formato) entram nos histogramas."""
+        if timing.shape is None:
+            return
+        for name, seconds in list(timing.stages.items()):
+            self.stages.observe((name,), seconds)
+        self.shapes.observe((timing.shape,), total)
+
+    def render(self, pool):
+        lines = self.stages.render() + self.shapes.render() + self.pool_wait.render()
+        gauges = (
+            ("db_pool_size", "Configured size of the connection pool.", pool["size"]),
+            ("db_pool_checked_out", "Connections currently checked out.", pool["checked_out"]),
+            ("db_pool_overflow", "Connections open beyond the pool size.", pool["overflow"]),
+            ("db_pool_checked_in", "Idle connections in the pool.", pool["checked_in"]),
+        )
+        for name, description, value in gauges:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+query_metrics = QueryMetrics()
+
+
+def record_checkout(seconds):
+    query_metrics.pool_wait.observe((), seconds)
+    record_stage("pool", seconds)
+
+
+class TimingMiddleware:
+    """
+    Middleware ASGI que cria o Timing de cada requisição, acrescenta o
+    header Server-Timing à resposta e alimenta os histogramas. Não usa
+    BaseHTTPMiddleware para não criar uma task extra por requisição.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = Timing()
+        token = current_timing.set(timing)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                now = time.perf_counter()
+                if timing.returned is not None:
+                    timing.add("serialize", now - timing.returned)
+                total = now - timing.started
+                MutableHeaders(scope=message).append("Server-Timing", timing.header(total))
+                query_metrics.observe(timing, total)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timing.reset(token)
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import threading
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.services.search import PrefixIndex
+
+# Listas do catálogo: nome -> SQL. Todas leem tabelas de dimensão pequenas;
+# os status de venda são tratados à parte, pois só existem em `sales`.
+DIMENSION_QUERIES = {
+    "channels": "SELECT DISTINCT name FROM channels ORDER BY name",
+    "stores": "SELECT id, name FROM stores WHERE is_active = true ORDER BY name",
+    "products": "SELECT id, name FROM products ORDER BY name",
+    "payment_types": "SELECT DISTINCT description FROM payment_types ORDER BY description",
+}
+
+# Listas de objetos {id, name}; as demais são listas de strings.
+OBJECT_LISTS = ("stores", "products")
+
+DIMENSION_TABLES = ("channels", "stores", "products", "payment_types")
+
+# Marcador barato de mudança: contadores de escrita das tabelas de dimensão
+# (estatísticas do Postgres, sem ler as tabelas) e o maior id de `sales`.
+CHANGE_MARKER = text("""
+    SELECT relname, n_tup_ins + n_tup_upd + n_tup_del
+    FROM pg_stat_user_tables
+    WHERE relname IN ('channels', 'stores', 'products', 'payment_types')
+""")
+SALES_HIGH_WATER_MARK = text("SELECT coalesce(max(id), 0) FROM sales")
+
+# Status distintos por skip scan: cada passo busca o próximo valor pelo
+# índice em vez de ler a tabela inteira como um SELECT DISTINCT.
+ALL_STATUSES = text("""
+    WITH RECURSIVE statuses AS (
+        SELECT min(sale_status_desc) AS status FROM sales
+        UNION ALL
+        SELECT (SELECT min(sale_status_desc) FROM sales WHERE sale_status_desc > statuses.status)
+        FROM statuses WHERE statuses.status IS NOT NULL
+    )
+    SELECT status FROM statuses WHERE status IS NOT NULL
+""")
+NEW_STATUSES = text("SELECT DISTINCT sale_status_desc FROM sales WHERE id > :last_id")
+
+
+def _etag(payload) -> str:
+    """ETag forte: hash do conteúdo serializado."""
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+class OptionsCatalog:
+    """
+    Listas de opções dos filtros (canais, lojas ativas, produtos, formas de
+    pagamento e status) mantidas em memória, cada uma com seu ETag, e os
+    índices de busca por prefixo das listas de objetos (lojas e produtos).
+    `refresh` só relê as tabelas de dimensão cujos contadores de escrita
+    mudaram e busca status novos apenas entre as vendas inseridas desde a
+    última leitura.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.lists = {}
+        self.etags = {}
+        self.etag = None
+        self.indexes = {}
+        self._dimension_marker = {}
+        self._last_sale_id = None
+
+    @property
+    def loaded(self):
+        return self.etag is not None
+
+    def refresh(self) -> bool:
+        """Atualiza o que mudou desde a última chamada; retorna True se algo mudou."""
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        with engine.connect() as connection:
+            marker = dict(connection.execute(CHANGE_MARKER).all())
+            last_sale_id = connection.execute(SALES_HIGH_WATER_MARK).scalar()
+
+            updates = {}
+            for name in DIMENSION_TABLES:
+                if name not in self.lists or marker.get(name) != self._dimension_marker.get(name):
+                    rows = connection.execute(text(DIMENSION_QUERIES[name])).all()
+                    if name in OBJECT_LISTS:
+                        updates[name] = [{"id": row[0], "name": row[1]} for row in rows]
+                    else:
+                        updates[name] = [row[0] for row in rows]
+
+            if self._last_sale_id is None:
+                updates["sale_status"] = [row[0] for row in connection.execute(ALL_STATUSES)]
+            elif last_sale_id > self._last_sale_id:
+                new = {row[0] for row in connection.execute(NEW_STATUSES, {"last_id": self._last_sale_id})}
+                if not new <= set(self.lists["sale_status"]):
+                    updates["sale_status"] = sorted(set(self.lists["sale_status"]) | new)
+
+        with self._lock:
+            self._dimension_marker = marker
+            self._last_sale_id = last_sale_id
+            changed = False
+            for name, values in updates.items():
+                if self.lists.get(name) != values:
+                    self.lists[name] = values
+                    self.etags[name] = _etag(values)
+                    if name in OBJECT_LISTS:
+                        self.indexes[name] = PrefixIndex(values)
+                    changed = True
+            if changed or self.etag is None:
+                self.etag = _etag(self.lists)
+            return changed
+
+    def get(self, name=None):
+        """Uma lista (ou o catálogo inteiro, com `name=None`) e seu ETag."""
+        with self._lock:
+            if name is None:
+                return dict(self.lists), self.etag
+            return self.lists[name], self.etags[name]
+
+    def search(self, name, term, limit, offset=0):
+        """Busca por nome em uma lista de objetos; retorna (itens, has_more)."""
+        with self._lock:
+            index = self.indexes[name]
+        return index.search(term, limit, offset)
+
+
+options_catalog = OptionsCatalog()
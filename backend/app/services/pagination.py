@@ -0,0 +1,78 @@
+import base64
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from app.schemas import AnalyticsQuery
+
+
+class InvalidCursor(ValueError):
+    """O cursor de paginação é inválido ou pertence a outra consulta."""
+
+
+def query_fingerprint(query_request: AnalyticsQuery) -> str:
+    """Identifica a consulta paginada, ignorando o cursor da página atual."""
+    from app.services.cache import build_cache_key
+
+    key = build_cache_key(query_request.model_copy(update={"cursor": None}))
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def _encode_value(value):
+    """Serializa um valor da chave de ordenação preservando o tipo."""
+    if value is None:
+        return ["null", None]
+    if isinstance(value, bool):
+        return ["bool", value]
+    if isinstance(value, int):
+        return ["int", value]
+    if isinstance(value, Decimal):
+        return ["decimal", str(value)]
+    if isinstance(value, float):
+        return ["float", value]
+    if isinstance(value, datetime):
+        return ["datetime", value.isoformat()]
+    if isinstance(value, date):
+        return ["date", value.isoformat()]
+    return ["str", str(value)]
+
+
+_DECODERS = {
+    "null": lambda v: None,
+    "bool": bool,
+    "int": int,
+    "decimal": Decimal,
+    "float": float,
+    "datetime": datetime.fromisoformat,
+    "date": date.fromisoformat,
+    "str": str,
+}
+
+
+def encode_cursor(query_request: AnalyticsQuery, values) -> str:
+    """Gera o token opaco que aponta para a linha seguinte a `values`."""
+    payload = {
+        "q": query_fingerprint(query_request),
+        "k": [_encode_value(v) for v in values],
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(query_request: AnalyticsQuery):
+    """
+    Decodifica o cursor da requisição e retorna os valores da chave de
+    ordenação da última linha da página anterior.
+    """
+    token = query_request.cursor
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        values = [_DECODERS[kind](value) for kind, value in payload["k"]]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Malformed pagination cursor")
+
+    if payload.get("q") != query_fingerprint(query_request):
+        raise InvalidCursor("Pagination cursor does not match this query")
+    return values
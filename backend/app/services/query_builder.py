@@ -8,15 +8,41 @@ from sqlalchemy import (
     String,
     DateTime,
     Numeric,
+    Date,
+    SmallInteger,
+    BigInteger,
     desc,
     asc,
+    cast,
+    union_all,
+    tuple_,
+    and_,
+    or_,
+    bindparam,
+    case,
+)
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from itertools import combinations
+from app.core.config import settings
+from app.schemas import AnalyticsQuery, DimensionField, MetricFunction, SubtotalMode
+from app.services.pagination import decode_cursor, InvalidCursor
+from app.services.approximate import (
+    sampled_table,
+    replace_tables,
+    sampled_metric,
+    lower_bound,
+    approximate_distinct,
+    exact_margin,
+    error_column,
+    sample_description,
 )
-from app.schemas import AnalyticsQuery, DimensionField, MetricFunction
 
 metadata = MetaData()
 
 sales = Table('sales', metadata,
-    Column('id', Integer, primary_key=True),
+    Column('id', BigInteger, primary_key=True),
     Column('store_id', Integer),
     Column('channel_id', Integer),
     Column('customer_id', Integer),
@@ -25,6 +51,10 @@ sales = Table('sales', metadata,
     Column('delivery_fee', Numeric),
     Column('created_at', DateTime),
     Column('sale_status_desc', String),
+    # Colunas geradas a partir de created_at (ver 04-time-dimensions.sql).
+    Column('sale_date', Date),
+    Column('hour_of_day', SmallInteger),
+    Column('day_of_week', SmallInteger),
 )
 
 stores = Table('stores', metadata,
@@ -38,8 +68,8 @@ channels = Table('channels', metadata,
 )
 
 product_sales = Table('product_sales', metadata,
-    Column('id', Integer, primary_key=True),
-    Column('sale_id', Integer),
+    Column('id', BigInteger, primary_key=True),
+    Column('sale_id', BigInteger),
     Column('product_id', Integer),
 )
 
@@ -49,8 +79,8 @@ products = Table('products', metadata,
 )
 
 payments = Table('payments', metadata,
-    Column('id', Integer, primary_key=True),
-    Column('sale_id', Integer),
+    Column('id', BigInteger, primary_key=True),
+    Column('sale_id', BigInteger),
     Column('payment_type_id', Integer),
 )
 
@@ -65,7 +95,7 @@ FIELD_MAP = {
     "product_name": products.c.id,
     "payment_type": payment_types.c.description,
     "sale_status": sales.c.sale_status_desc,
-    "sale_date": func.date(sales.c.created_at),
+    "sale_date": func.date(sales.c.created_at, type_=Date),
     
     "day_of_week": func.extract('isodow', sales.c.created_at),
     "hour_of_day": func.extract('hour', sales.c.created_at),
@@ -76,42 +106,711 @@ FIELD_MAP = {
     "sale_id": sales.c.id,
 }
 
+# Com SALES_TIME_COLUMNS, as dimensões de tempo leem as colunas geradas
+# (indexadas) em vez de calcular a expressão sobre created_at em cada linha.
+TIME_COLUMNS_FIELD_MAP = {
+    **FIELD_MAP,
+    "sale_date": sales.c.sale_date,
+    "day_of_week": sales.c.day_of_week,
+    "hour_of_day": sales.c.hour_of_day,
+}
+
+# Agregados por hora mantidos por `refresh_rollups.py` (ver 03-rollups.sql).
+sales_daily_rollup = Table('sales_daily_rollup', metadata,
+    Column('store_id', Integer, primary_key=True),
+    Column('channel_id', Integer, primary_key=True),
+    Column('sale_status_desc', String, primary_key=True),
+    Column('hour_start', DateTime, primary_key=True),
+    Column('sale_date', Date),
+    Column('hour_of_day', SmallInteger),
+    Column('day_of_week', SmallInteger),
+    Column('sale_count', BigInteger),
+    Column('total_amount_sum', Numeric),
+    Column('total_amount_count', BigInteger),
+    Column('total_discount_sum', Numeric),
+    Column('total_discount_count', BigInteger),
+    Column('delivery_fee_sum', Numeric),
+    Column('delivery_fee_count', BigInteger),
+)
+
+rollup_refresh_state = Table('rollup_refresh_state', metadata,
+    Column('rollup_name', String, primary_key=True),
+    Column('last_sale_id', BigInteger),
+    Column('pending_sale_id', BigInteger),
+    Column('pending_xmax', BigInteger),
+    Column('last_change_id', BigInteger),
+    Column('pending_change_id', BigInteger),
+    Column('pending_change_xmax', BigInteger),
+    Column('refreshed_at', DateTime),
+)
+
+# Vendas alteradas ou removidas depois de inseridas, gravadas por trigger
+# (ver 06-sales-changes.sql) com a loja e o created_at de antes e de depois.
+sales_changes = Table('sales_changes', metadata,
+    Column('id', BigInteger, primary_key=True),
+    Column('sale_id', BigInteger),
+    Column('store_id', Integer),
+    Column('created_at', DateTime),
+    Column('changed_at', DateTime),
+)
+
+ROLLUP_NAME = 'sales_daily_rollup'
+
+ONE_HOUR = timedelta(hours=1)
+
+# Métricas aditivas que o rollup guarda como soma + contagem de não nulos.
+ROLLUP_MEASURES = ('total_amount', 'total_discount', 'delivery_fee')
+
+
+def rollup_aggregate(*conditions):
+    """
+    Agrega as vendas no grão do rollup (loja, canal, status e hora).
+    Usado tanto no refresh incremental quanto para cobrir as vendas
+    que ainda não entraram no rollup.
+    """
+    hour_start = func.date_trunc('hour', sales.c.created_at)
+    measures = []
+    for name in ROLLUP_MEASURES:
+        column = sales.c[name]
+        measures.append(func.sum(column).label(f"{name}_sum"))
+        measures.append(func.count(column).label(f"{name}_count"))
+
+    return (
+        select(
+            sales.c.store_id,
+            sales.c.channel_id,
+            sales.c.sale_status_desc,
+            hour_start.label('hour_start'),
+            func.date(hour_start).label('sale_date'),
+            func.extract('hour', hour_start).label('hour_of_day'),
+            func.extract('isodow', hour_start).label('day_of_week'),
+            func.count().label('sale_count'),
+            *measures,
+        )
+        .where(*conditions)
+        .group_by(
+            sales.c.store_id,
+            sales.c.channel_id,
+            sales.c.sale_status_desc,
+            hour_start,
+        )
+    )
+
+
+def changed_hours(after_change_id, upper_change_id=None):
+    """
+    Subquery com o início de cada hora que teve vendas alteradas ou removidas
+    no log `sales_changes` depois de `after_change_id` (até `upper_change_id`).
+    """
+    conditions = [sales_changes.c.id > after_change_id]
+    if upper_change_id is not None:
+        conditions.append(sales_changes.c.id <= upper_change_id)
+    hour_start = func.date_trunc('hour', sales_changes.c.created_at, type_=DateTime)
+    return select(hour_start.label('hour_start')).where(*conditions).distinct().subquery('changed_hours')
+
+
+def in_changed_hours(hours):
+    """
+    Junta `sales` às horas de `changed_hours` por intervalo de created_at, que
+    usa o índice (e a poda de partições) hora a hora em vez de ler a tabela.
+    """
+    created_at = sales.c.created_at
+    return and_(created_at >= hours.c.hour_start, created_at < hours.c.hour_start + ONE_HOUR)
+
+
+def _build_rollup_source():
+    """
+    Une o rollup materializado com as vendas posteriores ao último refresh,
+    para que a leitura pelo rollup retorne o mesmo que a leitura de `sales`.
+    Horas com vendas alteradas ou removidas depois do último refresh saem
+    do rollup e são agregadas de novo a partir de `sales`.
+    """
+    state = rollup_refresh_state.c
+    high_water_mark = (
+        select(func.coalesce(func.max(state.last_sale_id), 0))
+        .where(state.rollup_name == ROLLUP_NAME)
+        .scalar_subquery()
+    )
+    change_mark = (
+        select(func.coalesce(func.max(state.last_change_id), 0))
+        .where(state.rollup_name == ROLLUP_NAME)
+        .scalar_subquery()
+    )
+    stale = changed_hours(change_mark)
+    materialized = select(sales_daily_rollup).where(
+        sales_daily_rollup.c.hour_start.not_in(select(stale.c.hour_start))
+    )
+    pending = rollup_aggregate(sales.c.id > high_water_mark)
+    corrected = rollup_aggregate(sales.c.id <= high_water_mark, in_changed_hours(stale))
+    return union_all(materialized, pending, corrected).subquery('sales_rollup')
+
+
+ROLLUP_SOURCE = _build_rollup_source()
+
+ROLLUP_FIELD_MAP = {
+    "store_name": ROLLUP_SOURCE.c.store_id,
+    "channel_name": channels.c.name,
+    "sale_status": ROLLUP_SOURCE.c.sale_status_desc,
+    "sale_date": ROLLUP_SOURCE.c.sale_date,
+    "day_of_week": ROLLUP_SOURCE.c.day_of_week,
+    "hour_of_day": ROLLUP_SOURCE.c.hour_of_day,
+}
+
+
+# Lados um-para-muitos de `sales`: campo -> (tabela ponte, tabela da dimensão,
+# condição do join, coluna filtrada/contada, coluna exibida). São pré-agregados
+# por venda antes do join para que métricas de `sales` não sejam repetidas por
+# item ou pagamento. A chave de produto é lida da própria ponte (`product_id`),
+# então filtrar por produto não precisa do join com `products`.
+ONE_TO_MANY = {
+    "product_name": (
+        product_sales, products,
+        product_sales.c.product_id == products.c.id,
+        product_sales.c.product_id,
+        products.c.name,
+    ),
+    "payment_type": (
+        payments, payment_types,
+        payments.c.payment_type_id == payment_types.c.id,
+        payment_types.c.description,
+        payment_types.c.description,
+    ),
+}
+
+FILTER_OPERATORS = {
+    "equals": lambda c, v: c == v,
+    "not_equals": lambda c, v: c != v,
+    "greater_than": lambda c, v: c > v,
+    "less_than": lambda c, v: c < v,
+    "in": lambda c, v: c.in_(v),
+}
+
+
+# Coluna com o indicador de agrupamento das consultas com GROUPING SETS.
+GROUPING_COLUMN = "grouping_id"
+
+
+def grouping_mask(dimensions, grouping_set):
+    """Valor de GROUPING(dimensões...) nas linhas agrupadas por `grouping_set`."""
+    mask = 0
+    for name in dimensions:
+        mask = (mask << 1) | (name not in grouping_set)
+    return mask
+
+
+class InvalidQuery(ValueError):
+    """A requisição não pode ser convertida em SQL (ex. subtotais inválidos)."""
+
+
+def subtotal_sets(query_request: AnalyticsQuery):
+    """
+    Conjuntos de dimensões pedidos em `subtotals`: ROLLUP gera os prefixos
+    das dimensões (do detalhe ao total geral), CUBE todas as combinações e
+    `grouping_sets` usa a lista enviada. Retorna None sem subtotais.
+    """
+    subtotals = query_request.subtotals
+    if subtotals is None:
+        return None
+
+    dimensions = [dim_enum.value for dim_enum in query_request.dimensions]
+    if not dimensions:
+        raise InvalidQuery("Subtotals need at least one dimension")
+    if query_request.page_size:
+        raise InvalidQuery("Subtotals cannot be combined with page_size")
+
+    if subtotals.mode == SubtotalMode.ROLLUP:
+        sets = [tuple(dimensions[:size]) for size in range(len(dimensions), -1, -1)]
+    elif subtotals.mode == SubtotalMode.CUBE:
+        sets = [
+            subset
+            for size in range(len(dimensions), -1, -1)
+            for subset in combinations(dimensions, size)
+        ]
+    else:
+        if not subtotals.grouping_sets:
+            raise InvalidQuery("grouping_sets mode needs a list of grouping sets")
+        sets = []
+        for grouping_set in subtotals.grouping_sets:
+            names = [dim_enum.value for dim_enum in grouping_set]
+            unknown = set(names) - set(dimensions)
+            if unknown:
+                raise InvalidQuery(f"Grouping set uses fields outside dimensions: {sorted(unknown)}")
+            # Mantém a ordem das dimensões para que sets iguais coincidam.
+            grouping_set = tuple(name for name in dimensions if name in names)
+            if grouping_set not in sets:
+                sets.append(grouping_set)
+        unused = [name for name in dimensions if not any(name in grouping_set for grouping_set in sets)]
+        if unused:
+            raise InvalidQuery(f"Dimensions missing from every grouping set: {unused}")
+
+    # Produtos e pagamentos entram por uma subquery com uma linha por venda e
+    # valor; um subtotal sem eles somaria a mesma venda uma vez por item.
+    for name in dimensions:
+        if name in ONE_TO_MANY and any(name not in grouping_set for grouping_set in sets):
+            raise InvalidQuery(f"Subtotals must keep '{name}' in every grouping set")
+    return sets
+
+
+NUMERIC_FIELDS = [
+    'product_name',
+    'store_name',
+    'hour_of_day',
+    'day_of_week',
+]
+
+DATE_FIELDS = [
+    'sale_date',
+]
+
+TEXT_FIELDS = [
+    'channel_name',
+    'payment_type',
+    'sale_status',
+]
+
+
+def normalize_filter_value(f):
+    """
+    Converte o valor de um filtro para o formato usado na query:
+    listas para o operador 'in', inteiros para campos numéricos, `date`
+    para campos de data e texto para campos de texto. Retorna None quando
+    o filtro deve ser ignorado.
+    """
+    value = f.value
+
+    if f.operator == "in":
+        if isinstance(value, str):
+            value_list = [item.strip() for item in value.split(',')]
+            value = [item for item in value_list if item]
+
+        if isinstance(value, list) and f.field in NUMERIC_FIELDS:
+            try:
+                value = [int(v) for v in value]
+            except (ValueError, TypeError):
+                return None
+
+        if isinstance(value, list) and f.field in DATE_FIELDS:
+            try:
+                value = [_parse_day(v).date() for v in value]
+            except (ValueError, TypeError):
+                return None
+
+        if isinstance(value, list) and f.field in TEXT_FIELDS:
+            value = [str(v) for v in value]
+
+    elif f.field in NUMERIC_FIELDS:
+        try:
+            value = int(value)
+        except (ValueError, TypeError):
+            return None
+
+    elif f.field in DATE_FIELDS:
+        try:
+            value = _parse_day(value).date()
+        except (ValueError, TypeError):
+            return None
+
+    elif f.field in TEXT_FIELDS and value is not None:
+        value = str(value)
+
+    return value
+
+
+def filter_value(f):
+    """
+    Valor de um filtro pronto para o bind: lista só no operador 'in'.
+    Retorna None quando o filtro deve ser ignorado.
+    """
+    value = normalize_filter_value(f)
+    if f.operator not in FILTER_OPERATORS or value is None:
+        return None
+    if (f.operator == "in") != isinstance(value, list):
+        return None
+    return value
+
+
+def _parse_day(value):
+    """Converte '2025-01-05' (ou um datetime ISO) no início do dia."""
+    if isinstance(value, datetime):
+        value = value.date()
+    if not isinstance(value, date):
+        value = date.fromisoformat(str(value).strip()[:10])
+    return datetime.combine(value, time.min)
+
+
+def sale_date_ranges(f):
+    """
+    Reescreve um filtro em `sale_date` (date(created_at)) como intervalos
+    [início, fim) sobre `created_at`, que o Postgres consegue usar no índice
+    e na poda de partições mensais; None marca o lado aberto. Retorna None
+    quando não há reescrita equivalente (ex. not_equals ou data inválida);
+    aí o filtro segue sobre a expressão.
+    """
+    one_day = timedelta(days=1)
+    try:
+        if f.operator == "in":
+            values = f.value.split(',') if isinstance(f.value, str) else f.value
+            days = sorted({_parse_day(v) for v in values if str(v).strip()})
+            if not days:
+                return None
+            return [(day, day + one_day) for day in days]
+        day = _parse_day(f.value)
+    except (TypeError, ValueError):
+        return None
+
+    if f.operator == "equals":
+        return [(day, day + one_day)]
+    if f.operator == "greater_than":
+        return [(day + one_day, None)]
+    if f.operator == "less_than":
+        return [(None, day)]
+    return None
+
+
+def time_span(query_request: AnalyticsQuery):
+    """
+    Maior intervalo de `created_at` que a requisição pode ler: o menor entre
+    o período e os filtros em `sale_date` com os dois lados fechados. None
+    quando nada limita o período.
+    """
+    spans = []
+    if query_request.time_range:
+        spans.append(query_request.time_range.end_date - query_request.time_range.start_date)
+    for f in query_request.filters or []:
+        ranges = sale_date_ranges(f) if f.field == "sale_date" else None
+        if ranges and all(start is not None and end is not None for start, end in ranges):
+            spans.append(max(end for _, end in ranges) - min(start for start, _ in ranges))
+    return min(spans) if spans else None
+
+
+def wide_range(query_request: AnalyticsQuery) -> bool:
+    """
+    Se a amostra compensa: sem limite de período ou com pelo menos
+    APPROX_MIN_RANGE_DAYS dias. A amostra SYSTEM lê uma fração fixa das
+    páginas da tabela inteira; um período curto lê menos pelo índice.
+    """
+    span = time_span(query_request)
+    return span is None or span >= timedelta(days=settings.APPROX_MIN_RANGE_DAYS)
+
+
+def query_params(query_request: AnalyticsQuery, use_rollup: bool = False):
+    """
+    Valores da requisição que entram na consulta, pelo nome do parâmetro.
+    O QueryBuilder só lê valores daqui, então requisições com o mesmo
+    formato e os mesmos nomes geram o mesmo SQL e diferem apenas nos binds.
+    Filtros ignorados não geram parâmetro.
+    """
+    params = {}
+    time_range = query_request.time_range
+    if time_range:
+        params["time_start"] = time_range.start_date
+        if _is_hour_aligned(time_range):
+            # Horas inteiras viram [início, próxima hora), igual no rollup e em `sales`.
+            params["time_before"] = time_range.end_date.replace(minute=0, second=0, microsecond=0) + ONE_HOUR
+        else:
+            params["time_end"] = time_range.end_date
+
+    for position, f in enumerate(query_request.filters or []):
+        name = f"filter_{position}"
+        ranges = sale_date_ranges(f) if f.field == "sale_date" and not use_rollup else None
+        if ranges is not None:
+            for index, (start, end) in enumerate(ranges):
+                if start is not None:
+                    params[f"{name}_{index}_start"] = start
+                if end is not None:
+                    params[f"{name}_{index}_end"] = end
+            continue
+        value = filter_value(f)
+        if value is not None:
+            params[name] = value
+
+    if query_request.page_size:
+        params["page_size"] = query_request.page_size
+        if query_request.cursor:
+            for position, value in enumerate(decode_cursor(query_request)):
+                params[f"cursor_{position}"] = value
+    elif query_request.limit and query_request.limit > 0:
+        params["limit"] = query_request.limit
+    return params
+
+
+def _is_hour_aligned(time_range):
+    """
+    Verifica se o intervalo cobre apenas horas inteiras: início em hh:00:00
+    e fim em hh:59:59.999 (o formato enviado pelo DateRangePicker). Esses
+    intervalos são lidos como [início, próxima hora) tanto no rollup quanto
+    em `sales`, então vendas no último milissegundo da hora entram nos dois.
+    """
+    start = time_range.start_date
+    end = time_range.end_date
+
+    for value in (start, end):
+        offset = value.utcoffset()
+        if offset is not None and offset.total_seconds() % 3600:
+            return False
+
+    starts_on_hour = start.minute == 0 and start.second == 0 and start.microsecond == 0
+    ends_on_hour = end.minute == 59 and end.second == 59 and end.microsecond >= 999000
+    return starts_on_hour and ends_on_hour
+
 
 class QueryBuilder:
     """
     Constrói uma consulta SQL analítica de forma dinâmica e segura
     a partir de um objeto de requisição AnalyticsQuery.
     """
-    def __init__(self, query_request: AnalyticsQuery):
+    def __init__(self, query_request: AnalyticsQuery, backend: str = "postgres", grouping_sets=None):
         self.request = query_request
-        self.query = select().select_from(sales)
-        self.joined_tables = {sales}
+        # Conjuntos de dimensões agrupados em uma só varredura (GROUPING SETS);
+        # None agrupa por todas as dimensões da requisição.
+        self.grouping_sets = grouping_sets if grouping_sets is not None else subtotal_sets(query_request)
+        # A cópia colunar (backend "duckdb") não tem o rollup e sempre
+        # grava as dimensões de tempo como colunas.
+        self.backend = backend
+        self.use_rollup = backend == "postgres" and settings.ROLLUPS_ENABLED and self._can_use_rollup()
+        # Modo aproximado: no Postgres lê uma amostra de `sales` (o rollup,
+        # quando serve, já é exato e barato); no DuckDB usa HyperLogLog.
+        # Períodos curtos seguem exatos: o TABLESAMPLE não usa o índice de
+        # created_at e leria mais que a consulta exata (ver `wide_range`).
+        self.approximate = bool(query_request.approximate)
+        self.sampled = (
+            self.approximate and backend == "postgres" and not self.use_rollup and wide_range(query_request)
+        )
+        self.hyperloglog = self.approximate and backend != "postgres"
+        # Cópias de `sales` a trocar pela amostra ao fim do build.
+        self.samples = {}
+        self.params = query_params(query_request, self.use_rollup)
+        if self.use_rollup:
+            self.fact = ROLLUP_SOURCE
+            self.field_map = ROLLUP_FIELD_MAP
+        else:
+            self.fact = sales
+            time_columns = backend != "postgres" or settings.SALES_TIME_COLUMNS
+            self.field_map = TIME_COLUMNS_FIELD_MAP if time_columns else FIELD_MAP
+        self.query = select().select_from(self.fact)
+        self.joined_tables = {self.fact}
+        self.metric_columns = {}
+        self.sort_keys = []
+        self.one_to_many = {}
+        self.semi_joins = {}
+        self.exact_counts = True
+        # Marcadores da primeira linha de cada venda nas subqueries que levam
+        # a chave contada; somas e médias de `sales` só leem essa linha.
+        self.first_rows = []
 
     def build(self):
         """
         Orquestra a construção da query completa, aplicando cada parte
-        na ordem correta para garantir a validade do SQL.
+        na ordem correta para garantir a validade do SQL. Se uma requisição
+        com o mesmo formato já foi montada, reaproveita a consulta do
+        `statement_cache` e troca só os valores dos parâmetros.
         """
+        key = self._shape_key() if statement_cache.max_entries > 0 else None
+        cached = statement_cache.get(key) if key is not None else None
+        if cached is not None:
+            template, sort_keys = cached
+            self.sort_keys = list(sort_keys)
+            self.query = template.params(self.params)
+            return self.query
+
+        if not self.use_rollup:
+            self._plan_one_to_many()
         self._apply_metrics_and_dimensions()
         self._apply_time_range()
         self._apply_filters()
         self._apply_group_by()
-        self._apply_order_by()
-        self._apply_limit()
+        if self.request.page_size:
+            self._apply_pagination()
+        else:
+            self._apply_order_by()
+            self._apply_limit()
+
+        if self.sampled:
+            # A consulta é montada sobre `sales` e só no fim cada cópia da
+            # tabela é trocada pela amostra, com a mesma semente em todas.
+            self.samples[sales] = sampled_table(sales, "sales_sample")
+            self.query = replace_tables(self.query, self.samples)
 
+        if key is not None:
+            statement_cache.set(key, (self.query, list(self.sort_keys)))
         return self.query
 
+    @property
+    def approximation(self):
+        """
+        Como os valores de uma requisição `approximate` foram obtidos: pela
+        amostra (com as margens de erro), pelo rollup (exato), pela consulta
+        exata (períodos curtos) ou, no DuckDB, com contagens distintas por
+        HyperLogLog. None sem `approximate`.
+        """
+        if not self.approximate:
+            return None
+        if self.sampled:
+            lower_bounds = [
+                metric.alias or f"{metric.function}_{metric.field}"
+                for metric in self.request.metrics
+                if metric.field in FIELD_MAP and lower_bound(metric.function, metric.field == "sale_id")
+            ]
+            return sample_description(lower_bounds)
+        if self.use_rollup:
+            return {"method": "rollup"}
+        if self.hyperloglog:
+            return {"method": "hyperloglog"}
+        return {"method": "exact"}
+
+    def _shape_key(self):
+        """
+        Formato da requisição: tudo o que muda a estrutura do SQL. Os
+        valores ficam de fora; só os nomes dos parâmetros entram, pois
+        indicam quais filtros valem e quantos intervalos de data há.
+        """
+        request = self.request
+        order_by = request.order_by
+        return (
+            self.backend,
+            self.use_rollup,
+            self.field_map is TIME_COLUMNS_FIELD_MAP,
+            self.approximate,
+            self.sampled,
+            tuple(dim_enum.value for dim_enum in request.dimensions),
+            tuple((metric.field, metric.function.value, metric.alias) for metric in request.metrics),
+            tuple((f.field, f.operator.value) for f in request.filters or []),
+            (order_by.field, order_by.direction.value) if order_by else None,
+            tuple(self.grouping_sets) if self.grouping_sets is not None else None,
+            tuple(sorted(self.params)),
+        )
+
+    def _param(self, name, type_):
+        """
+        Parâmetro nomeado com o valor da requisição; listas viram IN expandido.
+        O tipo vem da coluna comparada, e não do valor: o template fica no
+        StatementCache e é reusado por requisições do mesmo formato, então
+        o tipo do bind (o cast que o asyncpg recebe) não pode depender do
+        valor de quem montou o template primeiro.
+        """
+        value = self.params[name]
+        return bindparam(name, value, type_=type_, expanding=isinstance(value, list))
+
+    def _filter_condition(self, column, position, f):
+        """
+        Monta a condição do filtro na posição `position` sobre `column`.
+        Retorna None quando o filtro deve ser ignorado.
+        """
+        name = f"filter_{position}"
+        if name not in self.params:
+            return None
+        # Datas vão como `date` (e não texto), que o asyncpg exige para
+        # comparar com date(created_at) ou com o sale_date do rollup.
+        type_ = Date() if f.field in DATE_FIELDS else column.type
+        return FILTER_OPERATORS[f.operator](column, self._param(name, type_))
+
+    def _sale_date_condition(self, position, ranges):
+        """Condição sobre `created_at` para os intervalos de `sale_date_ranges`."""
+        created_at = sales.c.created_at
+        name = f"filter_{position}"
+        conditions = []
+        for index, (start, end) in enumerate(ranges):
+            bounds = []
+            if start is not None:
+                bounds.append(created_at >= self._param(f"{name}_{index}_start", created_at.type))
+            if end is not None:
+                bounds.append(created_at < self._param(f"{name}_{index}_end", created_at.type))
+            conditions.append(and_(*bounds))
+        return or_(*conditions)
+
+    def _plan_one_to_many(self):
+        """
+        Resolve cada lado um-para-muitos usado na requisição sem multiplicar vendas.
+        Quando o campo só é filtrado, vira um semi-join (`sales.id IN (...)`) que
+        lê apenas as linhas da ponte que casam com o filtro. Quando é dimensão,
+        vira uma subquery pré-agregada com uma linha por venda e valor exibido,
+        juntada a `sales`; assim cada venda aparece no máximo uma vez por grupo.
+        Métricas sobre o próprio campo (ex. produtos distintos) levam a chave
+        para a subquery e, como aí a venda pode se repetir, `exact_counts` fica
+        falso e a subquery marca a primeira linha de cada venda (`first_row`),
+        a única lida pelas somas e médias de `sales`.
+        Os filtros do campo, o período e o status entram nas subqueries.
+        """
+        dimensions = {dim_enum.value for dim_enum in self.request.dimensions}
+        metric_fields = {metric.field for metric in self.request.metrics}
+
+        for field, (bridge, table, on, key, label) in ONE_TO_MANY.items():
+            conditions = [
+                condition for condition in (
+                    self._filter_condition(key, position, f)
+                    for position, f in enumerate(self.request.filters or [])
+                    if f.field == field
+                )
+                if condition is not None
+            ]
+            grouped = field in dimensions
+            counted = field in metric_fields
+            if not grouped and not counted and not conditions:
+                continue
+
+            source = bridge
+            if grouped or key.table is table:
+                source = source.join(table, on)
+            scoped_sales = sales.alias(f"{bridge.name}_sales")
+            if self.sampled:
+                self.samples[scoped_sales] = sampled_table(sales, scoped_sales.name)
+            scope = self._sale_scope(scoped_sales)
+            if scope or self.sampled:
+                source = source.join(scoped_sales, scoped_sales.c.id == bridge.c.sale_id)
+            conditions += scope
+
+            if not grouped and not counted:
+                self.semi_joins[field] = sales.c.id.in_(
+                    select(bridge.c.sale_id).select_from(source).where(*conditions)
+                )
+                continue
+
+            columns = [bridge.c.sale_id]
+            grain = [bridge.c.sale_id]
+            if grouped:
+                columns.append(label.label('label'))
+                grain.append(label)
+            if counted:
+                columns.append(key.label('key'))
+                if key is not label or not grouped:
+                    grain.append(key)
+                    # Mesma venda (e rótulo) em várias linhas, uma por chave.
+                    first_row = func.row_number().over(partition_by=grain[:-1], order_by=key) == 1
+                    columns.append(first_row.label('first_row'))
+                self.exact_counts = False
+
+            self.one_to_many[field] = (
+                select(*columns)
+                .select_from(source)
+                .where(*conditions)
+                .group_by(*grain)
+                .subquery(f"sale_{bridge.name}")
+            )
+            if 'first_row' in self.one_to_many[field].c:
+                self.first_rows.append(self.one_to_many[field].c.first_row)
+
+    def _sale_scope(self, scoped_sales):
+        """
+        Condições de período e status da requisição reescritas sobre uma
+        cópia de `sales`, para restringir as subqueries um-para-muitos às
+        vendas que a query externa vai de fato ler.
+        """
+        scope = []
+        if self.request.time_range:
+            scope.append(self._time_condition(scoped_sales.c.created_at))
+        for position, f in enumerate(self.request.filters or []):
+            if f.field == "sale_status":
+                condition = self._filter_condition(scoped_sales.c.sale_status_desc, position, f)
+                if condition is not None:
+                    scope.append(condition)
+        return scope
+
     def _apply_metrics_and_dimensions(self):
         """Constrói a parte do SELECT da query (as colunas e agregações)."""
         selections = []
 
         for dim_enum in self.request.dimensions:
-            if dim_enum.value == "product_name":
-                column = products.c.name
-            elif dim_enum.value == "store_name":
-                column = stores.c.name
-            else:
-                column = FIELD_MAP.get(dim_enum.value)
+            column = self._dimension_column(dim_enum.value)
             if column is not None:
                 selections.append(column.label(dim_enum.value))
                 self._ensure_join(column)
@@ -120,80 +819,144 @@ class QueryBuilder:
             column_to_agg = FIELD_MAP.get(metric.field)
             if column_to_agg is None:
                 continue
+            if metric.field in self.one_to_many:
+                column_to_agg = self.one_to_many[metric.field].c.key
+                self._ensure_join(column_to_agg)
+            elif self.first_rows and metric.function != MetricFunction.COUNT:
+                column_to_agg = case((and_(*self.first_rows), column_to_agg))
 
             alias = metric.alias or f"{metric.function}_{metric.field}"
-            
-            if metric.function == MetricFunction.SUM:
+            # Sem repetição de vendas por grupo, o DISTINCT é desnecessário.
+            distinct = not (metric.field == "sale_id" and self.exact_counts)
+            margin = exact_margin()
+
+            if self.use_rollup:
+                sql_func = self._rollup_metric(metric).label(alias)
+            elif self.sampled:
+                estimate, margin = sampled_metric(
+                    metric.function, column_to_agg, metric.field == "sale_id", distinct
+                )
+                sql_func = estimate.label(alias)
+            elif metric.function == MetricFunction.SUM:
                 sql_func = func.sum(column_to_agg).label(alias)
             elif metric.function == MetricFunction.COUNT:
-                sql_func = func.count(func.distinct(column_to_agg)).label(alias)
+                if not distinct:
+                    sql_func = func.count(column_to_agg).label(alias)
+                elif self.hyperloglog:
+                    estimate, margin = approximate_distinct(column_to_agg)
+                    sql_func = estimate.label(alias)
+                else:
+                    sql_func = func.count(func.distinct(column_to_agg)).label(alias)
             elif metric.function == MetricFunction.AVG:
                 sql_func = func.avg(column_to_agg).label(alias)
             
             selections.append(sql_func)
+            self.metric_columns[alias] = sql_func.element
+            if self.approximate:
+                selections.append(margin.label(error_column(alias)))
 
         self.query = self.query.with_only_columns(*selections)
 
+    def _dimension_column(self, dim_name):
+        """Retorna a coluna exibida e agrupada para uma dimensão."""
+        if dim_name in self.one_to_many:
+            return self.one_to_many[dim_name].c.label
+        if dim_name == "store_name":
+            return stores.c.name
+        return self.field_map.get(dim_name)
+
+    def _rollup_metric(self, metric):
+        """
+        Reescreve uma métrica sobre o rollup: somas e contagens são
+        re-somadas e a média vira soma / contagem, como o AVG do Postgres.
+        """
+        if metric.function == MetricFunction.COUNT:
+            return cast(func.coalesce(func.sum(self.fact.c.sale_count), 0), BigInteger)
+
+        total = func.sum(self.fact.c[f"{metric.field}_sum"])
+        if metric.function == MetricFunction.SUM:
+            return total
+        return total / func.nullif(func.sum(self.fact.c[f"{metric.field}_count"]), 0)
+
+    def _can_use_rollup(self):
+        """
+        Verifica se dimensões, filtros, métricas e período da requisição
+        podem ser respondidos pelo rollup sem alterar o resultado.
+        """
+        request = self.request
+
+        for dim_enum in request.dimensions:
+            if dim_enum.value not in ROLLUP_FIELD_MAP:
+                return False
+
+        for metric in request.metrics:
+            if metric.field not in FIELD_MAP:
+                continue
+            if metric.function == MetricFunction.COUNT:
+                if metric.field != "sale_id":
+                    return False
+            elif metric.field not in ROLLUP_MEASURES:
+                return False
+
+        for f in request.filters or []:
+            if f.field in FIELD_MAP and f.field not in ROLLUP_FIELD_MAP:
+                return False
+
+        if request.order_by:
+            field = request.order_by.field
+            if field in FIELD_MAP and field not in ROLLUP_FIELD_MAP:
+                return False
+
+        if request.time_range and not _is_hour_aligned(request.time_range):
+            return False
+
+        return True
+
     def _apply_time_range(self):
         """Adiciona um filtro de tempo na coluna 'created_at'."""
         if not self.request.time_range:
             return
         
-        start = self.request.time_range.start_date
-        end = self.request.time_range.end_date
-        self.query = self.query.where(sales.c.created_at.between(start, end))
+        if self.use_rollup:
+            self.query = self.query.where(self._time_condition(self.fact.c.hour_start))
+        else:
+            self.query = self.query.where(self._time_condition(sales.c.created_at))
+
+    def _time_condition(self, column):
+        """Período da requisição sobre `column`: semiaberto em horas inteiras, senão BETWEEN."""
+        start = self._param("time_start", sales.c.created_at.type)
+        if "time_before" in self.params:
+            return and_(column >= start, column < self._param("time_before", sales.c.created_at.type))
+        return column.between(start, self._param("time_end", sales.c.created_at.type))
 
     def _apply_filters(self):
         """Adiciona cláusulas WHERE com base nos filtros da requisição."""
         if not self.request.filters:
             return
 
-        NUMERIC_FIELDS = [
-            'product_name',
-            'store_name',
-            'hour_of_day'
-        ]
+        for position, f in enumerate(self.request.filters):
+            if f.field in self.one_to_many:
+                # O filtro já está na subquery pré-agregada; basta o join.
+                self._ensure_join(self.one_to_many[f.field].c.sale_id)
+                continue
+            if f.field in self.semi_joins:
+                self.query = self.query.where(self.semi_joins.pop(f.field))
+                continue
 
-        for f in self.request.filters:
-            column = FIELD_MAP.get(f.field)
-            if column is None:
+            column = self.field_map.get(f.field)
+            if column is None or f.field in ONE_TO_MANY:
                 continue
 
-            op = f.operator
-            value = f.value
-            
-            if op == "in":
-                if isinstance(value, str):
-                    value_list = [item.strip() for item in value.split(',')]
-                    value = [item for item in value_list if item]
-                
-                if isinstance(value, list) and f.field in NUMERIC_FIELDS:
-                    try:
-                        value = [int(v) for v in value]
-                    except (ValueError, TypeError):
-                        continue
-
-            elif f.field in NUMERIC_FIELDS:
-                try:
-                    value = int(value)
-                except (ValueError, TypeError):
-                    continue
-
-            op_map = {
-                "equals": lambda c, v: c == v,
-                "not_equals": lambda c, v: c != v,
-                "greater_than": lambda c, v: c > v,
-                "less_than": lambda c, v: c < v,
-                "in": lambda c, v: c.in_(v),
-            }
-            
-            if op in op_map and value is not None:
-                try:
-                    condition = op_map[op](column, value)
-                    self.query = self.query.where(condition)
-                    self._ensure_join(column)
-                except Exception:
-                    continue
+            condition = None
+            if f.field == "sale_date" and not self.use_rollup:
+                ranges = sale_date_ranges(f)
+                if ranges is not None:
+                    condition = self._sale_date_condition(position, ranges)
+            if condition is None:
+                condition = self._filter_condition(column, position, f)
+            if condition is not None:
+                self.query = self.query.where(condition)
+                self._ensure_join(column)
 
     def _apply_group_by(self):
         """Adiciona a cláusula GROUP BY se houver dimensões na requisição."""
@@ -202,21 +965,32 @@ class QueryBuilder:
 
         group_by_columns = []
         for dim_enum in self.request.dimensions:
-            dim_name = dim_enum.value
-            
-            if dim_name == "product_name":
-                column = products.c.name
-            elif dim_name == "store_name":
-                column = stores.c.name
-            else:
-                column = FIELD_MAP.get(dim_name)
-
+            column = self._dimension_column(dim_enum.value)
             if column is not None:
                 group_by_columns.append(column)
 
-        if group_by_columns:
+        if self.grouping_sets is not None and group_by_columns:
+            self._apply_grouping_sets(group_by_columns)
+        elif group_by_columns:
             self.query = self.query.group_by(*group_by_columns)
 
+    def _apply_grouping_sets(self, group_by_columns):
+        """
+        Agrupa por vários conjuntos de dimensões na mesma varredura e
+        adiciona a coluna GROUPING_COLUMN, cujo bit de cada dimensão
+        (a primeira é o bit mais alto) vale 1 quando ela não faz parte
+        do conjunto daquela linha.
+        """
+        sets = [
+            tuple_(*[self._dimension_column(name) for name in grouping_set])
+            for grouping_set in self.grouping_sets
+        ]
+        self.query = (
+            self.query
+            .add_columns(func.grouping(*group_by_columns).label(GROUPING_COLUMN))
+            .group_by(func.grouping_sets(*sets))
+        )
+
     def _apply_order_by(self):
         """Adiciona a cláusula ORDER BY para ordenar os resultados."""
         if not self.request.order_by:
@@ -225,7 +999,10 @@ class QueryBuilder:
         field_to_order = self.request.order_by.field
         direction = self.request.order_by.direction
         
-        order_obj = FIELD_MAP.get(field_to_order, field_to_order)
+        if field_to_order in self.one_to_many:
+            order_obj = self.one_to_many[field_to_order].c.label
+        else:
+            order_obj = self.field_map.get(field_to_order, field_to_order)
 
         if direction == "asc":
             self.query = self.query.order_by(asc(order_obj))
@@ -234,8 +1011,48 @@ class QueryBuilder:
             
     def _apply_limit(self):
         """Adiciona um LIMIT para paginar ou pegar o 'top N'."""
-        if self.request.limit and self.request.limit > 0:
-            self.query = self.query.limit(self.request.limit)
+        if "limit" in self.params:
+            self.query = self.query.limit(self._param("limit", Integer()))
+
+    def _apply_pagination(self):
+        """
+        Paginação por keyset: ordena pela chave (campo de order_by seguido
+        das dimensões) e retoma a partir do cursor, sem OFFSET. Quando a
+        chave só tem dimensões, o filtro entra no WHERE e limita a varredura.
+        `sort_keys` guarda os nomes das colunas usadas para montar o próximo cursor.
+        """
+        descending = self.request.order_by and self.request.order_by.direction == "desc"
+
+        keys = {}
+        order_field = self.request.order_by.field if self.request.order_by else None
+        if order_field in self.metric_columns:
+            keys[order_field] = self.metric_columns[order_field]
+        for dim_enum in self.request.dimensions:
+            if dim_enum.value == order_field:
+                keys = {order_field: self._dimension_column(order_field), **keys}
+            else:
+                keys[dim_enum.value] = self._dimension_column(dim_enum.value)
+
+        self.sort_keys = list(keys)
+        expressions = list(keys.values())
+
+        if expressions:
+            if self.request.cursor:
+                names = [name for name in self.params if name.startswith("cursor_")]
+                if len(names) != len(expressions):
+                    raise InvalidCursor("Pagination cursor does not match this query")
+                last_values = [self._param(name, e.type) for name, e in zip(names, expressions)]
+                key = tuple_(*expressions)
+                condition = key < tuple_(*last_values) if descending else key > tuple_(*last_values)
+                if order_field in self.metric_columns:
+                    self.query = self.query.having(condition)
+                else:
+                    self.query = self.query.where(condition)
+
+            order = desc if descending else asc
+            self.query = self.query.order_by(*[order(e) for e in expressions])
+
+        self.query = self.query.limit(self._param("page_size", Integer()))
 
     def _ensure_join(self, column):
         """
@@ -249,18 +1066,59 @@ class QueryBuilder:
             return
 
         if target_table.name == 'stores':
-            self.query = self.query.join(stores, sales.c.store_id == stores.c.id)
+            self.query = self.query.join(stores, self.fact.c.store_id == stores.c.id)
         elif target_table.name == 'channels':
-            self.query = self.query.join(channels, sales.c.channel_id == channels.c.id)
-        elif target_table.name == 'products':
-            if product_sales not in self.joined_tables:
-                self.query = self.query.join(product_sales, sales.c.id == product_sales.c.sale_id)
-                self.joined_tables.add(product_sales)
-            self.query = self.query.join(products, product_sales.c.product_id == products.c.id)
-        elif target_table.name == 'payment_types':
-            if payments not in self.joined_tables:
-                self.query = self.query.join(payments, sales.c.id == payments.c.sale_id)
-                self.joined_tables.add(payments)
-            self.query = self.query.join(payment_types, payments.c.payment_type_id == payment_types.c.id)
+            self.query = self.query.join(channels, self.fact.c.channel_id == channels.c.id)
+        elif target_table in self.one_to_many.values():
+            self.query = self.query.join(target_table, sales.c.id == target_table.c.sale_id)
 
         self.joined_tables.add(target_table)
+
+
+class StatementCache:
+    """
+    Consultas já montadas pelo QueryBuilder, por formato de requisição
+    (LRU com até `max_entries` formatos). Dashboards repetem os mesmos
+    formatos com outros valores; reaproveitar a consulta evita remontar o
+    select e mantém o SQL idêntico, então o SQLAlchemy reusa a compilação
+    e o driver pode reusar o prepared statement.
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+statement_cache = StatementCache(max_entries=settings.QUERY_SHAPE_CACHE_SIZE)
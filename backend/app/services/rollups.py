@@ -0,0 +1,177 @@
+from sqlalchemy import select, func, delete, update, text
+from sqlalchemy.dialects.postgresql import insert
+
+from app.services.query_builder import (
+    sales,
+    sales_daily_rollup,
+    rollup_refresh_state,
+    rollup_aggregate,
+    changed_hours,
+    in_changed_hours,
+    ROLLUP_NAME,
+    ROLLUP_MEASURES,
+)
+
+
+def _combine(current, incoming):
+    """Soma dois parciais preservando NULL quando ambos são nulos."""
+    return func.coalesce(current + incoming, current, incoming)
+
+
+def snapshot_query(*table_names):
+    """
+    Maiores ids visíveis de cada tabela e o snapshot do mesmo comando: xmin,
+    xmax e se há outras transações em curso (a própria, se já tiver xid,
+    não conta). É a entrada de `settled_bounds`.
+    """
+    max_ids = ", ".join(f"(SELECT max(id) FROM {name})" for name in table_names)
+    return text(f"""
+        SELECT
+            {max_ids},
+            pg_snapshot_xmin(pg_current_snapshot())::text::bigint,
+            pg_snapshot_xmax(pg_current_snapshot())::text::bigint,
+            EXISTS (
+                SELECT 1 FROM pg_snapshot_xip(pg_current_snapshot()) AS running(xid)
+                WHERE running.xid IS DISTINCT FROM pg_current_xact_id_if_assigned()
+            )
+    """)
+
+
+# Vendas e log de alterações; a transação do refresh já tem xid pelo FOR UPDATE.
+SNAPSHOT = snapshot_query("sales", "sales_changes")
+
+
+def settled_bounds(state, max_sale_id, xmin, xmax, others_running):
+    """
+    Ids de `sales` não são confirmados em ordem: uma venda com id menor pode
+    ficar visível depois de um id maior já ter sido agregado. Por isso o
+    rollup só avança até um id "assentado", abaixo do qual nenhuma transação
+    ainda pode confirmar vendas (o mesmo vale para os ids de `sales_changes`):
+
+    - sem outras transações em curso, o maior id visível;
+    - senão, a marca pendente do refresh anterior, quando todas as transações
+      em curso naquele momento (xid < pending_xmax) já terminaram.
+
+    Retorna (limite superior, (pending_sale_id, pending_xmax)).
+    """
+    last_sale_id, pending_sale_id, pending_xmax = state
+    upper = last_sale_id
+    pending = (pending_sale_id, pending_xmax)
+    if not others_running:
+        upper = max(upper, max_sale_id)
+        pending = (None, None)
+    elif pending_sale_id is not None and pending_xmax <= xmin:
+        upper = max(upper, pending_sale_id)
+        pending = (None, None)
+
+    if pending[0] is None and max_sale_id > upper:
+        pending = (max_sale_id, xmax)
+    return upper, pending
+
+
+def refresh_rollups(connection, full: bool = False) -> int:
+    """
+    Atualiza o rollup de vendas de forma incremental, agregando apenas as
+    vendas com id acima do último refresh (até o id assentado, ver
+    `settled_bounds`) e somando-as aos buckets existentes. Com `full=True`
+    o rollup é reconstruído do zero. Retorna o número de vendas incorporadas.
+
+    Vendas alteradas ou removidas depois de agregadas (status, valores,
+    loja, data) chegam pelo log `sales_changes`: cada hora tocada é apagada
+    do rollup e agregada de novo a partir de `sales`. Vendas acima da marca
+    e horas com alterações ainda não processadas continuam sendo lidas de
+    `sales` pelo ROLLUP_SOURCE, então o resultado não depende do atraso do rollup.
+    """
+    # A linha é criada por 03-rollups.sql; o insert cobre bancos anteriores.
+    connection.execute(
+        insert(rollup_refresh_state)
+        .values(rollup_name=ROLLUP_NAME, last_sale_id=0)
+        .on_conflict_do_nothing(index_elements=[rollup_refresh_state.c.rollup_name])
+    )
+    state = connection.execute(
+        select(
+            rollup_refresh_state.c.last_sale_id,
+            rollup_refresh_state.c.pending_sale_id,
+            rollup_refresh_state.c.pending_xmax,
+            rollup_refresh_state.c.last_change_id,
+            rollup_refresh_state.c.pending_change_id,
+            rollup_refresh_state.c.pending_change_xmax,
+        )
+        .where(rollup_refresh_state.c.rollup_name == ROLLUP_NAME)
+        .with_for_update()
+    ).one()
+    last_sale_id = state.last_sale_id or 0
+    last_change_id = state.last_change_id or 0
+
+    max_sale_id, max_change_id, xmin, xmax, others_running = connection.execute(SNAPSHOT).one()
+    upper_sale_id, (pending_sale_id, pending_xmax) = settled_bounds(
+        (last_sale_id, state.pending_sale_id, state.pending_xmax),
+        max_sale_id or 0, xmin, xmax, others_running,
+    )
+    upper_change_id, (pending_change_id, pending_change_xmax) = settled_bounds(
+        (last_change_id, state.pending_change_id, state.pending_change_xmax),
+        max_change_id or 0, xmin, xmax, others_running,
+    )
+
+    if full:
+        # Tudo até a marca anterior já estava assentado, então a reconstrução
+        # pode ir até `upper_sale_id` sem esperar um novo refresh; ela lê o
+        # estado atual das vendas, que já inclui as alterações assentadas.
+        connection.execute(delete(sales_daily_rollup))
+        last_sale_id = 0
+    elif upper_change_id > last_change_id:
+        # Refaz as horas alteradas com as vendas que já estavam no rollup; as
+        # acima de `last_sale_id` entram logo abaixo, pelo upsert incremental.
+        hours = changed_hours(last_change_id, upper_change_id)
+        connection.execute(
+            delete(sales_daily_rollup)
+            .where(sales_daily_rollup.c.hour_start.in_(select(hours.c.hour_start)))
+        )
+        connection.execute(
+            insert(sales_daily_rollup).from_select(
+                [c.name for c in sales_daily_rollup.columns],
+                rollup_aggregate(sales.c.id <= last_sale_id, in_changed_hours(hours)),
+            )
+        )
+
+    new_sales = 0
+    if upper_sale_id > last_sale_id:
+        new_sales = connection.execute(
+            select(func.count())
+            .select_from(sales)
+            .where(sales.c.id > last_sale_id, sales.c.id <= upper_sale_id)
+        ).scalar()
+
+        aggregate = rollup_aggregate(sales.c.id > last_sale_id, sales.c.id <= upper_sale_id)
+        upsert = insert(sales_daily_rollup).from_select(
+            [c.name for c in sales_daily_rollup.columns], aggregate
+        )
+
+        updates = {"sale_count": sales_daily_rollup.c.sale_count + upsert.excluded.sale_count}
+        for name in ROLLUP_MEASURES:
+            sum_column, count_column = f"{name}_sum", f"{name}_count"
+            updates[sum_column] = _combine(sales_daily_rollup.c[sum_column], upsert.excluded[sum_column])
+            updates[count_column] = sales_daily_rollup.c[count_column] + upsert.excluded[count_column]
+
+        connection.execute(
+            upsert.on_conflict_do_update(
+                index_elements=[c.name for c in sales_daily_rollup.primary_key],
+                set_=updates,
+            )
+        )
+
+    connection.execute(
+        update(rollup_refresh_state)
+        .where(rollup_refresh_state.c.rollup_name == ROLLUP_NAME)
+        .values(
+            last_sale_id=max(upper_sale_id, last_sale_id),
+            pending_sale_id=pending_sale_id,
+            pending_xmax=pending_xmax,
+            last_change_id=max(upper_change_id, last_change_id),
+            pending_change_id=pending_change_id,
+            pending_change_xmax=pending_change_xmax,
+            refreshed_at=func.now(),
+        )
+    )
+
+    return new_sales
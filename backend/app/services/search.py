@@ -0,0 +1,110 @@
+import bisect
+
+from sqlalchemy import text
+
+# Dimensões com busca: nome -> (tabela, coluna do nome, condição extra).
+SEARCHABLE = {
+    "products": ("products", "name", None),
+    "stores": ("stores", "name", "is_active = true"),
+    "customers": ("customers", "customer_name", None),
+}
+
+MAX_SEARCH_LIMIT = 100
+
+# Termos mais curtos buscam só por prefixo: o índice de trigrama não ajuda
+# `ILIKE '%ab%'`, que leria a tabela inteira.
+MIN_CONTAINS_LENGTH = 3
+
+
+def _normalize(value: str) -> str:
+    return value.casefold()
+
+
+class PrefixIndex:
+    """
+    Índice em memória para busca incremental: os nomes ficam ordenados
+    pela forma normalizada, então os que começam com o termo saem por busca
+    binária. Depois deles vêm os que contêm o termo no meio do nome (com
+    termos de MIN_CONTAINS_LENGTH caracteres ou mais), até completar a página.
+    """
+    def __init__(self, items):
+        entries = sorted((_normalize(item["name"]), item["name"], item["id"]) for item in items)
+        self._keys = [entry[0] for entry in entries]
+        self._items = [{"id": entry[2], "name": entry[1]} for entry in entries]
+
+    def __len__(self):
+        return len(self._items)
+
+    def search(self, term: str, limit: int, offset: int = 0):
+        """Itens da página e se há mais resultados depois dela."""
+        term = _normalize(term)
+        wanted = offset + limit + 1
+        matches = []
+
+        start = bisect.bisect_left(self._keys, term)
+        position = start
+        while position < len(self._keys) and self._keys[position].startswith(term) and len(matches) < wanted:
+            matches.append(position)
+            position += 1
+
+        if len(term) >= MIN_CONTAINS_LENGTH and len(matches) < wanted:
+            for position, key in enumerate(self._keys):
+                if term in key and not key.startswith(term):
+                    matches.append(position)
+                    if len(matches) == wanted:
+                        break
+
+        page = matches[offset:offset + limit]
+        return [self._items[position] for position in page], len(matches) > offset + limit
+
+
+def _where(dimension, *conditions):
+    table, column, condition = SEARCHABLE[dimension]
+    return " AND ".join(([condition] if condition else []) + [c.format(column=column) for c in conditions])
+
+
+def prefix_query(dimension: str):
+    """
+    Nomes que começam com o termo, em ordem. `lower(coluna) LIKE 'termo%'`
+    e a ordenação `USING ~<~` saem do índice btree `text_pattern_ops` de
+    05-search-indexes.sql: uma varredura de faixa que para no LIMIT.
+    """
+    table, column, _ = SEARCHABLE[dimension]
+    return text(f"""
+        SELECT id, {column} FROM {table}
+        WHERE {_where(dimension, "lower({column}) LIKE :prefix")}
+        ORDER BY lower({column}) USING ~<~, id
+        LIMIT :limit OFFSET :offset
+    """)
+
+
+def prefix_count_query(dimension: str):
+    """Quantos nomes começam com o termo (para paginar além deles)."""
+    table, column, _ = SEARCHABLE[dimension]
+    return text(f"SELECT count(*) FROM {table} WHERE {_where(dimension, 'lower({column}) LIKE :prefix')}")
+
+
+def contains_query(dimension: str):
+    """
+    Nomes que contêm o termo sem começar com ele, com ILIKE apoiado pelos
+    índices de trigrama (pg_trgm). Só roda para termos de
+    MIN_CONTAINS_LENGTH caracteres ou mais, quando os de prefixo não
+    completam a página.
+    """
+    table, column, _ = SEARCHABLE[dimension]
+    where = _where(dimension, "{column} ILIKE :contains", "lower({column}) NOT LIKE :prefix")
+    return text(f"""
+        SELECT id, {column} FROM {table}
+        WHERE {where}
+        ORDER BY lower({column}) USING ~<~, id
+        LIMIT :limit OFFSET :offset
+    """)
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_params(term: str):
+    escaped = _escape_like(term.lower())
+    return {"contains": f"%{escaped}%", "prefix": f"{escaped}%"}
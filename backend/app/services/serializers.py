@@ -0,0 +1,71 @@
+import io
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def accepts_arrow(accept_header: str) -> bool:
+    """Verifica se o cliente pediu o formato Arrow IPC no header Accept."""
+    return any(
+        part.split(";")[0].strip() == ARROW_MEDIA_TYPE
+        for part in (accept_header or "").split(",")
+    )
+
+
+def rows_to_arrow(column_names, rows, metadata=None) -> bytes:
+    """
+    Serializa o resultado em Arrow IPC (stream) coluna a coluna, sem montar
+    um dict por linha. Decimais e datas são enviados com tipos nativos.
+    `metadata` (ex. o bloco `approximation` da resposta JSON) vai no schema,
+    cada valor como JSON.
+    """
+    import pyarrow as pa
+
+    columns = list(zip(*rows)) if rows else [() for _ in column_names]
+    table = pa.table({
+        name: pa.array(values) for name, values in zip(column_names, columns)
+    })
+    if metadata:
+        table = table.replace_schema_metadata({
+            key: json.dumps(value, default=_json_default) for key, value in metadata.items()
+        })
+
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _json_default(value):
+    """Converte os tipos retornados pelo banco como o encoder do FastAPI."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def ndjson_lines(batches):
+    """
+    Converte lotes (colunas, linhas) em linhas NDJSON, uma por registro.
+    Depois do início da resposta o status já foi enviado; uma falha do banco
+    vira um último registro `{"error": ...}` para o cliente saber que o
+    resultado está incompleto.
+    """
+    try:
+        async for column_names, rows in batches:
+            chunk = "".join(
+                json.dumps(dict(zip(column_names, row)), default=_json_default) + "\n"
+                for row in rows
+            )
+            yield chunk.encode()
+    except SQLAlchemyError as e:
+        logger.exception("Streaming query failed")
+        yield (json.dumps({"error": f"Database error: {str(e)}"}) + "\n").encode()
@@ -0,0 +1,77 @@
+import json
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from app.core.config import settings
+from app.database import engine, fetch_rows
+from app.services.cache import build_cache_key
+from app.services.explain import Explain, compiled_sql, parse_plan
+
+
+class SlowQueryLog:
+    """
+    Guarda em memória as últimas consultas de /api/query que passaram
+    do limite SLOW_QUERY_THRESHOLD_MS (as mais antigas são descartadas).
+    """
+    def __init__(self, max_entries: int):
+        self._entries = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def record(self, entry: dict):
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+
+    def entries(self, limit=None, min_duration_ms=0.0):
+        """Entradas mais recentes primeiro, opcionalmente filtradas pela duração."""
+        with self._lock:
+            entries = [e for e in reversed(self._entries) if e["duration_ms"] >= min_duration_ms]
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "threshold_ms": settings.SLOW_QUERY_THRESHOLD_MS,
+                "entries": len(self._entries),
+                "max_entries": self._entries.maxlen,
+                "recorded": self.recorded,
+            }
+
+
+def is_slow(duration_ms: float) -> bool:
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    return threshold > 0 and duration_ms >= threshold
+
+
+async def capture_slow_query(query_request, statement, duration_ms, row_count):
+    """
+    Registra uma consulta lenta com a requisição normalizada, o SQL e,
+    se SLOW_QUERY_CAPTURE_PLAN estiver ativo, o plano estimado (EXPLAIN
+    sem ANALYZE, para não executar a consulta de novo).
+    Roda depois da resposta, como background task.
+    """
+    plan = None
+    if settings.SLOW_QUERY_CAPTURE_PLAN:
+        try:
+            _, rows = await fetch_rows(Explain(statement))
+            plan = parse_plan(rows[0][0])
+        except Exception as e:
+            plan = {"error": str(e)}
+
+    slow_query_log.record({
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "request": json.loads(build_cache_key(query_request)),
+        "sql": compiled_sql(statement, engine.dialect),
+        "duration_ms": round(duration_ms, 3),
+        "row_count": row_count,
+        "plan": plan,
+    })
+
+
+slow_query_log = SlowQueryLog(max_entries=settings.SLOW_QUERY_LOG_SIZE)
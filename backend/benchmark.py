@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Benchmark das queries geradas pelo QueryBuilder.
+Executa um catálogo fixo de consultas de dashboard contra o banco local e
+grava latência (p50/p95/p99), linhas lidas, buffers e formato do plano em JSON,
+para comparar índices e mudanças no QueryBuilder entre commits.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, func, select
+
+from app.core.config import settings
+from app.database import engine
+from app.schemas import AnalyticsQuery
+from app.services.explain import Explain, compiled_sql, parse_plan, summarize_plan
+from app.services.query_builder import QueryBuilder, sales, product_sales
+
+
+# Consultas típicas do dashboard. `days` define o período, contado a partir
+# da última venda do dataset, para que o catálogo sirva para qualquer base gerada.
+WORKLOAD = [
+    {
+        "name": "top_products",
+        "days": 30,
+        "query": {
+            "metrics": [{"field": "total_amount", "function": "sum", "alias": "revenue"}],
+            "dimensions": ["product_name"],
+            "order_by": {"field": "revenue", "direction": "desc"},
+            "limit": 10,
+        },
+    },
+    {
+        "name": "revenue_by_hour",
+        "days": 90,
+        "query": {
+            "metrics": [{"field": "total_amount", "function": "sum", "alias": "revenue"}],
+            "dimensions": ["hour_of_day"],
+            "filters": [{"field": "sale_status", "operator": "equals", "value": "COMPLETED"}],
+            "order_by": {"field": "hour_of_day", "direction": "asc"},
+        },
+    },
+    {
+        "name": "revenue_by_weekday",
+        "days": 90,
+        "query": {
+            "metrics": [
+                {"field": "total_amount", "function": "sum", "alias": "revenue"},
+                {"field": "total_amount", "function": "avg", "alias": "ticket"},
+            ],
+            "dimensions": ["day_of_week"],
+            "order_by": {"field": "day_of_week", "direction": "asc"},
+        },
+    },
+    {
+        "name": "channel_mix_over_time",
+        "days": 180,
+        "query": {
+            "metrics": [{"field": "sale_id", "function": "count", "alias": "orders"}],
+            "dimensions": ["sale_date", "channel_name"],
+            "order_by": {"field": "sale_date", "direction": "asc"},
+        },
+    },
+    {
+        "name": "payment_type_breakdown",
+        "days": 30,
+        "query": {
+            "metrics": [{"field": "sale_id", "function": "count", "alias": "orders"}],
+            "dimensions": ["payment_type"],
+            "order_by": {"field": "orders", "direction": "desc"},
+        },
+    },
+    {
+        "name": "store_drilldown_by_channel",
+        "days": 30,
+        "query": {
+            "metrics": [
+                {"field": "total_amount", "function": "sum", "alias": "revenue"},
+                {"field": "delivery_fee", "function": "avg", "alias": "avg_delivery_fee"},
+            ],
+            "dimensions": ["channel_name", "sale_status"],
+            "filters": [{"field": "store_name", "operator": "equals", "value": 1}],
+        },
+    },
+    {
+        "name": "store_drilldown_products",
+        "days": 7,
+        "query": {
+            "metrics": [{"field": "total_amount", "function": "sum", "alias": "revenue"}],
+            "dimensions": ["product_name"],
+            "filters": [
+                {"field": "store_name", "operator": "in", "value": [1, 2, 3]},
+                {"field": "channel_name", "operator": "equals", "value": "iFood"},
+            ],
+            "order_by": {"field": "revenue", "direction": "desc"},
+            "limit": 20,
+        },
+    },
+    {
+        "name": "store_ranking",
+        "days": 180,
+        "query": {
+            "metrics": [
+                {"field": "total_amount", "function": "sum", "alias": "revenue"},
+                {"field": "total_discount", "function": "sum", "alias": "discounts"},
+            ],
+            "dimensions": ["store_name"],
+            "order_by": {"field": "revenue", "direction": "desc"},
+        },
+    },
+]
+
+
+def build_query(entry, last_sale):
+    """Monta o AnalyticsQuery da entrada com o período relativo à última venda."""
+    end_date = last_sale.replace(minute=59, second=59, microsecond=999000)
+    start_date = (end_date - timedelta(days=entry["days"])).replace(minute=0, second=0, microsecond=0)
+    return AnalyticsQuery(
+        **entry["query"],
+        time_range={"start_date": start_date, "end_date": end_date},
+    )
+
+
+def explain(connection, statement):
+    """Executa EXPLAIN (ANALYZE, BUFFERS) e extrai as métricas do plano."""
+    plan = parse_plan(connection.execute(Explain(statement, analyze=True)).scalar())
+    return {
+        "sql": compiled_sql(statement, connection.dialect),
+        **summarize_plan(plan),
+    }
+
+
+def percentile(quantiles, p):
+    """Percentil `p` a partir dos 99 pontos de corte de statistics.quantiles."""
+    return round(quantiles[p - 1], 3)
+
+
+def run_entry(connection, entry, last_sale, runs, warmup):
+    """Mede uma consulta do catálogo: `warmup` execuções descartadas e `runs` medidas."""
+    query_request = build_query(entry, last_sale)
+    statement = QueryBuilder(query_request).build()
+
+    for _ in range(warmup):
+        connection.execute(statement).fetchall()
+
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        row_count = len(connection.execute(statement).fetchall())
+        timings.append((time.perf_counter() - started) * 1000)
+
+    quantiles = statistics.quantiles(timings, n=100, method="inclusive")
+    return {
+        "name": entry["name"],
+        "rows_returned": row_count,
+        "latency_ms": {
+            "p50": percentile(quantiles, 50),
+            "p95": percentile(quantiles, 95),
+            "p99": percentile(quantiles, 99),
+            "min": round(min(timings), 3),
+            "max": round(max(timings), 3),
+        },
+        **explain(connection, statement),
+    }
+
+
+def dataset_info(connection):
+    """Tamanho do dataset e versão do servidor, para contextualizar o resultado."""
+    return {
+        "sales": connection.execute(select(func.count()).select_from(sales)).scalar(),
+        "product_sales": connection.execute(select(func.count()).select_from(product_sales)).scalar(),
+        "server_version": connection.exec_driver_sql("SHOW server_version").scalar(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, threshold):
+    """Lista as consultas cujo p50 piorou mais que `threshold` em relação ao baseline."""
+    previous = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get(result["name"])
+        if before is None:
+            continue
+        ratio = result["latency_ms"]["p50"] / max(before["latency_ms"]["p50"], 0.001)
+        if ratio > threshold:
+            regressions.append((result["name"], before["latency_ms"]["p50"], result["latency_ms"]["p50"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark QueryBuilder queries against a local database')
+    parser.add_argument('--db-url', default=None,
+                       help='PostgreSQL connection URL (default: DATABASE_URL)')
+    parser.add_argument('--runs', type=int, default=20, help='Measured executions per query')
+    parser.add_argument('--warmup', type=int, default=3, help='Discarded executions per query')
+    parser.add_argument('--only', nargs='*', default=None, help='Run only these workload entries')
+    parser.add_argument('--rollups', choices=['on', 'off'], default=None,
+                       help='Override ROLLUPS_ENABLED for this run')
+    parser.add_argument('--output', default=None, help='Write the JSON report to this file (default: stdout)')
+    parser.add_argument('--compare', default=None, help='Baseline JSON report to compare p50 latencies against')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                       help='p50 ratio over the baseline reported as a regression')
+
+    args = parser.parse_args()
+    if args.runs < 2:
+        parser.error('--runs must be at least 2 to compute percentiles')
+
+    if args.rollups is not None:
+        settings.ROLLUPS_ENABLED = args.rollups == 'on'
+
+    workload = [entry for entry in WORKLOAD if not args.only or entry["name"] in args.only]
+    bench_engine = create_engine(args.db_url) if args.db_url else engine
+
+    with bench_engine.connect() as connection:
+        last_sale = connection.execute(select(func.max(sales.c.created_at))).scalar()
+        if last_sale is None:
+            parser.error('the database has no sales; run generate_data.py first')
+
+        results = []
+        for entry in workload:
+            result = run_entry(connection, entry, last_sale, args.runs, args.warmup)
+            print(f"  {entry['name']}: p50 {result['latency_ms']['p50']} ms, "
+                  f"{result['rows_scanned']:,} rows scanned", file=sys.stderr)
+            results.append(result)
+
+        report = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "rollups_enabled": settings.ROLLUPS_ENABLED,
+            "runs": args.runs,
+            "warmup": args.warmup,
+            "dataset": dataset_info(connection),
+            "results": results,
+        }
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"✓ Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"✗ {name}: p50 {before} ms -> {after} ms ({ratio:.2f}x)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"✓ No regressions above {args.threshold:g}x", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
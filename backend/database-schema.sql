@@ -98,7 +98,7 @@ CREATE TABLE customers (
 );
 
 CREATE TABLE sales (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL PRIMARY KEY,
     store_id INTEGER NOT NULL REFERENCES stores(id),
     sub_brand_id INTEGER REFERENCES sub_brands(id),
     customer_id INTEGER REFERENCES customers(id),
@@ -131,8 +131,8 @@ CREATE TABLE sales (
 );
 
 CREATE TABLE product_sales (
-    id SERIAL PRIMARY KEY,
-    sale_id INTEGER NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
+    id BIGSERIAL PRIMARY KEY,
+    sale_id BIGINT NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
     product_id INTEGER NOT NULL REFERENCES products(id),
     quantity FLOAT NOT NULL,
     base_price FLOAT NOT NULL,
@@ -142,8 +142,8 @@ CREATE TABLE product_sales (
 
 -- Items added to products (e.g., "Hamburguer + Bacon + Queijo extra")
 CREATE TABLE item_product_sales (
-    id SERIAL PRIMARY KEY,
-    product_sale_id INTEGER NOT NULL REFERENCES product_sales(id) ON DELETE CASCADE,
+    id BIGSERIAL PRIMARY KEY,
+    product_sale_id BIGINT NOT NULL REFERENCES product_sales(id) ON DELETE CASCADE,
     item_id INTEGER NOT NULL REFERENCES items(id),
     option_group_id INTEGER REFERENCES option_groups(id),
     quantity FLOAT NOT NULL,
@@ -155,8 +155,8 @@ CREATE TABLE item_product_sales (
 
 -- Items added to items (nested customization)
 CREATE TABLE item_item_product_sales (
-    id SERIAL PRIMARY KEY,
-    item_product_sale_id INTEGER NOT NULL REFERENCES item_product_sales(id) ON DELETE CASCADE,
+    id BIGSERIAL PRIMARY KEY,
+    item_product_sale_id BIGINT NOT NULL REFERENCES item_product_sales(id) ON DELETE CASCADE,
     item_id INTEGER NOT NULL REFERENCES items(id),
     option_group_id INTEGER REFERENCES option_groups(id),
     quantity FLOAT NOT NULL,
@@ -166,8 +166,8 @@ CREATE TABLE item_item_product_sales (
 );
 
 CREATE TABLE delivery_sales (
-    id SERIAL PRIMARY KEY,
-    sale_id INTEGER NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
+    id BIGSERIAL PRIMARY KEY,
+    sale_id BIGINT NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
     courier_id VARCHAR(100),
     courier_name VARCHAR(100),
     courier_phone VARCHAR(100),
@@ -182,9 +182,9 @@ CREATE TABLE delivery_sales (
 );
 
 CREATE TABLE delivery_addresses (
-    id SERIAL PRIMARY KEY,
-    sale_id INTEGER NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
-    delivery_sale_id INTEGER REFERENCES delivery_sales(id) ON DELETE CASCADE,
+    id BIGSERIAL PRIMARY KEY,
+    sale_id BIGINT NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
+    delivery_sale_id BIGINT REFERENCES delivery_sales(id) ON DELETE CASCADE,
     street VARCHAR(200),
     number VARCHAR(20),
     complement VARCHAR(200),
@@ -206,8 +206,8 @@ CREATE TABLE payment_types (
 );
 
 CREATE TABLE payments (
-    id SERIAL PRIMARY KEY,
-    sale_id INTEGER NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
+    id BIGSERIAL PRIMARY KEY,
+    sale_id BIGINT NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
     payment_type_id INTEGER REFERENCES payment_types(id),
     value DECIMAL(10,2) NOT NULL,
     is_online BOOLEAN DEFAULT false,
@@ -227,8 +227,8 @@ CREATE TABLE coupons (
 );
 
 CREATE TABLE coupon_sales (
-    id SERIAL PRIMARY KEY,
-    sale_id INTEGER REFERENCES sales(id) ON DELETE CASCADE,
+    id BIGSERIAL PRIMARY KEY,
+    sale_id BIGINT REFERENCES sales(id) ON DELETE CASCADE,
     coupon_id INTEGER REFERENCES coupons(id),
     value FLOAT,
     target VARCHAR(100),
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Atualiza as tabelas de rollup usadas pelo QueryBuilder.
+Por padrão agrega apenas as vendas novas desde o último refresh.
+"""
+
+import argparse
+
+from app.database import engine
+from app.services.rollups import refresh_rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh analytics rollups')
+    parser.add_argument('--full', action='store_true',
+                       help='Rebuild rollups from scratch instead of incrementally')
+
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        new_sales = refresh_rollups(connection, full=args.full)
+
+    mode = "full" if args.full else "incremental"
+    print(f"✓ Rollups refreshed ({mode}): {new_sales:,} sales aggregated")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Sincroniza a cópia colunar (Parquet) lida pelo backend DuckDB.
+Por padrão copia apenas as vendas, itens e pagamentos novos desde a
+última sincronização e regrava os arquivos com vendas alteradas no
+log `sales_changes`; com --interval repete a cada N segundos.
+"""
+
+import argparse
+import time
+
+from app.core.config import settings
+from app.database import engine
+from app.services.columnar import sync_columnar
+
+
+def sync_once(data_dir, full):
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+        copied = sync_columnar(connection, data_dir, full=full)
+    mode = "full" if full else "incremental"
+    summary = ", ".join(f"{table}: {rows:,}" for table, rows in copied.items())
+    print(f"✓ Columnar copy synced ({mode}) — {summary}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync the Parquet copy used by the DuckDB backend')
+    parser.add_argument('--data-dir', default=settings.COLUMNAR_DATA_DIR,
+                       help='Directory of the Parquet copy (default: COLUMNAR_DATA_DIR)')
+    parser.add_argument('--full', action='store_true',
+                       help='Rebuild the copy from scratch instead of incrementally')
+    parser.add_argument('--interval', type=float, default=None,
+                       help='Keep running, syncing every N seconds')
+
+    args = parser.parse_args()
+
+    sync_once(args.data_dir, args.full)
+    while args.interval:
+        time.sleep(args.interval)
+        sync_once(args.data_dir, False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import os
+import random
+import sys
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# O engine é criado na importação de app.database; sem banco de testes a URL
+# só precisa ser válida, pois os testes que usam o Postgres são pulados.
+os.environ.setdefault(
+    "DATABASE_URL", os.getenv("TEST_DATABASE_URL", "postgresql://postgres@localhost/challenge_db")
+)
+
+from sqlalchemy import create_engine, text  # noqa: E402
+
+from app.services.query_builder import (  # noqa: E402
+    metadata,
+    statement_cache,
+    sales,
+    stores,
+    channels,
+    product_sales,
+    products,
+    payments,
+    payment_types,
+)
+
+COLUMNAR_START = datetime(2024, 3, 1)
+PRODUCT_NAMES = {1: "X-Burguer", 2: "Batata", 3: "Refrigerante", 4: "Milkshake"}
+PAYMENT_TYPE_NAMES = {1: "Pix", 2: "Cartão", 3: "Dinheiro"}
+
+
+@pytest.fixture(autouse=True)
+def clear_statement_cache():
+    statement_cache.clear()
+    yield
+    statement_cache.clear()
+
+
+def run_sql_file(connection, name):
+    """Executa um dos scripts SQL do backend, sem os comandos do psql (ex. `\\c`)."""
+    path = Path(__file__).resolve().parents[1] / name
+    sql = "\n".join(line for line in path.read_text().splitlines() if not line.startswith("\\"))
+    connection.exec_driver_sql(sql)
+
+
+@pytest.fixture
+def pg_connection():
+    """
+    Conexão com o Postgres de TEST_DATABASE_URL em um schema temporário com
+    as tabelas do QueryBuilder e o log de alterações de `sales`. Sem a
+    variável, o teste é pulado.
+    """
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL not set")
+
+    engine = create_engine(url)
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    with engine.connect() as connection:
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+        connection.execute(text(f"SET search_path TO {schema}"))
+        metadata.create_all(connection)
+        run_sql_file(connection, "06-sales-changes.sql")
+        connection.commit()
+        try:
+            yield connection
+        finally:
+            connection.rollback()
+            connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+            connection.commit()
+    engine.dispose()
+
+
+def _generate_sales(rng):
+    """Vendas com produtos e formas de pagamento repetidos na mesma venda."""
+    sale_rows, product_rows, payment_rows = [], [], []
+    for sale_id in range(1, 301):
+        created_at = COLUMNAR_START + timedelta(minutes=rng.randrange(6 * 24 * 60))
+        sale_rows.append({
+            "id": sale_id,
+            "store_id": rng.randint(1, 3),
+            "channel_id": rng.randint(1, 2),
+            "customer_id": rng.randint(1, 40),
+            "total_amount": Decimal(rng.randint(1000, 15000)) / 100,
+            "total_discount": Decimal(rng.randint(0, 300)) / 100,
+            "delivery_fee": None if rng.random() < 0.4 else Decimal(rng.randint(0, 900)) / 100,
+            "created_at": created_at,
+            "sale_status_desc": rng.choice(["COMPLETED", "COMPLETED", "CANCELLED"]),
+            "sale_date": created_at.date(),
+            "hour_of_day": created_at.hour,
+            "day_of_week": created_at.isoweekday(),
+        })
+        for _ in range(rng.randint(1, 4)):
+            product_rows.append({
+                "id": len(product_rows) + 1, "sale_id": sale_id, "product_id": rng.randint(1, 4),
+            })
+        for _ in range(rng.randint(1, 2)):
+            payment_rows.append({
+                "id": len(payment_rows) + 1, "sale_id": sale_id, "payment_type_id": rng.randint(1, 3),
+            })
+    return sale_rows, product_rows, payment_rows
+
+
+@pytest.fixture(scope="session")
+def columnar_dataset(tmp_path_factory):
+    """
+    Cópia colunar (Parquet lido pelo DuckDB) com as tabelas do QueryBuilder,
+    e as vendas, produtos e formas de pagamento por venda para calcular os
+    resultados esperados em Python. Sem duckdb/pyarrow, o teste é pulado.
+    """
+    pytest.importorskip("duckdb")
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    from app.services.columnar import ColumnarBackend, STATE_FILE, _arrow_type
+
+    data_dir = tmp_path_factory.mktemp("columnar")
+    sale_rows, product_rows, payment_rows = _generate_sales(random.Random(11))
+    for table, rows in (
+        (sales, sale_rows),
+        (product_sales, product_rows),
+        (payments, payment_rows),
+        (stores, [{"id": i, "name": f"Loja {i}"} for i in (1, 2, 3)]),
+        (channels, [{"id": 1, "name": "iFood"}, {"id": 2, "name": "Presencial"}]),
+        (products, [{"id": i, "name": name} for i, name in PRODUCT_NAMES.items()]),
+        (payment_types, [{"id": i, "description": name} for i, name in PAYMENT_TYPE_NAMES.items()]),
+    ):
+        schema = pa.schema([(column.name, _arrow_type(column)) for column in table.columns])
+        (data_dir / table.name).mkdir()
+        pq.write_table(pa.Table.from_pylist(rows, schema=schema), data_dir / table.name / "part-0.parquet")
+    (data_dir / STATE_FILE).write_text("{}")
+
+    product_ids = defaultdict(set)
+    for row in product_rows:
+        product_ids[row["sale_id"]].add(row["product_id"])
+    payment_type_ids = defaultdict(set)
+    for row in payment_rows:
+        payment_type_ids[row["sale_id"]].add(row["payment_type_id"])
+
+    return {
+        "backend": ColumnarBackend(str(data_dir)),
+        "sales": sale_rows,
+        "products": product_ids,
+        "payment_types": payment_type_ids,
+        "product_names": PRODUCT_NAMES,
+        "payment_type_names": PAYMENT_TYPE_NAMES,
+    }
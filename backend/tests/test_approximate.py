@@ -0,0 +1,197 @@
+import math
+import random
+
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+pa = pytest.importorskip("pyarrow")
+
+from sqlalchemy import Numeric, Integer, column, select, table  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.schemas import AnalyticsQuery, MetricFunction  # noqa: E402
+from app.services.approximate import Z_95, sampled_metric  # noqa: E402
+from app.services.columnar import DUCKDB_DIALECT  # noqa: E402
+from app.services.query_builder import QueryBuilder  # noqa: E402
+
+sample = table(
+    "sample", column("trial", Integer), column("amount", Numeric), column("id", Integer), column("store_id", Integer)
+)
+
+
+@pytest.fixture
+def percent(monkeypatch):
+    monkeypatch.setattr(settings, "APPROX_SAMPLE_PERCENT", 10.0)
+    return 0.1
+
+
+@pytest.fixture(scope="module")
+def connection():
+    connection = duckdb.connect()
+    yield connection
+    connection.close()
+
+
+def _load(connection, trials):
+    """Grava as amostras de cada tentativa em `sample`, com linhas (amount, id, store_id)."""
+    rows = [(trial, *row) for trial, sample_rows in enumerate(trials) for row in sample_rows]
+    columns = dict(zip(["trial", "amount", "id", "store_id"], map(list, zip(*rows))))
+    schema = pa.schema([("trial", pa.int32()), ("amount", pa.float64()), ("id", pa.int32()), ("store_id", pa.int32())])
+    connection.register("sample", pa.Table.from_pydict(columns, schema=schema))
+
+
+def _estimates(connection, function, field="amount", counts_sales=True, distinct=False):
+    """Estimativa e margem de `sampled_metric` para cada tentativa gravada em `sample`."""
+    estimate, margin = sampled_metric(function, sample.c[field], counts_sales, distinct)
+    sql = (
+        select(estimate.label("estimate"), margin.label("margin"))
+        .select_from(sample)
+        .group_by(sample.c.trial)
+        .order_by(sample.c.trial)
+        .compile(dialect=DUCKDB_DIALECT, compile_kwargs={"literal_binds": True})
+    )
+    return [
+        tuple(None if value is None else float(value) for value in row)
+        for row in connection.execute(str(sql)).fetchall()
+    ]
+
+
+def _evaluate(connection, rows, function, **kwargs):
+    """Estimativa e margem sobre uma única amostra `rows`."""
+    _load(connection, [rows])
+    return _estimates(connection, function, **kwargs)[0]
+
+
+def _sample_rows(rng):
+    return [(round(rng.lognormvariate(3, 1), 2), i, rng.randint(1, 5)) for i in range(40)]
+
+
+def test_sum_estimate_and_margin(connection, percent):
+    rows = _sample_rows(random.Random(1))
+    amounts = [row[0] for row in rows]
+
+    estimate, margin = _evaluate(connection, rows, MetricFunction.SUM)
+
+    assert estimate == pytest.approx(sum(amounts) / percent)
+    expected = Z_95 * math.sqrt((1 - percent) * sum(x * x for x in amounts)) / percent
+    assert margin == pytest.approx(expected)
+
+
+def test_count_estimate_and_margin(connection, percent):
+    rows = _sample_rows(random.Random(2))
+
+    estimate, margin = _evaluate(connection, rows, MetricFunction.COUNT, field="id")
+
+    assert estimate == pytest.approx(len(rows) / percent)
+    assert margin == pytest.approx(Z_95 * math.sqrt((1 - percent) * len(rows)) / percent)
+
+
+def test_avg_estimate_and_margin(connection, percent):
+    rows = _sample_rows(random.Random(3))
+    amounts = [row[0] for row in rows]
+    mean = sum(amounts) / len(amounts)
+    stddev = math.sqrt(sum((x - mean) ** 2 for x in amounts) / (len(amounts) - 1))
+
+    estimate, margin = _evaluate(connection, rows, MetricFunction.AVG)
+
+    assert estimate == pytest.approx(mean)
+    assert margin == pytest.approx(Z_95 * math.sqrt(1 - percent) * stddev / math.sqrt(len(amounts)))
+
+
+def test_avg_of_a_single_sale_has_no_margin(connection, percent):
+    assert _evaluate(connection, [(12.5, 1, 1)], MetricFunction.AVG) == (12.5, None)
+
+
+def test_distinct_count_of_other_fields_is_an_unscaled_lower_bound(connection, percent):
+    rows = _sample_rows(random.Random(4))
+
+    estimate, margin = _evaluate(connection, rows, MetricFunction.COUNT, field="store_id", counts_sales=False, distinct=True)
+
+    assert estimate == len({row[2] for row in rows})
+    assert margin is None
+
+
+def test_margins_cover_the_population_total(connection, percent):
+    """Com amostras de Bernoulli, a margem de 95% cobre o total em cerca de 95% das vezes."""
+    rng = random.Random(5)
+    population = [round(rng.lognormvariate(3, 1), 2) for _ in range(1500)]
+    total = sum(population)
+
+    trials = 400
+    _load(connection, [
+        [(x, i, 1) for i, x in enumerate(population) if rng.random() < percent]
+        for _ in range(trials)
+    ])
+
+    sums = _estimates(connection, MetricFunction.SUM)
+    counts = _estimates(connection, MetricFunction.COUNT, field="id")
+
+    covered_sum = sum(abs(estimate - total) <= margin for estimate, margin in sums)
+    covered_count = sum(abs(estimate - len(population)) <= margin for estimate, margin in counts)
+    assert 0.9 <= covered_sum / trials <= 0.99
+    assert 0.9 <= covered_count / trials <= 0.99
+
+
+def test_approximation_lists_lower_bounds():
+    request = AnalyticsQuery(**{
+        "metrics": [
+            {"field": "total_amount", "function": "sum", "alias": "revenue"},
+            {"field": "store_name", "function": "count", "alias": "stores"},
+            {"field": "sale_id", "function": "count", "alias": "orders"},
+        ],
+        "dimensions": ["channel_name"],
+        "approximate": True,
+    })
+    builder = QueryBuilder(request)
+    builder.build()
+
+    assert builder.approximation["method"] == "sample"
+    assert builder.approximation["lower_bounds"] == ["stores"]
+
+
+def _sampled_request(**overrides):
+    return AnalyticsQuery(**{
+        "metrics": [
+            {"field": "total_amount", "function": "sum", "alias": "revenue"},
+            {"field": "customer_id", "function": "count", "alias": "customers"},
+        ],
+        "dimensions": ["store_name"],
+        "approximate": True,
+        **overrides,
+    })
+
+
+@pytest.mark.parametrize("overrides", [
+    {},
+    {"time_range": {"start_date": "2024-01-01T00:00:00", "end_date": "2024-03-31T23:59:59"}},
+    {"filters": [{"field": "sale_date", "operator": "greater_than", "value": "2024-01-01"}]},
+])
+def test_wide_ranges_read_a_system_sample(overrides):
+    builder = QueryBuilder(_sampled_request(**overrides))
+    sql = str(builder.build())
+
+    assert builder.sampled
+    assert "TABLESAMPLE system" in sql
+    assert builder.approximation["sampling"] == "system"
+
+
+@pytest.mark.parametrize("overrides", [
+    {"time_range": {"start_date": "2024-03-01T00:00:00", "end_date": "2024-03-07T23:59:59"}},
+    {"filters": [{"field": "sale_date", "operator": "in", "value": ["2024-03-01", "2024-03-10"]}]},
+])
+def test_short_ranges_run_the_exact_query(overrides):
+    builder = QueryBuilder(_sampled_request(**overrides))
+    sql = str(builder.build())
+
+    assert not builder.sampled
+    assert "TABLESAMPLE" not in sql
+    assert "approx_count_distinct" not in sql
+    assert builder.approximation == {"method": "exact"}
+
+
+def test_sampled_and_exact_plans_do_not_share_a_cached_statement():
+    wide = _sampled_request(time_range={"start_date": "2024-01-01T00:00:00", "end_date": "2024-06-30T23:59:59"})
+    short = _sampled_request(time_range={"start_date": "2024-06-01T00:00:00", "end_date": "2024-06-02T23:59:59"})
+
+    assert "TABLESAMPLE" in str(QueryBuilder(wide).build())
+    assert "TABLESAMPLE" not in str(QueryBuilder(short).build())
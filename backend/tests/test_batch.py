@@ -0,0 +1,70 @@
+from app.schemas import AnalyticsQuery
+from app.services.batch import SharedQuery, plan_batch
+from app.services.columnar import _comparable
+from app.services.query_builder import QueryBuilder
+
+TIME_RANGE = {"start_date": "2024-03-01T00:00:00", "end_date": "2024-03-05T23:59:59"}
+FILTERS = [{"field": "sale_status", "operator": "equals", "value": "COMPLETED"}]
+
+REVENUE = {"field": "total_amount", "function": "sum", "alias": "revenue"}
+ORDERS = {"field": "sale_id", "function": "count", "alias": "orders"}
+
+
+def _query(**overrides):
+    return AnalyticsQuery(**{"filters": FILTERS, "time_range": TIME_RANGE, **overrides})
+
+
+# Mesmo período e filtros: todas combináveis, com dimensões, métricas,
+# ordenação e limite diferentes (inclusive uma métrica sem alias).
+SHAREABLE = [
+    _query(metrics=[REVENUE, ORDERS], dimensions=["store_name"]),
+    _query(metrics=[ORDERS], dimensions=["sale_date"], order_by={"field": "sale_date", "direction": "desc"}, limit=3),
+    _query(metrics=[REVENUE], dimensions=["store_name"], order_by={"field": "revenue", "direction": "desc"}, limit=2),
+    _query(
+        metrics=[{"field": "delivery_fee", "function": "avg"}, REVENUE],
+        dimensions=["channel_name", "hour_of_day"],
+    ),
+    _query(metrics=[REVENUE, ORDERS], dimensions=[]),
+    _query(metrics=[ORDERS], dimensions=["hour_of_day"], order_by={"field": "hour_of_day", "direction": "asc"}),
+]
+
+
+def _records(column_names, rows):
+    return [{name: _comparable(value) for name, value in zip(column_names, row)} for row in rows]
+
+
+def _standalone(backend, query_request):
+    return _records(*backend.execute(QueryBuilder(query_request, "duckdb").build()))
+
+
+def test_plan_batch_groups_queries_over_the_same_sales():
+    queries = SHAREABLE + [
+        _query(metrics=[REVENUE], dimensions=["store_name"], page_size=10),
+        _query(metrics=[REVENUE], dimensions=["product_name"]),
+        _query(metrics=[REVENUE], dimensions=["store_name"], order_by={"field": "store_name", "direction": "asc"}),
+        _query(metrics=[REVENUE], dimensions=["store_name"], approximate=True),
+        AnalyticsQuery(metrics=[REVENUE], dimensions=["store_name"], time_range=TIME_RANGE),
+    ]
+
+    shared, single = plan_batch(queries, "duckdb")
+
+    assert shared == [list(range(len(SHAREABLE)))]
+    assert single == list(range(len(SHAREABLE), len(queries)))
+
+
+def test_shared_results_match_each_standalone_query(columnar_dataset):
+    backend = columnar_dataset["backend"]
+    shared = SharedQuery(SHAREABLE)
+
+    column_names, rows = backend.execute(shared.build("duckdb"))
+    results = shared.split(column_names, rows)
+
+    for query_request, result in zip(SHAREABLE, results):
+        expected = _standalone(backend, query_request)
+        data = [{name: _comparable(value) for name, value in row.items()} for row in result["data"]]
+        assert data
+        if query_request.order_by:
+            assert data == expected
+        else:
+            key = lambda row: [repr(value) for value in row.values()]  # noqa: E731
+            assert sorted(data, key=key) == sorted(expected, key=key)
@@ -0,0 +1,117 @@
+import pytest
+
+from app.schemas import AnalyticsQuery
+from app.services.cache import InMemoryCache, build_cache_key
+
+
+def _key(**overrides):
+    payload = {
+        "metrics": [{"field": "total_amount", "function": "sum", "alias": "revenue"}],
+        "dimensions": ["channel_name"],
+        **overrides,
+    }
+    return build_cache_key(AnalyticsQuery(**payload))
+
+
+def test_filter_order_and_equal_values_share_a_key():
+    first = _key(filters=[
+        {"field": "store_name", "operator": "in", "value": "3, 1"},
+        {"field": "sale_status", "operator": "equals", "value": "COMPLETED"},
+    ])
+    second = _key(filters=[
+        {"field": "sale_status", "operator": "equals", "value": "COMPLETED"},
+        {"field": "store_name", "operator": "in", "value": [1, 3, 1]},
+    ])
+    assert first == second
+
+
+@pytest.mark.parametrize("a, b", [
+    ({"field": "store_name", "operator": "equals", "value": "2"}, {"field": "store_name", "operator": "equals", "value": 2}),
+    ({"field": "sale_status", "operator": "equals", "value": 5}, {"field": "sale_status", "operator": "equals", "value": "5"}),
+    ({"field": "sale_date", "operator": "equals", "value": "2024-01-02"}, {"field": "sale_date", "operator": "equals", "value": "2024-01-02T10:00:00"}),
+])
+def test_normalized_filter_values_share_a_key(a, b):
+    assert _key(filters=[a]) == _key(filters=[b])
+
+
+def test_ignored_filters_do_not_change_the_key():
+    assert _key(filters=[
+        {"field": "unknown", "operator": "equals", "value": 1},
+        {"field": "store_name", "operator": "equals", "value": "not a number"},
+    ]) == _key()
+
+
+def test_time_ranges_are_compared_in_utc():
+    utc = _key(time_range={"start_date": "2024-01-01T03:00:00Z", "end_date": "2024-01-02T03:00:00Z"})
+    offset = _key(time_range={"start_date": "2024-01-01T00:00:00-03:00", "end_date": "2024-01-02T00:00:00-03:00"})
+    assert utc == offset
+
+
+def test_metric_and_dimension_order_change_the_key():
+    metrics = [
+        {"field": "total_amount", "function": "sum", "alias": "revenue"},
+        {"field": "sale_id", "function": "count", "alias": "orders"},
+    ]
+    assert _key(metrics=metrics) != _key(metrics=metrics[::-1])
+    assert _key(dimensions=["channel_name", "store_name"]) != _key(dimensions=["store_name", "channel_name"])
+
+
+def test_values_that_change_the_result_change_the_key():
+    base = _key(filters=[{"field": "store_name", "operator": "equals", "value": 1}])
+    assert base != _key(filters=[{"field": "store_name", "operator": "equals", "value": 2}])
+    assert base != _key(filters=[{"field": "store_name", "operator": "not_equals", "value": 1}])
+    assert _key() != _key(limit=10)
+    assert _key() != _key(approximate=True)
+
+
+def _sized(value):
+    """Tamanho que o cache contabiliza para `value`."""
+    probe = InMemoryCache(max_bytes=10 ** 6)
+    probe.set("probe", value, ttl=60)
+    return probe.stats()["size_bytes"]
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    value = "x" * 100
+    cache = InMemoryCache(max_bytes=3 * _sized(value))
+    for key in ("a", "b", "c"):
+        cache.set(key, value, ttl=60)
+
+    assert cache.get("a") == value  # "a" passa a ser o mais recente
+    cache.set("d", value, ttl=60)
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) == value for key in ("a", "c", "d"))
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["size_bytes"] <= stats["max_bytes"]
+
+
+def test_values_larger_than_the_cache_are_not_stored():
+    cache = InMemoryCache(max_bytes=50)
+    cache.set("big", "x" * 1000, ttl=60)
+    assert cache.get("big") is None
+    assert cache.stats()["size_bytes"] == 0
+
+
+def test_expired_entries_are_misses():
+    cache = InMemoryCache(max_bytes=10 ** 6)
+    cache.set("gone", 1, ttl=0)
+    assert cache.get("gone") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["misses"] == 1
+
+
+def test_invalidate_removes_affected_and_unscoped_entries():
+    cache = InMemoryCache(max_bytes=10 ** 6)
+    cache.set("store-1", 1, ttl=60, scope={1})
+    cache.set("store-2", 2, ttl=60, scope={2})
+    cache.set("unscoped", 3, ttl=60)
+
+    removed = cache.invalidate(lambda scope: 1 in scope)
+
+    assert removed == 2
+    assert cache.get("store-1") is None
+    assert cache.get("unscoped") is None
+    assert cache.get("store-2") == 2
+    assert cache.stats()["size_bytes"] == _sized(2)
@@ -0,0 +1,103 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.schemas import AnalyticsQuery
+from app.services.cache import ttl_for
+from app.services.change_tracker import CacheScope, ChangeSet, ChangeTracker, cache_scope
+from app.services.query_builder import sales, stores, channels
+
+from test_rollups import _sale
+
+CHANGES = ChangeSet([(1, datetime(2024, 1, 2, 10)), (1, datetime(2024, 1, 2, 10)), (2, datetime(2024, 1, 5, 0))])
+
+
+def _request(**overrides):
+    payload = {
+        "metrics": [{"field": "total_amount", "function": "sum", "alias": "revenue"}],
+        "dimensions": ["store_name"],
+        **overrides,
+    }
+    return AnalyticsQuery(**payload)
+
+
+@pytest.mark.parametrize("scope, affected", [
+    (CacheScope(None, None, None), True),
+    (CacheScope(datetime(2024, 1, 2, 10, 59), datetime(2024, 1, 2, 11), None), True),
+    (CacheScope(datetime(2024, 1, 2, 11), datetime(2024, 1, 4), None), False),
+    (CacheScope(datetime(2024, 1, 1), datetime(2024, 1, 2, 9, 59, 59), None), False),
+    (CacheScope(datetime(2024, 1, 1), datetime(2024, 1, 3), frozenset({2, 3})), False),
+    (CacheScope(datetime(2024, 1, 4, 23, 30), None, frozenset({2})), True),
+])
+def test_changes_affect_scopes_that_read_the_changed_hours(scope, affected):
+    assert CHANGES.affects(scope) is affected
+
+
+def test_change_set_summary_counts_each_hour_once():
+    assert CHANGES.summary() == {"stores": [1, 2], "dates": ["2024-01-02", "2024-01-05"], "hours": 2}
+
+
+def test_cache_scope_reads_period_in_utc_and_intersects_stores():
+    scope = cache_scope(_request(
+        time_range={"start_date": "2024-01-01T00:00:00-03:00", "end_date": "2024-01-02T00:00:00-03:00"},
+        filters=[
+            {"field": "store_name", "operator": "in", "value": [1, 2, 3]},
+            {"field": "store_name", "operator": "equals", "value": "2"},
+            {"field": "store_name", "operator": "not_equals", "value": 1},
+        ],
+    ))
+    assert scope == CacheScope(datetime(2024, 1, 1, 3), datetime(2024, 1, 2, 3), frozenset({2}))
+
+
+def test_open_periods_keep_the_short_ttl_unless_changes_are_tracked():
+    now = datetime.now(timezone.utc)
+    open_period = _request(time_range={"start_date": now - timedelta(days=1), "end_date": now + timedelta(hours=1)})
+    past_period = _request(time_range={"start_date": datetime(2024, 1, 1), "end_date": datetime(2024, 1, 2)})
+
+    assert ttl_for(open_period) == settings.CACHE_TTL_SECONDS
+    assert ttl_for(_request()) == settings.CACHE_TTL_SECONDS
+    assert ttl_for(open_period, tracked=True) == settings.CACHE_TRACKED_TTL_SECONDS
+    assert ttl_for(past_period) == settings.CACHE_HISTORICAL_TTL_SECONDS
+
+
+def test_tracker_is_current_only_after_a_recent_poll(monkeypatch):
+    monkeypatch.setattr(settings, "CHANGE_TRACKING_ENABLED", True)
+    tracker = ChangeTracker()
+    assert not tracker.is_current()
+
+    tracker.high_water_mark, tracker.last_poll = 10, datetime.now(timezone.utc)
+    assert tracker.is_current()
+
+    tracker.last_poll -= timedelta(seconds=4 * settings.CHANGE_POLL_SECONDS)
+    assert not tracker.is_current()
+
+    tracker.last_poll = datetime.now(timezone.utc)
+    monkeypatch.setattr(settings, "CHANGE_TRACKING_ENABLED", False)
+    assert not tracker.is_current()
+
+
+def test_poll_finds_new_and_updated_sales(pg_connection):
+    rng = random.Random(5)
+    connection = pg_connection
+    connection.execute(stores.insert(), [{"id": i, "name": f"Loja {i}"} for i in (1, 2, 3)])
+    connection.execute(channels.insert(), [{"id": 1, "name": "iFood"}, {"id": 2, "name": "Presencial"}])
+    old_sale = {**_sale(rng, 1, datetime(2024, 1, 1, 8, 30)), "store_id": 1}
+    connection.execute(sales.insert(), [old_sale])
+    connection.commit()
+
+    tracker = ChangeTracker()
+    assert not tracker.poll(connection)
+    assert tracker.high_water_mark == 1
+
+    connection.execute(sales.insert(), [{**_sale(rng, 2, datetime(2024, 1, 3, 12, 5)), "store_id": 2}])
+    connection.execute(update(sales).where(sales.c.id == 1).values(sale_status_desc="CANCELLED"))
+    connection.commit()
+    changes = tracker.poll(connection)
+
+    assert changes.hours == {1: [datetime(2024, 1, 1, 8)], 2: [datetime(2024, 1, 3, 12)]}
+    assert tracker.high_water_mark == 2
+    assert tracker.change_mark == 1
+    assert not tracker.poll(connection)
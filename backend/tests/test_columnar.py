@@ -0,0 +1,109 @@
+import random
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from app.core.config import settings
+from app.schemas import AnalyticsQuery
+from app.services.columnar import (
+    DIMENSION_TABLES,
+    EMPTY_PART,
+    FACT_TABLES,
+    STATE_FILE,
+    ColumnarBackend,
+    _comparable,
+    _parts,
+    _write_empty_parquet,
+    sync_columnar,
+)
+from app.services.query_builder import QueryBuilder, sales, stores, channels
+
+from test_rollups import _sale
+
+PAYLOAD = {
+    "metrics": [
+        {"field": "total_amount", "function": "sum", "alias": "revenue"},
+        {"field": "sale_id", "function": "count", "alias": "orders"},
+    ],
+    "dimensions": ["store_name", "sale_status"],
+}
+
+
+def _rows(rows):
+    return sorted(tuple(_comparable(value) for value in row) for row in rows)
+
+
+def test_empty_fact_tables_are_queryable(tmp_path):
+    pytest.importorskip("duckdb")
+    pytest.importorskip("pyarrow")
+    for table in DIMENSION_TABLES + FACT_TABLES:
+        (tmp_path / table.name).mkdir()
+        _write_empty_parquet(table, str(tmp_path / table.name / EMPTY_PART))
+    (tmp_path / STATE_FILE).write_text("{}")
+
+    column_names, rows = ColumnarBackend(str(tmp_path)).execute(
+        QueryBuilder(AnalyticsQuery(**PAYLOAD), "duckdb").build()
+    )
+
+    assert column_names == ["store_name", "sale_status", "revenue", "orders"]
+    assert rows == []
+
+
+def test_parts_cover_consecutive_id_ranges(tmp_path):
+    (tmp_path / "sales").mkdir()
+    for name in (EMPTY_PART, "part-000000000001.parquet", "part-000000000101.parquet"):
+        (tmp_path / "sales" / name).touch()
+
+    assert _parts(str(tmp_path), sales, 250) == [(1, 100), (101, 250)]
+
+
+@pytest.fixture
+def columnar_sales(pg_connection, tmp_path):
+    pytest.importorskip("duckdb")
+    pytest.importorskip("pyarrow")
+    rng = random.Random(3)
+    connection = pg_connection
+    connection.execute(stores.insert(), [{"id": i, "name": f"Loja {i}"} for i in (1, 2, 3)])
+    connection.execute(channels.insert(), [{"id": 1, "name": "iFood"}, {"id": 2, "name": "Presencial"}])
+    connection.commit()
+    return connection, str(tmp_path / "columnar"), rng
+
+
+def _compare(connection, data_dir, monkeypatch):
+    monkeypatch.setattr(settings, "ROLLUPS_ENABLED", False)
+    statement = QueryBuilder(AnalyticsQuery(**PAYLOAD)).build()
+    expected = connection.execute(statement).fetchall()
+    _, rows = ColumnarBackend(data_dir).execute(QueryBuilder(AnalyticsQuery(**PAYLOAD), "duckdb").build())
+    assert _rows(rows) == _rows(expected)
+
+
+def test_sync_of_an_empty_database_is_queryable(columnar_sales, monkeypatch):
+    connection, data_dir, _ = columnar_sales
+
+    copied = sync_columnar(connection, data_dir)
+
+    assert copied[sales.name] == 0
+    _compare(connection, data_dir, monkeypatch)
+
+
+def test_sync_rewrites_files_of_changed_sales(columnar_sales, monkeypatch):
+    monkeypatch.setattr("app.services.columnar.PART_IDS", 50)
+    connection, data_dir, rng = columnar_sales
+    connection.execute(sales.insert(), [_sale(rng, sale_id) for sale_id in range(1, 201)])
+    connection.commit()
+    assert sync_columnar(connection, data_dir)[sales.name] == 200
+    connection.commit()
+
+    connection.execute(update(sales).where(sales.c.id == 10).values(sale_status_desc="CANCELLED", total_amount=1))
+    connection.execute(delete(sales).where(sales.c.id == 120))
+    connection.execute(sales.insert(), [_sale(rng, sale_id) for sale_id in range(201, 231)])
+    connection.commit()
+
+    copied = sync_columnar(connection, data_dir)
+    connection.commit()
+
+    # Só os arquivos de 1-50 e 101-150 são regravados, sem a venda removida.
+    assert copied[sales.name] == 30
+    assert copied["sales_changes"] == 50 + 49
+    assert connection.execute(select(sales.c.id).where(sales.c.id == 120)).first() is None
+    _compare(connection, data_dir, monkeypatch)
@@ -0,0 +1,24 @@
+import pytest
+
+from app.schemas import AnalyticsQuery
+from app.services.index_advisor import evaluate_all, hypopg_available
+
+SAMPLE = AnalyticsQuery(
+    metrics=[{"field": "total_amount", "function": "sum"}],
+    dimensions=["sale_status"],
+    filters=[{"field": "store_name", "operator": "equals", "value": 1}],
+)
+
+
+def test_failed_evaluation_does_not_abort_the_next_ones(pg_connection):
+    if not hypopg_available(pg_connection):
+        pytest.skip("hypopg extension is not installed")
+
+    recommendations = [
+        {"samples": [SAMPLE], "ddl": "CREATE INDEX ON missing_table (id)"},
+        {"samples": [SAMPLE], "ddl": "CREATE INDEX ON sales (store_id)"},
+    ]
+    evaluate_all(pg_connection, recommendations)
+
+    assert "error" in recommendations[0]["evaluation"]
+    assert "cost_before" in recommendations[1]["evaluation"]
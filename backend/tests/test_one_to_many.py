@@ -0,0 +1,195 @@
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from sqlalchemy import func, or_, select
+
+from app.schemas import AnalyticsQuery
+from app.services.query_builder import QueryBuilder, payment_types, payments, product_sales, sales
+
+TIME_RANGE = {"start_date": "2024-03-02T00:00:00", "end_date": "2024-03-05T23:59:59"}
+
+
+def _run(columnar_dataset, payload):
+    column_names, rows = columnar_dataset["backend"].execute(QueryBuilder(AnalyticsQuery(**payload), "duckdb").build())
+    return {
+        tuple(record[name] for name in payload["dimensions"]): record
+        for record in (dict(zip(column_names, row)) for row in rows)
+    }
+
+
+def _in_range(sale):
+    return datetime(2024, 3, 2) <= sale["created_at"] <= datetime(2024, 3, 5, 23, 59, 59)
+
+
+def _close(actual, expected):
+    return float(actual) == pytest.approx(float(expected), rel=1e-9, abs=1e-6)
+
+
+def test_product_dimension_with_payment_filter_counts_each_sale_once(columnar_dataset):
+    payload = {
+        "metrics": [
+            {"field": "total_amount", "function": "sum", "alias": "revenue"},
+            {"field": "sale_id", "function": "count", "alias": "orders"},
+            {"field": "delivery_fee", "function": "avg", "alias": "avg_fee"},
+        ],
+        "dimensions": ["product_name"],
+        "filters": [
+            {"field": "payment_type", "operator": "equals", "value": "Pix"},
+            {"field": "store_name", "operator": "in", "value": [1, 2]},
+            {"field": "sale_status", "operator": "equals", "value": "COMPLETED"},
+        ],
+        "time_range": TIME_RANGE,
+    }
+    expected = defaultdict(lambda: {"revenue": Decimal(0), "orders": 0, "fees": []})
+    for sale in columnar_dataset["sales"]:
+        if not (_in_range(sale) and sale["store_id"] in (1, 2) and sale["sale_status_desc"] == "COMPLETED"):
+            continue
+        if 1 not in columnar_dataset["payment_types"][sale["id"]]:
+            continue
+        for product_id in columnar_dataset["products"][sale["id"]]:
+            group = expected[(columnar_dataset["product_names"][product_id],)]
+            group["revenue"] += sale["total_amount"]
+            group["orders"] += 1
+            if sale["delivery_fee"] is not None:
+                group["fees"].append(sale["delivery_fee"])
+
+    result = _run(columnar_dataset, payload)
+    assert result.keys() == expected.keys()
+    for key, group in expected.items():
+        assert _close(result[key]["revenue"], group["revenue"])
+        assert result[key]["orders"] == group["orders"]
+        assert _close(result[key]["avg_fee"], sum(group["fees"]) / len(group["fees"]))
+
+
+def test_product_and_payment_dimensions_with_product_filter(columnar_dataset):
+    payload = {
+        "metrics": [
+            {"field": "total_amount", "function": "sum", "alias": "revenue"},
+            {"field": "sale_id", "function": "count", "alias": "orders"},
+        ],
+        "dimensions": ["product_name", "payment_type"],
+        "filters": [{"field": "product_name", "operator": "in", "value": "1,2"}],
+        "time_range": TIME_RANGE,
+    }
+    expected = defaultdict(lambda: {"revenue": Decimal(0), "orders": 0})
+    for sale in filter(_in_range, columnar_dataset["sales"]):
+        for product_id in columnar_dataset["products"][sale["id"]] & {1, 2}:
+            for payment_type_id in columnar_dataset["payment_types"][sale["id"]]:
+                group = expected[(columnar_dataset["product_names"][product_id], columnar_dataset["payment_type_names"][payment_type_id])]
+                group["revenue"] += sale["total_amount"]
+                group["orders"] += 1
+
+    result = _run(columnar_dataset, payload)
+    assert result.keys() == expected.keys()
+    for key, group in expected.items():
+        assert _close(result[key]["revenue"], group["revenue"])
+        assert result[key]["orders"] == group["orders"]
+
+
+def test_distinct_products_next_to_sales_metrics(columnar_dataset):
+    payload = {
+        "metrics": [
+            {"field": "product_name", "function": "count", "alias": "products"},
+            {"field": "total_amount", "function": "sum", "alias": "revenue"},
+            {"field": "total_amount", "function": "avg", "alias": "ticket"},
+            {"field": "sale_id", "function": "count", "alias": "orders"},
+        ],
+        "dimensions": ["store_name"],
+        "filters": [
+            {"field": "product_name", "operator": "in", "value": [1, 3]},
+            {"field": "payment_type", "operator": "not_equals", "value": "Dinheiro"},
+        ],
+        "time_range": TIME_RANGE,
+    }
+    expected = defaultdict(lambda: {"products": set(), "amounts": []})
+    for sale in filter(_in_range, columnar_dataset["sales"]):
+        matched = columnar_dataset["products"][sale["id"]] & {1, 3}
+        if not matched or not columnar_dataset["payment_types"][sale["id"]] - {3}:
+            continue
+        group = expected[(f"Loja {sale['store_id']}",)]
+        group["products"] |= matched
+        group["amounts"].append(sale["total_amount"])
+
+    result = _run(columnar_dataset, payload)
+    assert result.keys() == expected.keys()
+    for key, group in expected.items():
+        assert result[key]["products"] == len(group["products"])
+        assert result[key]["orders"] == len(group["amounts"])
+        assert _close(result[key]["revenue"], sum(group["amounts"]))
+        assert _close(result[key]["ticket"], sum(group["amounts"]) / len(group["amounts"]))
+
+
+def test_product_filter_without_dimension_is_a_semi_join(columnar_dataset):
+    payload = {
+        "metrics": [
+            {"field": "total_amount", "function": "sum", "alias": "revenue"},
+            {"field": "sale_id", "function": "count", "alias": "orders"},
+        ],
+        "dimensions": [],
+        "filters": [{"field": "product_name", "operator": "equals", "value": 4}],
+    }
+    matched = [sale for sale in columnar_dataset["sales"] if 4 in columnar_dataset["products"][sale["id"]]]
+
+    builder = QueryBuilder(AnalyticsQuery(**payload), "duckdb")
+    builder.build()
+    assert "product_name" in builder.semi_joins or not builder.one_to_many
+
+    result = _run(columnar_dataset, payload)[()]
+    assert result["orders"] == len(matched)
+    assert _close(result["revenue"], sum(sale["total_amount"] for sale in matched))
+
+
+
+def _joined_totals(backend, field, distinct):
+    """Receita e pedidos por loja com o filtro aplicado por join direto (com ou sem DISTINCT por venda)."""
+    if field == "payment_type":
+        source = sales.join(payments, payments.c.sale_id == sales.c.id).join(
+            payment_types, payment_types.c.id == payments.c.payment_type_id
+        )
+        condition = payment_types.c.description == "Pix"
+    else:
+        source = sales.join(product_sales, product_sales.c.sale_id == sales.c.id)
+        condition = or_(product_sales.c.product_id == 1, product_sales.c.product_id == 2)
+    joined = select(sales.c.id, sales.c.store_id, sales.c.total_amount).select_from(source).where(
+        condition, sales.c.created_at.between(datetime(2024, 3, 2), datetime(2024, 3, 5, 23, 59, 59))
+    )
+    if distinct:
+        joined = joined.distinct()
+    joined = joined.subquery()
+    column_names, rows = backend.execute(
+        select(joined.c.store_id, func.sum(joined.c.total_amount), func.count(joined.c.id)).group_by(joined.c.store_id)
+    )
+    return {(f"Loja {store_id}",): (revenue, orders) for store_id, revenue, orders in rows}
+
+
+@pytest.mark.parametrize("field, value", [("payment_type", "Pix"), ("product_name", [1, 2])])
+def test_filter_only_reference_is_a_semi_join_without_fan_out(columnar_dataset, field, value):
+    payload = {
+        "metrics": [
+            {"field": "total_amount", "function": "sum", "alias": "revenue"},
+            {"field": "sale_id", "function": "count", "alias": "orders"},
+        ],
+        "dimensions": ["store_name"],
+        "filters": [{"field": field, "operator": "in" if isinstance(value, list) else "equals", "value": value}],
+        "time_range": TIME_RANGE,
+    }
+    builder = QueryBuilder(AnalyticsQuery(**payload), "duckdb")
+    sql = str(builder.build())
+    assert field not in builder.one_to_many
+    assert "sales.id IN (SELECT" in sql
+    assert "JOIN payments" not in sql and "JOIN product_sales" not in sql
+
+    backend = columnar_dataset["backend"]
+    result = _run(columnar_dataset, payload)
+    joined = _joined_totals(backend, field, distinct=True)
+    fanned_out = _joined_totals(backend, field, distinct=False)
+
+    # O join sem DISTINCT repete a venda a cada pagamento/produto que casa; o semi-join não.
+    assert result.keys() == joined.keys()
+    assert any(fanned_out[key][1] > orders for key, (revenue, orders) in joined.items())
+    for key, (revenue, orders) in joined.items():
+        assert result[key]["orders"] == orders
+        assert _close(result[key]["revenue"], revenue)
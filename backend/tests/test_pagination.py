@@ -0,0 +1,119 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from app.main import _next_cursor
+from app.schemas import AnalyticsQuery
+from app.services.pagination import InvalidCursor, decode_cursor, encode_cursor
+from app.services.query_builder import QueryBuilder
+
+TIME_RANGE = {"start_date": "2024-03-01T00:00:00", "end_date": "2024-03-06T23:59:59"}
+
+
+def _query(**overrides):
+    payload = {
+        "metrics": [
+            {"field": "total_amount", "function": "sum", "alias": "revenue"},
+            {"field": "sale_id", "function": "count", "alias": "orders"},
+        ],
+        "dimensions": ["store_name", "sale_date"],
+        "time_range": TIME_RANGE,
+        **overrides,
+    }
+    return AnalyticsQuery(**payload)
+
+
+def test_cursor_round_trip_keeps_value_types():
+    query = _query(page_size=10)
+    values = [Decimal("1234.50"), 7, 2.5, "Loja 1", date(2024, 3, 2), datetime(2024, 3, 2, 10, 30), None, True]
+
+    decoded = decode_cursor(query.model_copy(update={"cursor": encode_cursor(query, values)}))
+
+    assert decoded == values
+    assert [type(value) for value in decoded] == [type(value) for value in values]
+
+
+def test_cursor_from_another_query_is_rejected():
+    cursor = encode_cursor(_query(page_size=10), [Decimal("10.00"), "Loja 1", date(2024, 3, 2)])
+    other = _query(
+        page_size=10,
+        cursor=cursor,
+        filters=[{"field": "store_name", "operator": "equals", "value": 1}],
+    )
+    with pytest.raises(InvalidCursor):
+        decode_cursor(other)
+
+
+def test_cursor_ignores_its_own_value_in_the_fingerprint():
+    query = _query(page_size=10)
+    first = encode_cursor(query, ["Loja 1", date(2024, 3, 2)])
+    second = encode_cursor(query.model_copy(update={"cursor": first}), ["Loja 2", date(2024, 3, 4)])
+    assert decode_cursor(query.model_copy(update={"cursor": second})) == ["Loja 2", date(2024, 3, 4)]
+
+
+@pytest.mark.parametrize("token", ["not-a-cursor", "e30", ""])
+def test_malformed_cursor_is_rejected(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(_query(page_size=10, cursor=token or "%%%"))
+
+
+def test_cursor_with_another_key_length_is_rejected():
+    query = _query(page_size=10)
+    cursor = encode_cursor(query, ["Loja 1"])
+    with pytest.raises(InvalidCursor):
+        QueryBuilder(query.model_copy(update={"cursor": cursor})).build()
+
+
+def _pages(backend, query):
+    """Percorre todas as páginas de `query` seguindo o cursor de cada resposta."""
+    pages, cursor = [], None
+    while True:
+        page_query = query.model_copy(update={"cursor": cursor})
+        builder = QueryBuilder(page_query, "duckdb")
+        column_names, rows = backend.execute(builder.build())
+        pages.append([dict(zip(column_names, row)) for row in rows])
+        cursor = _next_cursor(page_query, builder, column_names, rows)
+        if cursor is None:
+            return pages, builder
+        assert len(pages) < 100
+
+
+def _all_rows(backend, query):
+    column_names, rows = backend.execute(
+        QueryBuilder(query.model_copy(update={"page_size": None}), "duckdb").build()
+    )
+    return [dict(zip(column_names, row)) for row in rows]
+
+
+@pytest.mark.parametrize("direction", ["asc", "desc"])
+def test_dimension_ordered_pages_cover_every_row_once(columnar_dataset, direction):
+    query = _query(page_size=7, order_by={"field": "sale_date", "direction": direction})
+    pages, _ = _pages(columnar_dataset["backend"], query)
+
+    paged = [row for page in pages for row in page]
+    expected = sorted(
+        _all_rows(columnar_dataset["backend"], query),
+        key=lambda row: (row["sale_date"], row["store_name"]),
+        reverse=direction == "desc",
+    )
+    assert len(pages) > 2
+    assert all(len(page) == 7 for page in pages[:-1])
+    assert paged == expected
+
+
+def test_metric_ordered_pages_filter_in_having(columnar_dataset):
+    query = _query(page_size=5, order_by={"field": "revenue", "direction": "desc"})
+    pages, last_builder = _pages(columnar_dataset["backend"], query)
+
+    paged = [row for page in pages for row in page]
+    expected = sorted(
+        _all_rows(columnar_dataset["backend"], query),
+        key=lambda row: (row["revenue"], row["store_name"], row["sale_date"]),
+        reverse=True,
+    )
+    assert len(pages) > 2
+    assert paged == expected
+    assert len({(row["store_name"], row["sale_date"]) for row in paged}) == len(paged)
+    assert last_builder.sort_keys == ["revenue", "store_name", "sale_date"]
+    assert "HAVING" in str(last_builder.query)
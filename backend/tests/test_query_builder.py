@@ -0,0 +1,91 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import Date, String
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from app.core.config import settings
+from app.schemas import AnalyticsQuery
+from app.services.query_builder import QueryBuilder
+
+
+def _compile(payload):
+    """Compila a consulta como no DB_MODE=async, em que os binds levam tipo."""
+    return QueryBuilder(AnalyticsQuery(**payload)).build().compile(dialect=asyncpg.dialect())
+
+
+def _sale_date_query(operator, value):
+    return {
+        "metrics": [{"field": "sale_id", "function": "count"}],
+        "dimensions": ["sale_status"],
+        "filters": [{"field": "sale_date", "operator": operator, "value": value}],
+    }
+
+
+@pytest.mark.parametrize("rollups", [False, True])
+@pytest.mark.parametrize("operator, value", [
+    ("not_equals", "2024-01-02"),
+    ("equals", "2024-01-02"),
+    ("in", "2024-01-01,2024-01-03"),
+])
+def test_sale_date_filters_bind_dates(monkeypatch, rollups, operator, value):
+    monkeypatch.setattr(settings, "ROLLUPS_ENABLED", rollups)
+    compiled = _compile(_sale_date_query(operator, value))
+
+    assert "::VARCHAR" not in str(compiled).split("WHERE")[-1]
+    filter_binds = {name: bind for name, bind in compiled.binds.items() if name.startswith("filter_0")}
+    assert filter_binds
+    for bind in filter_binds.values():
+        if bind.key == "filter_0":
+            assert isinstance(bind.type, Date)
+            values = bind.value if isinstance(bind.value, list) else [bind.value]
+            assert all(type(v) is date for v in values)
+
+
+def test_invalid_sale_date_filter_is_ignored():
+    compiled = _compile(_sale_date_query("not_equals", "not a date"))
+    assert not any(name.startswith("filter_0") for name in compiled.binds)
+
+
+def _sale_status_query(value):
+    return {
+        "metrics": [{"field": "sale_id", "function": "count"}],
+        "dimensions": ["store_name"],
+        "filters": [{"field": "sale_status", "operator": "equals", "value": value}],
+    }
+
+
+@pytest.mark.parametrize("values", [(5, "COMPLETED"), ("COMPLETED", 5)])
+def test_cached_template_binds_column_type(values):
+    """O primeiro valor a montar o formato não decide o tipo do bind dos próximos."""
+    for value in values:
+        compiled = _compile(_sale_status_query(value))
+
+        assert "::INTEGER" not in str(compiled)
+        bind = compiled.binds["filter_0"]
+        assert isinstance(bind.type, String)
+        assert compiled.params["filter_0"] == str(value)
+
+
+@pytest.mark.parametrize("rollups", [False, True])
+def test_whole_hours_are_half_open(monkeypatch, rollups):
+    monkeypatch.setattr(settings, "ROLLUPS_ENABLED", rollups)
+    compiled = _compile({
+        "metrics": [{"field": "sale_id", "function": "count"}],
+        "dimensions": ["store_name"],
+        "time_range": {"start_date": "2024-01-01T00:00:00", "end_date": "2024-01-03T23:59:59.999"},
+    })
+
+    assert "BETWEEN" not in str(compiled)
+    assert compiled.params["time_before"] == datetime(2024, 1, 4)
+
+
+def test_partial_hours_keep_between():
+    compiled = _compile({
+        "metrics": [{"field": "sale_id", "function": "count"}],
+        "dimensions": ["store_name"],
+        "time_range": {"start_date": "2024-01-01T00:00:00", "end_date": "2024-01-03T12:30:00"},
+    })
+
+    assert "BETWEEN" in str(compiled)
+    assert compiled.params["time_end"] == datetime(2024, 1, 3, 12, 30)
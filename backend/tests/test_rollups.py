@@ -0,0 +1,199 @@
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import delete, func, select, update
+
+from app.core.config import settings
+from app.schemas import AnalyticsQuery
+from app.services.query_builder import (
+    QueryBuilder,
+    sales,
+    stores,
+    channels,
+    sales_changes,
+    rollup_refresh_state,
+)
+from app.services.rollups import refresh_rollups, settled_bounds
+
+START = datetime(2024, 1, 1)
+TIME_RANGE = {"start_date": "2024-01-01T00:00:00", "end_date": "2024-01-03T23:59:59.999"}
+STATUSES = ("COMPLETED", "CANCELLED")
+# Depois de 23:59:59.999 e ainda dentro da última hora do período.
+LAST_INSTANT = datetime(2024, 1, 3, 23, 59, 59, 999500)
+
+
+def _time_columns(created_at):
+    return {
+        "created_at": created_at,
+        "sale_date": created_at.date(),
+        "hour_of_day": created_at.hour,
+        "day_of_week": created_at.isoweekday(),
+    }
+
+
+def _sale(rng, sale_id, created_at=None):
+    created_at = created_at or START + timedelta(minutes=rng.randrange(3 * 24 * 60))
+    return {
+        "id": sale_id,
+        "store_id": rng.randint(1, 3),
+        "channel_id": rng.randint(1, 2),
+        "customer_id": rng.randint(1, 50),
+        "total_amount": Decimal(rng.randint(500, 20000)) / 100,
+        # Medidas com NULL: o rollup guarda a contagem de não nulos.
+        "total_discount": None if rng.random() < 0.3 else Decimal(rng.randint(0, 500)) / 100,
+        "delivery_fee": None if rng.random() < 0.5 else Decimal(rng.randint(0, 1500)) / 100,
+        "sale_status_desc": rng.choice(STATUSES),
+        **_time_columns(created_at),
+    }
+
+
+@pytest.fixture
+def rollup_data(pg_connection):
+    """Vendas já agregadas no rollup e outras ainda acima da marca d'água."""
+    rng = random.Random(7)
+    connection = pg_connection
+    connection.execute(stores.insert(), [{"id": i, "name": f"Loja {i}"} for i in (1, 2, 3)])
+    connection.execute(channels.insert(), [{"id": 1, "name": "iFood"}, {"id": 2, "name": "Presencial"}])
+    connection.execute(sales.insert(), [_sale(rng, sale_id) for sale_id in range(1, 400)])
+    connection.execute(sales.insert(), [_sale(rng, 400, LAST_INSTANT)])
+    connection.commit()
+
+    refresh_rollups(connection)
+    connection.commit()
+
+    connection.execute(sales.insert(), [_sale(rng, sale_id) for sale_id in range(401, 461)])
+    connection.commit()
+    return connection
+
+
+def _normalize(value):
+    if isinstance(value, (Decimal, float)):
+        return round(float(value), 6)
+    return value
+
+
+def _run(connection, monkeypatch, payload, rollups):
+    monkeypatch.setattr(settings, "ROLLUPS_ENABLED", rollups)
+    builder = QueryBuilder(AnalyticsQuery(**payload))
+    assert builder.use_rollup is rollups
+    rows = connection.execute(builder.build()).all()
+    return sorted((tuple(_normalize(value) for value in row) for row in rows), key=repr)
+
+
+METRICS = [
+    {"field": "sale_id", "function": "count", "alias": "sales"},
+    *[
+        {"field": field, "function": function, "alias": f"{function}_{field}"}
+        for field in ("total_amount", "total_discount", "delivery_fee")
+        for function in ("sum", "avg")
+    ],
+]
+
+FILTERS = [
+    [],
+    [{"field": "store_name", "operator": "equals", "value": 2}],
+    [{"field": "store_name", "operator": "not_equals", "value": 2}],
+    [{"field": "store_name", "operator": "greater_than", "value": 1}],
+    [{"field": "store_name", "operator": "less_than", "value": 3}],
+    [{"field": "store_name", "operator": "in", "value": "1,3"}],
+    [{"field": "channel_name", "operator": "equals", "value": "iFood"}],
+    [{"field": "sale_status", "operator": "in", "value": ["COMPLETED"]}],
+    [{"field": "sale_date", "operator": "equals", "value": "2024-01-02"}],
+    [{"field": "sale_date", "operator": "not_equals", "value": "2024-01-02"}],
+    [{"field": "sale_date", "operator": "greater_than", "value": "2024-01-01"}],
+    [{"field": "sale_date", "operator": "less_than", "value": "2024-01-03"}],
+    [{"field": "sale_date", "operator": "in", "value": "2024-01-01,2024-01-03"}],
+    [{"field": "hour_of_day", "operator": "greater_than", "value": 11}],
+    [{"field": "day_of_week", "operator": "equals", "value": 2}],
+]
+
+
+@pytest.mark.parametrize("metric", METRICS, ids=lambda m: m["alias"])
+def test_rollup_matches_raw_per_metric(rollup_data, monkeypatch, metric):
+    payload = {
+        "metrics": [metric],
+        "dimensions": ["store_name", "sale_date"],
+        "time_range": TIME_RANGE,
+    }
+    raw = _run(rollup_data, monkeypatch, payload, rollups=False)
+    assert raw
+    assert _run(rollup_data, monkeypatch, payload, rollups=True) == raw
+
+
+@pytest.mark.parametrize("filters", FILTERS, ids=lambda f: f"{f[0]['field']}-{f[0]['operator']}" if f else "none")
+def test_rollup_matches_raw_per_filter(rollup_data, monkeypatch, filters):
+    payload = {
+        "metrics": METRICS,
+        "dimensions": ["channel_name", "sale_status"],
+        "filters": filters,
+        "time_range": TIME_RANGE,
+    }
+    raw = _run(rollup_data, monkeypatch, payload, rollups=False)
+    assert _run(rollup_data, monkeypatch, payload, rollups=True) == raw
+
+
+def test_rollup_includes_the_last_instant_of_the_hour(rollup_data, monkeypatch):
+    payload = {"metrics": METRICS, "dimensions": ["sale_date"], "time_range": TIME_RANGE}
+    raw = _run(rollup_data, monkeypatch, payload, rollups=False)
+    assert _run(rollup_data, monkeypatch, payload, rollups=True) == raw
+
+    last_day = next(row for row in raw if row[0] == LAST_INSTANT.date())
+    expected = rollup_data.execute(
+        select(func.count()).where(sales.c.sale_date == LAST_INSTANT.date())
+    ).scalar()
+    assert last_day[1] == expected
+
+
+def test_rollup_follows_sales_changed_after_aggregation(rollup_data, monkeypatch):
+    connection = rollup_data
+    connection.execute(
+        update(sales).where(sales.c.id.in_([1, 2, 3]))
+        .values(sale_status_desc="REFUNDED", total_amount=Decimal("1.00"))
+    )
+    connection.execute(
+        update(sales).where(sales.c.id == 4)
+        .values(store_id=3, **_time_columns(START + timedelta(hours=50, minutes=30)))
+    )
+    connection.execute(delete(sales).where(sales.c.id == 5))
+    connection.commit()
+
+    payload = {
+        "metrics": METRICS,
+        "dimensions": ["store_name", "sale_status", "sale_date"],
+        "time_range": TIME_RANGE,
+    }
+    raw = _run(connection, monkeypatch, payload, rollups=False)
+    # Antes do refresh, as horas alteradas são lidas de `sales`.
+    assert _run(connection, monkeypatch, payload, rollups=True) == raw
+
+    refresh_rollups(connection)
+    connection.commit()
+
+    last_change_id = connection.execute(select(rollup_refresh_state.c.last_change_id)).scalar()
+    assert last_change_id == connection.execute(select(func.max(sales_changes.c.id))).scalar()
+    assert _run(connection, monkeypatch, payload, rollups=True) == raw
+
+
+def test_settled_bounds_without_other_transactions():
+    upper, pending = settled_bounds((10, None, None), 25, xmin=100, xmax=100, others_running=False)
+    assert upper == 25
+    assert pending == (None, None)
+
+
+def test_settled_bounds_waits_for_running_transactions():
+    # Um id abaixo de 25 pode estar em uma transação ainda aberta.
+    upper, pending = settled_bounds((10, None, None), 25, xmin=90, xmax=100, others_running=True)
+    assert upper == 10
+    assert pending == (25, 100)
+
+    # Enquanto alguma transação daquele momento segue aberta, a marca espera.
+    upper, pending = settled_bounds((10, 25, 100), 30, xmin=95, xmax=110, others_running=True)
+    assert upper == 10
+    assert pending == (25, 100)
+
+    # Terminadas, o maior id visto no refresh anterior está assentado.
+    upper, pending = settled_bounds((10, 25, 100), 30, xmin=105, xmax=110, others_running=True)
+    assert upper == 25
+    assert pending == (30, 110)
@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+import app.main as main
+from app.services.options_catalog import _etag, options_catalog
+from app.services.query_builder import products
+from app.services.search import PrefixIndex, contains_query, prefix_query, search_params
+
+NAMES = ["Batata Frita", "batata doce", "Bacon Extra", "Suco de Batata", "Açaí", "X-Bacon", "Ba_nana"]
+ITEMS = [{"id": i, "name": name} for i, name in enumerate(NAMES, start=1)]
+
+
+def _names(items):
+    return [item["name"] for item in items]
+
+
+def test_prefix_matches_come_first_in_name_order():
+    index = PrefixIndex(ITEMS)
+    items, has_more = index.search("BAT", limit=10)
+    assert _names(items) == ["batata doce", "Batata Frita", "Suco de Batata"]
+    assert not has_more
+
+
+def test_short_terms_only_match_prefixes():
+    index = PrefixIndex(ITEMS)
+    assert _names(index.search("ba", limit=10)[0]) == ["Ba_nana", "Bacon Extra", "batata doce", "Batata Frita"]
+    assert _names(index.search("ac", limit=10)[0]) == []
+    assert _names(index.search("aça", limit=10)[0]) == ["Açaí"]
+
+
+def test_pages_continue_from_prefix_into_contains_matches():
+    index = PrefixIndex(ITEMS)
+    first, has_more = index.search("bac", limit=1)
+    second, has_more_after = index.search("bac", limit=1, offset=1)
+    assert (_names(first), has_more) == (["Bacon Extra"], True)
+    assert (_names(second), has_more_after) == (["X-Bacon"], False)
+
+
+def test_empty_term_lists_everything_in_order():
+    items, has_more = PrefixIndex(ITEMS).search("", limit=3)
+    assert _names(items) == ["Açaí", "Ba_nana", "Bacon Extra"]
+    assert has_more
+
+
+def _database_search(monkeypatch, prefix_rows, count=0, contains_rows=()):
+    """Roda `_search_database` com respostas fixas; devolve o resultado e as consultas feitas."""
+    statements = []
+
+    async def fetch_rows(statement):
+        statements.append(statement)
+        if statement.text.lstrip().startswith("SELECT count(*)"):
+            return ["count"], [(count,)]
+        if "ILIKE" in statement.text:
+            return ["id", "name"], list(contains_rows)
+        return ["id", "name"], list(prefix_rows)
+
+    monkeypatch.setattr(main, "fetch_rows", fetch_rows)
+
+    def run(q, limit, offset=0):
+        statements.clear()
+        result = asyncio.run(main._search_database("products", q, limit, offset))
+        return result, [(statement.text, statement.compile().params) for statement in statements]
+
+    return run
+
+
+def test_short_terms_do_not_run_the_contains_search(monkeypatch):
+    run = _database_search(monkeypatch, prefix_rows=[(1, "Batata")], contains_rows=[(9, "Suco de Batata")])
+    (data, has_more), statements = run("ba", limit=5)
+    assert _names(data) == ["Batata"] and not has_more
+    assert len(statements) == 1 and "ILIKE" not in statements[0][0]
+
+
+def test_full_prefix_page_skips_the_contains_search(monkeypatch):
+    run = _database_search(monkeypatch, prefix_rows=[(1, "Batata"), (2, "Batata Doce"), (3, "Batata Frita")])
+    (data, has_more), statements = run("bat", limit=2)
+    assert _names(data) == ["Batata", "Batata Doce"] and has_more
+    assert len(statements) == 1
+
+
+def test_contains_search_completes_the_page(monkeypatch):
+    run = _database_search(monkeypatch, prefix_rows=[(1, "Batata")], contains_rows=[(9, "Suco de Batata")])
+    (data, has_more), statements = run("bat", limit=5)
+    assert _names(data) == ["Batata", "Suco de Batata"] and not has_more
+    assert statements[1][1]["limit"] == 5 and statements[1][1]["offset"] == 0
+
+
+def test_offset_past_the_prefix_matches_counts_them(monkeypatch):
+    run = _database_search(monkeypatch, prefix_rows=[], count=3, contains_rows=[(9, "Suco de Batata")])
+    (data, _), statements = run("bat", limit=2, offset=4)
+    assert _names(data) == ["Suco de Batata"]
+    assert [params.get("offset") for _, params in statements] == [4, None, 1]
+
+
+def test_search_params_escape_like_wildcards():
+    assert search_params("Ba_N%") == {"contains": "%ba\\_n\\%%", "prefix": "ba\\_n\\%%"}
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    lists = {"stores": ITEMS[:2], "channels": ["iFood", "Presencial"]}
+    monkeypatch.setattr(options_catalog, "lists", lists)
+    monkeypatch.setattr(options_catalog, "etags", {name: _etag(values) for name, values in lists.items()})
+    monkeypatch.setattr(options_catalog, "etag", _etag(lists))
+    monkeypatch.setattr(options_catalog, "indexes", {"stores": PrefixIndex(ITEMS), "products": PrefixIndex(ITEMS)})
+    return TestClient(main.app)
+
+
+def test_options_are_sent_with_an_etag(catalog):
+    response = catalog.get("/api/options/stores")
+    assert response.status_code == 200
+    assert response.json() == {"data": ITEMS[:2]}
+    assert response.headers["etag"] == _etag(ITEMS[:2])
+    assert response.headers["cache-control"] == "no-cache"
+
+
+@pytest.mark.parametrize("path, name", [("/api/options/channels", "channels"), ("/api/options", None)])
+def test_matching_etag_returns_not_modified(catalog, path, name):
+    etag = options_catalog.etags[name] if name else options_catalog.etag
+    for header in (etag, f'"other", {etag}', "*"):
+        response = catalog.get(path, headers={"If-None-Match": header})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    assert catalog.get(path, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_search_endpoint_uses_the_memory_index(catalog, monkeypatch):
+    monkeypatch.setattr(main.settings, "SEARCH_BACKEND", "memory")
+    response = catalog.get("/api/options/products/search", params={"q": " bac ", "limit": 1})
+    assert response.json() == {"data": [{"id": 3, "name": "Bacon Extra"}], "has_more": True}
+    assert catalog.get("/api/options/unknown/search").status_code == 404
+    assert catalog.get("/api/options/products/search", params={"limit": 0}).status_code == 400
+
+
+def test_database_search_uses_the_prefix_index(pg_connection):
+    connection = pg_connection
+    connection.execute(products.insert(), ITEMS)
+    connection.execute(text("CREATE INDEX idx_products_name_prefix ON products (lower(name) text_pattern_ops)"))
+    connection.execute(text("SET LOCAL enable_seqscan = off"))
+
+    def fetch(statement, **params):
+        return _names({"id": row[0], "name": row[1]} for row in connection.execute(
+            statement, {**search_params("bat"), "limit": 10, "offset": 0, **params}
+        ))
+
+    assert fetch(prefix_query("products")) == ["batata doce", "Batata Frita"]
+    assert fetch(contains_query("products")) == ["Suco de Batata"]
+    plan = "\n".join(row[0] for row in connection.execute(
+        text(f"EXPLAIN {prefix_query('products').text}"), {**search_params("bat"), "limit": 10, "offset": 0}
+    ))
+    assert "idx_products_name_prefix" in plan
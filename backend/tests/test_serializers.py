@@ -0,0 +1,74 @@
+import asyncio
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.services.serializers import ndjson_lines, rows_to_arrow
+
+
+def _collect(batches):
+    async def collect():
+        return [chunk async for chunk in ndjson_lines(batches)]
+    return b"".join(asyncio.run(collect())).decode().splitlines()
+
+
+def test_ndjson_lines_serializes_each_row():
+    async def batches():
+        yield ["store", "total"], [("Loja 1", Decimal("10.50")), ("Loja 2", None)]
+
+    lines = _collect(batches())
+    assert [json.loads(line) for line in lines] == [
+        {"store": "Loja 1", "total": 10.5},
+        {"store": "Loja 2", "total": None},
+    ]
+
+
+def test_ndjson_lines_ends_with_error_record_when_the_database_fails():
+    async def batches():
+        yield ["store"], [("Loja 1",)]
+        raise OperationalError("FETCH FORWARD", {}, Exception("connection lost"))
+
+    lines = [json.loads(line) for line in _collect(batches())]
+    assert lines[0] == {"store": "Loja 1"}
+    assert lines[-1]["error"].startswith("Database error:")
+    assert len(lines) == 2
+
+
+def _read_arrow(payload):
+    pa = pytest.importorskip("pyarrow")
+    return pa.ipc.open_stream(payload).read_all()
+
+
+def test_arrow_round_trip_keeps_types_and_nulls():
+    pa = pytest.importorskip("pyarrow")
+    rows = [
+        ("Loja 1", date(2024, 3, 2), datetime(2024, 3, 2, 10, 0), 3, Decimal("10.50"), None),
+        ("Loja 2", date(2024, 3, 3), None, None, Decimal("7.25"), None),
+    ]
+    columns = ["store", "day", "hour", "orders", "revenue", "missing"]
+
+    table = _read_arrow(rows_to_arrow(columns, rows))
+
+    assert table.column_names == columns
+    assert table.schema.field("store").type == pa.string()
+    assert table.schema.field("day").type == pa.date32()
+    assert pa.types.is_timestamp(table.schema.field("hour").type)
+    assert pa.types.is_integer(table.schema.field("orders").type)
+    assert pa.types.is_decimal(table.schema.field("revenue").type)
+    assert [tuple(row.values()) for row in table.to_pylist()] == rows
+    assert table.schema.metadata is None
+
+
+def test_arrow_of_an_empty_result_keeps_the_columns():
+    table = _read_arrow(rows_to_arrow(["store", "revenue"], []))
+    assert table.column_names == ["store", "revenue"]
+    assert table.num_rows == 0
+
+
+def test_arrow_carries_the_approximation_metadata():
+    approximation = {"method": "sample", "sample_percent": 5.0, "lower_bounds": ["stores"]}
+    table = _read_arrow(rows_to_arrow(["revenue"], [(Decimal("1.00"),)], {"approximation": approximation}))
+    assert json.loads(table.schema.metadata[b"approximation"]) == approximation
@@ -0,0 +1,75 @@
+import pytest
+
+from app.schemas import AnalyticsQuery
+from app.services.columnar import _comparable
+from app.services.query_builder import GROUPING_COLUMN, InvalidQuery, QueryBuilder, grouping_mask
+
+TIME_RANGE = {"start_date": "2024-03-01T00:00:00", "end_date": "2024-03-04T23:59:59"}
+METRICS = [
+    {"field": "total_amount", "function": "sum", "alias": "revenue"},
+    {"field": "sale_id", "function": "count", "alias": "orders"},
+    {"field": "delivery_fee", "function": "avg", "alias": "avg_fee"},
+]
+
+
+def _query(dimensions, **overrides):
+    return AnalyticsQuery(metrics=METRICS, dimensions=dimensions, time_range=TIME_RANGE, **overrides)
+
+
+def _records(backend, query_request):
+    builder = QueryBuilder(query_request, "duckdb")
+    column_names, rows = backend.execute(builder.build())
+    return builder, [{name: _comparable(value) for name, value in zip(column_names, row)} for row in rows]
+
+
+def _sorted(rows):
+    return sorted(rows, key=lambda row: [repr(value) for value in row.values()])
+
+
+@pytest.mark.parametrize("dimensions, subtotals", [
+    (["store_name", "channel_name"], {"mode": "rollup"}),
+    (["store_name", "sale_status", "day_of_week"], {"mode": "cube"}),
+    (["store_name", "channel_name", "hour_of_day"], {
+        "mode": "grouping_sets",
+        "grouping_sets": [["hour_of_day"], ["channel_name", "store_name"], []],
+    }),
+    (["product_name", "store_name"], {
+        "mode": "grouping_sets",
+        "grouping_sets": [["product_name", "store_name"], ["product_name"]],
+    }),
+])
+def test_subtotal_rows_match_separately_grouped_queries(columnar_dataset, dimensions, subtotals):
+    backend = columnar_dataset["backend"]
+    builder, rows = _records(backend, _query(dimensions, subtotals=subtotals))
+
+    assert len({row[GROUPING_COLUMN] for row in rows}) == len(builder.grouping_sets)
+    for grouping_set in builder.grouping_sets:
+        group = [row for row in rows if row[GROUPING_COLUMN] == grouping_mask(dimensions, grouping_set)]
+        # As dimensões fora do conjunto vêm nulas nas linhas de subtotal.
+        assert all(row[name] is None for row in group for name in dimensions if name not in grouping_set)
+        columns = list(grouping_set) + [metric["alias"] for metric in METRICS]
+        subtotal_rows = [{name: row[name] for name in columns} for row in group]
+        _, expected = _records(backend, _query(list(grouping_set)))
+        assert _sorted(subtotal_rows) == _sorted(expected)
+
+
+def test_rollup_sets_go_from_detail_to_grand_total():
+    builder = QueryBuilder(_query(["store_name", "channel_name", "sale_date"], subtotals={"mode": "rollup"}))
+    builder.build()
+    assert builder.grouping_sets == [
+        ("store_name", "channel_name", "sale_date"), ("store_name", "channel_name"), ("store_name",), (),
+    ]
+    assert grouping_mask(["store_name", "channel_name", "sale_date"], ("store_name",)) == 0b011
+
+
+@pytest.mark.parametrize("dimensions, overrides, message", [
+    (["store_name"], {"subtotals": {"mode": "rollup"}, "page_size": 10}, "page_size"),
+    ([], {"subtotals": {"mode": "cube"}}, "at least one dimension"),
+    (["store_name"], {"subtotals": {"mode": "grouping_sets"}}, "list of grouping sets"),
+    (["store_name"], {"subtotals": {"mode": "grouping_sets", "grouping_sets": [["channel_name"]]}}, "outside"),
+    (["store_name", "channel_name"], {"subtotals": {"mode": "grouping_sets", "grouping_sets": [["store_name"]]}}, "missing"),
+    (["product_name", "store_name"], {"subtotals": {"mode": "rollup"}}, "product_name"),
+])
+def test_invalid_subtotals_are_rejected(dimensions, overrides, message):
+    with pytest.raises(InvalidQuery, match=message):
+        QueryBuilder(_query(dimensions, **overrides)).build()
@@ -6,11 +6,20 @@ const translateHeader = (header: string) => {
   return FRIENDLY_NAMES[header] || header;
 };
 
+export type DataTablePagination = {
+  page: number;
+  hasNextPage: boolean;
+  isFetching: boolean;
+  onPageChange: (page: number) => void;
+};
+
 type DataTableProps = {
   data: any[];
+  // Com paginação, `data` é só a página atual e a tabela pede as outras.
+  pagination?: DataTablePagination;
 };
 
-export function DataTable({ data }: DataTableProps) {
+export function DataTable({ data, pagination }: DataTableProps) {
   if (!data || data.length === 0) {
     return <p>Nenhum dado para exibir.</p>;
   }
@@ -41,6 +50,25 @@ export function DataTable({ data }: DataTableProps) {
           ))}
         </tbody>
       </table>
+      {pagination && (
+        <div className={styles.pagination}>
+          <button
+            className={styles.pageButton}
+            onClick={() => pagination.onPageChange(pagination.page - 1)}
+            disabled={pagination.page === 0 || pagination.isFetching}
+          >
+            Anterior
+          </button>
+          <span className={styles.pageInfo}>Página {pagination.page + 1}</span>
+          <button
+            className={styles.pageButton}
+            onClick={() => pagination.onPageChange(pagination.page + 1)}
+            disabled={!pagination.hasNextPage || pagination.isFetching}
+          >
+            Próxima
+          </button>
+        </div>
+      )}
     </div>
   );
 }
\ No newline at end of file
@@ -1,4 +1,5 @@
-import { useQuery } from '@tanstack/react-query';
+import { useState } from 'react';
+import { useQuery, keepPreviousData } from '@tanstack/react-query';
 import {
   type Filter,
   FilterOperator,
@@ -6,7 +7,8 @@ import {
   fetchChannelOptions,
   fetchStatusOptions,
   fetchStoreOptions,
-  fetchProductOptions,
+  fetchPaymentTypeOptions,
+  searchOptions,
   type SelectOption,
 } from '../services/api';
 import styles from './FilterPanel.module.css'; 
@@ -32,7 +34,7 @@ export function FilterValueInput({ filter, onChange }: FilterValueInputProps) {
     DimensionField.CHANNEL_NAME,
     DimensionField.SALE_STATUS,
     DimensionField.STORE_NAME,
-    DimensionField.PRODUCT_NAME,
+    DimensionField.PAYMENT_TYPE,
   ];
 
   const operatorsForDropdown = [
@@ -50,8 +52,8 @@ export function FilterValueInput({ filter, onChange }: FilterValueInputProps) {
           return fetchStatusOptions();
         case DimensionField.STORE_NAME:
           return fetchStoreOptions();
-        case DimensionField.PRODUCT_NAME:
-          return fetchProductOptions();
+        case DimensionField.PAYMENT_TYPE:
+          return fetchPaymentTypeOptions();
         default:
           return Promise.resolve(null);
       }
@@ -62,6 +64,19 @@ export function FilterValueInput({ filter, onChange }: FilterValueInputProps) {
     staleTime: 1000 * 60 * 10,
   });
 
+  // Produtos podem ser milhares: em vez da lista inteira, busca por nome.
+  const [searchTerm, setSearchTerm] = useState('');
+  const usesSearch =
+    filter.field === DimensionField.PRODUCT_NAME &&
+    (operatorsForDropdown as string[]).includes(filter.operator);
+
+  const { data: searchResult, isFetching: isSearching } = useQuery({
+    queryKey: ['optionSearch', 'products', searchTerm],
+    queryFn: () => searchOptions('products', searchTerm),
+    enabled: usesSearch,
+    staleTime: 1000 * 60,
+    placeholderData: keepPreviousData,
+  });
 
   if (filter.field === DimensionField.DAY_OF_WEEK) {
     return (
@@ -80,6 +95,32 @@ export function FilterValueInput({ filter, onChange }: FilterValueInputProps) {
     );
   }
 
+  if (usesSearch) {
+    return (
+      <>
+        <input
+          type="search"
+          className={styles.valueInput}
+          value={searchTerm}
+          placeholder="Buscar produto..."
+          onChange={(e) => setSearchTerm(e.target.value)}
+        />
+        <select
+          className={styles.selectInput}
+          value={filter.value}
+          onChange={(e) => onChange(e.target.value)}
+        >
+          <option value="">{isSearching ? 'Buscando...' : 'Selecione...'}</option>
+          {searchResult?.data.map((opt) => (
+            <option key={opt.id} value={opt.id}>
+              {opt.name}
+            </option>
+          ))}
+        </select>
+      </>
+    );
+  }
+
   if (filter.field === DimensionField.HOUR_OF_DAY) {
     return (
       <input
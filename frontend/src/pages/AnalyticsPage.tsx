@@ -1,5 +1,5 @@
 import { useState } from 'react';
-import { useQuery } from '@tanstack/react-query';
+import { useQuery, keepPreviousData } from '@tanstack/react-query';
 import { ThemeToggle } from '../components/ThemeToggle';
 import {
   type AnalyticsQuery,
@@ -94,6 +94,9 @@ const KPI_QUERY: AnalyticsQuery = {
   dimensions: [],
 };
 
+// A tabela busca uma página por vez (paginação por cursor em /api/query).
+const TABLE_PAGE_SIZE = 50;
+
 const createTimeRange = (dateRange: DateRange): TimeRangeFilter | undefined => {
   if (!dateRange.startDate || !dateRange.endDate) {
     return undefined;
@@ -114,6 +117,12 @@ export function AnalyticsPage() {
   const [orderBy, setOrderBy] = useState<OrderBy | undefined>(undefined);
   const [limit, setLimit] = useState<number | undefined>(100);
 
+  // Consulta da última análise executada e cursores das páginas da tabela:
+  // pageCursors[n] é o cursor que leva à página n (a primeira não tem).
+  const [tableQuery, setTableQuery] = useState<AnalyticsQuery | null>(null);
+  const [tablePage, setTablePage] = useState(0);
+  const [pageCursors, setPageCursors] = useState<(string | undefined)[]>([undefined]);
+
   const getMetricsForQuery = (): Metric[] => {
     return selectedMetrics.map(opt => {
       const fullOption = METRIC_OPTIONS.find(m => m.id === opt.id);
@@ -142,6 +151,16 @@ export function AnalyticsPage() {
 
   const orderByOptions = getOrderByOptions();
   const timeRangeFilter = createTimeRange(dateRange);
+
+  const buildAnalysisQuery = (): AnalyticsQuery => ({
+    metrics: getMetricsForQuery(),
+    dimensions: getDimensionsForQuery(),
+    filters: filters,
+    time_range: timeRangeFilter,
+    order_by: orderBy,
+    limit: limit,
+  });
+
   const { 
     data: kpiApiData, 
     isLoading: kpiIsLoading, 
@@ -164,24 +183,33 @@ export function AnalyticsPage() {
     refetch: refetchAnalysis,
   } = useQuery({
     queryKey: ['analytics', selectedMetrics, selectedDimensions, filters, timeRangeFilter, orderBy, limit],
-    queryFn: () => {
-      const query: AnalyticsQuery = {
-        metrics: getMetricsForQuery(),
-        dimensions: getDimensionsForQuery(),
-        filters: filters,
-        time_range: timeRangeFilter,
-        order_by: orderBy,
-        limit: limit,
-      };
-      return fetchAnalyticsData(query);
-    },
+    queryFn: () => fetchAnalyticsData(buildAnalysisQuery()),
     enabled: false,
     staleTime: 1000 * 30,
   });
 
+  const {
+    data: tablePageData,
+    isFetching: tableIsFetching,
+  } = useQuery({
+    queryKey: ['analytics-page', tableQuery, pageCursors[tablePage]],
+    queryFn: () => fetchAnalyticsData({
+      ...tableQuery!,
+      limit: undefined,
+      page_size: TABLE_PAGE_SIZE,
+      cursor: pageCursors[tablePage],
+    }),
+    enabled: tableQuery !== null,
+    placeholderData: keepPreviousData,
+    staleTime: 1000 * 30,
+  });
+
   const handleRunQuery = () => {
     if (selectedMetrics.length > 0 && selectedDimensions.length > 0) {
       refetchAnalysis();
+      setTableQuery(buildAnalysisQuery());
+      setTablePage(0);
+      setPageCursors([undefined]);
     } else {
       alert('Por favor, selecione pelo menos uma métrica e uma dimensão.');
     }
@@ -191,6 +219,24 @@ export function AnalyticsPage() {
   const chartDimensions = getDimensionsForQuery();
   const csvData = analysisApiData?.data || [];
   
+  // O limite vale para a tabela também: a última página é cortada nele.
+  const tableOffset = tablePage * TABLE_PAGE_SIZE;
+  const tableLimit = tableQuery?.limit;
+  const tableRows = (tablePageData?.data || []).slice(
+    0,
+    tableLimit ? Math.max(tableLimit - tableOffset, 0) : undefined,
+  );
+  const tableNextCursor = tablePageData?.next_cursor;
+  const tableHasNextPage = !!tableNextCursor
+    && (!tableLimit || tableOffset + TABLE_PAGE_SIZE < tableLimit);
+
+  const handleTablePageChange = (page: number) => {
+    if (page > tablePage) {
+      setPageCursors((cursors) => [...cursors.slice(0, tablePage + 1), tableNextCursor ?? undefined]);
+    }
+    setTablePage(page);
+  };
+
   const csvFilename = `relatorio_${selectedDimensions.map(d => d.name).join('_')}_por_${selectedMetrics.map(m => m.name).join('_')}.csv`
 
   return (
@@ -333,7 +379,15 @@ export function AnalyticsPage() {
               dimensions={chartDimensions}
               chartType={chartType}
             />
-            <DataTable data={csvData} />
+            <DataTable
+              data={tableRows}
+              pagination={{
+                page: tablePage,
+                hasNextPage: tableHasNextPage,
+                isFetching: tableIsFetching,
+                onPageChange: handleTablePageChange,
+              }}
+            />
           </div>
         )}
         {!csvData.length && !analysisIsLoading && !analysisIsError && (
@@ -34,6 +34,14 @@ export interface Filter {
 export interface OrderBy {
   field: string; direction: SortDirection;
 }
+export const SubtotalMode = {
+  ROLLUP: "rollup", CUBE: "cube", GROUPING_SETS: "grouping_sets",
+} as const;
+export type SubtotalMode = typeof SubtotalMode[keyof typeof SubtotalMode];
+
+export interface Subtotals {
+  mode: SubtotalMode; grouping_sets?: DimensionField[][];
+}
 export interface TimeRangeFilter {
   start_date: string; end_date: string;
 }
@@ -41,9 +49,22 @@ export interface AnalyticsQuery {
   metrics: Metric[]; dimensions: DimensionField[];
   filters?: Filter[]; time_range?: TimeRangeFilter;
   order_by?: OrderBy; limit?: number;
+  page_size?: number; cursor?: string;
+  subtotals?: Subtotals;
+  approximate?: boolean;
+}
+export interface Approximation {
+  method: 'sample' | 'rollup' | 'exact' | 'hyperloglog';
+  sampling?: string;
+  sample_percent?: number;
+  confidence?: number;
+  // Métricas que saem da amostra sem correção, só como limite inferior.
+  lower_bounds?: string[];
 }
 export interface ApiResponse {
   data: any[];
+  next_cursor?: string | null;
+  approximation?: Approximation;
 }
 
 const apiClient = axios.create({
@@ -56,20 +77,58 @@ export type SelectOption = {
   name: string;
 };
 
-const fetchSimpleOptions = async (endpoint: string): Promise<SelectOption[]> => {
-  const { data } = await apiClient.get(endpoint);
-  return data.data.map((item: string) => ({ id: item, name: item }));
-};
+export interface OptionsCatalog {
+  channels: string[];
+  stores: SelectOption[];
+  products: SelectOption[];
+  payment_types: string[];
+  sale_status: string[];
+}
+
+// Todas as listas de opções vêm de uma única requisição a /options,
+// compartilhada pelos filtros; o navegador revalida pelo ETag.
+let optionsCatalogRequest: Promise<OptionsCatalog> | null = null;
 
-const fetchObjectOptions = async (endpoint: string): Promise<SelectOption[]> => {
-  const { data } = await apiClient.get(endpoint);
-  return data.data;
+export const fetchOptionsCatalog = (): Promise<OptionsCatalog> => {
+  if (!optionsCatalogRequest) {
+    optionsCatalogRequest = apiClient.get('/options')
+      .then(({ data }) => data.data)
+      .catch((error) => {
+        optionsCatalogRequest = null;
+        throw error;
+      });
+  }
+  return optionsCatalogRequest;
 };
 
-export const fetchChannelOptions = () => fetchSimpleOptions('/options/channels');
-export const fetchStatusOptions = () => fetchSimpleOptions('/options/sale_status');
-export const fetchStoreOptions = () => fetchObjectOptions('/options/stores');
-export const fetchProductOptions = () => fetchObjectOptions('/options/products');
+const toSimpleOptions = (items: string[]): SelectOption[] =>
+  items.map((item) => ({ id: item, name: item }));
+
+export const fetchChannelOptions = async () => toSimpleOptions((await fetchOptionsCatalog()).channels);
+export const fetchStatusOptions = async () => toSimpleOptions((await fetchOptionsCatalog()).sale_status);
+export const fetchPaymentTypeOptions = async () => toSimpleOptions((await fetchOptionsCatalog()).payment_types);
+export const fetchStoreOptions = async () => (await fetchOptionsCatalog()).stores;
+export const fetchProductOptions = async () => (await fetchOptionsCatalog()).products;
+
+export type SearchableDimension = 'products' | 'stores' | 'customers';
+
+export interface SearchResult {
+  data: SelectOption[];
+  has_more: boolean;
+}
+
+// Busca incremental para listas grandes: só a página pedida trafega.
+export const searchOptions = async (
+  dimension: SearchableDimension,
+  q: string,
+  limit = 20,
+  offset = 0,
+): Promise<SearchResult> => {
+  const { data } = await apiClient.get(`/options/${dimension}/search`, {
+    params: { q, limit, offset },
+  });
+  return data;
+};
 
 export const fetchAnalyticsData = async (query: AnalyticsQuery): Promise<ApiResponse> => {
   const { data } = await apiClient.post('/query', query);